@@ -21,21 +21,43 @@ import io
 import sys
 import logging
 import threading
-import queue
 import time
 from datetime import datetime
 import uuid
 import re
+from urllib.parse import quote
 
 # 导入爬虫模块
 try:
     # 当从src目录直接运行时
     import market_data_crawler
     import config
+    import series_arrays
+    import series_store
+    import workbook_etag
+    import snapshots
+    import archive
+    import shards
+    import log_bus
+    import scheduler
+    import lane_queue
+    import cancellation
+    import checkpoints
 except ImportError:
     # 当从项目根目录运行时
     from src import market_data_crawler
     from src import config
+    from src import series_arrays
+    from src import series_store
+    from src import workbook_etag
+    from src import snapshots
+    from src import archive
+    from src import shards
+    from src import log_bus
+    from src import scheduler
+    from src import lane_queue
+    from src import cancellation
+    from src import checkpoints
 
 app = Flask(__name__, static_folder='../static', static_url_path='')
 
@@ -59,20 +81,33 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
-# 创建一个队列用于存储日志消息（SSE 实时日志）
-log_queue = queue.Queue()
-
 # 全局运行状态（用于 /api/status 兼容）
 data_updated = False
 crawl_results = None
 crawler_running = False
 
-# 简单任务队列与任务表（仅在单进程/开发模式下使用）
-job_queue = queue.Queue()
+# 按通道划分优先级的任务队列与任务表（仅在单进程/开发模式下使用）
+job_queue = lane_queue.LaneQueue(config.JOB_LANES, config.JOB_AGING_SECONDS)
 jobs_lock = threading.RLock()
 jobs = {}
-current_job_id = None
-job_log_buffers = {}  # {job_id: [log_entry, ...]}
+# 各未结束任务的取消令牌 {job_id: CancelToken}（不放入任务表，任务表会序列化返回给前端）
+job_tokens = {}
+# 当前线程正在执行的任务（多个 worker 并发执行任务时用于日志归属）
+_job_context = threading.local()
+
+
+def current_job_id():
+    """
+    当前日志所属的任务：执行任务的 worker 线程返回其任务；
+    任务内部的其他线程（如并行写入分片）在只有一个任务运行时归属该任务
+    """
+    jid = getattr(_job_context, 'job_id', None)
+    if jid:
+        return jid
+    running = job_queue.running()
+    if len(running) == 1:
+        return next(iter(running))
+    return None
 
 # 全局日志序号（用于前端精确去重）
 _log_seq = 0
@@ -84,11 +119,11 @@ def next_log_seq() -> int:
         _log_seq += 1
         return _log_seq
 
-# 自定义日志处理器，将日志放入队列
+# 自定义日志处理器，将日志推送到日志总线
 class QueueHandler(logging.Handler):
-    def __init__(self, log_queue):
+    def __init__(self, bus):
         super().__init__()
-        self.log_queue = log_queue
+        self.bus = bus
 
     def emit(self, record):
         try:
@@ -100,7 +135,7 @@ class QueueHandler(logging.Handler):
                 return
             # 绑定当前 job_id（若有）
             try:
-                jid = current_job_id
+                jid = current_job_id()
             except Exception:
                 jid = None
 
@@ -112,14 +147,8 @@ class QueueHandler(logging.Handler):
                 'seq': next_log_seq(),
             }
 
-            # 全局日志队列（兼容）
-            self.log_queue.put(log_entry)
-
-            # 写入该任务的专属日志缓冲区
-            if jid:
-                with jobs_lock:
-                    buf = job_log_buffers.setdefault(jid, [])
-                    buf.append(log_entry)
+            # 推送到全局流与该任务的专属日志流，立即唤醒订阅者
+            self.bus.publish(log_entry, jid)
         except Exception:
             self.handleError(record)
 
@@ -134,7 +163,7 @@ def setup_logging():
     root_logger.setLevel(logging.DEBUG)
 
     # 添加队列处理器
-    queue_handler = QueueHandler(log_queue)
+    queue_handler = QueueHandler(log_bus.shared_bus)
     queue_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%H:%M:%S'))
     root_logger.addHandler(queue_handler)
 
@@ -154,34 +183,50 @@ logger = logging.getLogger(__name__)
 
 def execute_crawl_job(job_id: str):
     """在队列worker线程中串行执行的任务。"""
-    global data_updated, crawl_results, crawler_running, current_job_id
+    global data_updated, crawl_results
 
     with jobs_lock:
         job = jobs.get(job_id)
         if job:
-            job["status"] = "running"
+            # 取出后、开始前收到的取消请求保持 cancelling，由取消令牌在第一个安全点结束任务
+            if job["status"] != "cancelling":
+                job["status"] = "running"
             job["started_at"] = time.time()
-    current_job_id = job_id
-
-    # 清空日志队列，确保前端只看到本任务的日志
-    while not log_queue.empty():
+        force = bool(job and job.get("force"))
+        sources = job.get("sources") if job else None
+        retry_of = job.get("retry_of") if job else None
+        resume = bool(job and job.get("preemptions"))
+        token = job_tokens.get(job_id) or cancellation.CancelToken()
+    if resume:
+        # 被抢占后重新执行：从本任务自己的检查点继续，已完成的数据源不再爬取
+        # （检查点日志在开始时继承了 retry_of 任务的结果，因此重试任务同样适用）
         try:
-            log_queue.get_nowait()
-        except Exception:
-            break
+            if checkpoints.get_journal().sources(job_id) is not None:
+                retry_of = job_id
+        except Exception as e:
+            logger.warning(f"读取检查点失败，被抢占的任务将重新爬取全部数据源: {str(e)}")
+    _job_context.job_id = job_id
+    preempted = False
 
-    # 运行状态置为 True
-    crawler_running = True
-    data_updated = False
-    crawl_results = None
+    # 换新全局日志流，确保前端只看到本任务的日志
+    log_bus.shared_bus.start_job(job_id)
 
     logger.info(f"开始市场数据爬取... (job_id={job_id})")
 
     try:
         analyzer = market_data_crawler.MarketDataAnalyzer()
+        # 取消时立即关闭 WebDriver，正在进行的页面请求随之中断
+        analyzer.cancel_token = token
+        # 检查点日志按任务编号记录，失败后可通过 retry_failed=<job_id> 只重试失败的数据源
+        analyzer.job_id = job_id
+        token.add_callback(analyzer.close_driver)
+        if force:
+            # 强制更新：忽略数据源缓存，全部重新爬取
+            analyzer.use_source_cache = False
         try:
-            results = analyzer.update_excel()
-            crawl_results = results
+            # 部分更新时只爬取并写入所选数据源
+            partial = sources and len(sources) < len(market_data_crawler.all_sources())
+            results = analyzer.update_excel(sources=sources if partial else None, retry_failed=retry_of)
 
             # 如果 update_excel 显式返回 False，认为任务失败
             if results is False:
@@ -193,23 +238,38 @@ def execute_crawl_job(job_id: str):
                 raise Exception("Excel 更新失败")
 
             # 粗略判断是否更新：扫描日志关键字
-            log_list = list(log_queue.queue)
+            updated = False
+            log_list = log_bus.shared_bus.snapshot(job_id)
             for log_item in log_list:
                 if ("已更新以下工作表" in log_item['message']) or ("已在第" in log_item['message'] and "行插入新数据" in log_item['message']):
-                    data_updated = True
+                    updated = True
                     break
 
-            if data_updated:
+            if updated:
                 logger.info("检测到数据更新，Excel文件已更新")
             else:
                 logger.info("所有数据均已是最新，无需更新Excel")
 
             # 不在此处标记 completed，等待最终日志与结束消息写入后再完成
+            # 兼容的全局状态只在任务结束时整体赋值，不在任务开始时清空（避免与其他任务交错）
             with jobs_lock:
                 job = jobs.get(job_id)
                 if job:
-                    job["updated"] = data_updated
-
+                    job["updated"] = updated
+                data_updated = updated
+                crawl_results = results
+
+        except cancellation.JobCancelled as e:
+            if e.reason == cancellation.REASON_PREEMPTED:
+                preempted = True
+                logger.info("⏸️ 任务被更高优先级的任务抢占，稍后从检查点继续执行（只爬取尚未完成的数据源）")
+            else:
+                logger.info("⛔ 任务已按请求取消")
+                with jobs_lock:
+                    job = jobs.get(job_id)
+                    if job:
+                        job["status"] = "cancelled"
+                        job["finished_at"] = time.time()
         except Exception as e:
             logger.error(f"更新过程出错: {str(e)}")
             with jobs_lock:
@@ -219,6 +279,10 @@ def execute_crawl_job(job_id: str):
                     job["finished_at"] = time.time()
                     job["error"] = str(e)
         finally:
+            # 存储在写入 Excel 之前提交，Excel 写入失败或任务被取消时也要刷新发生变化的时间序列数组
+            changed_sheets = [name for name, delta in getattr(analyzer, 'store_deltas', {}).items() if delta]
+            if changed_sheets:
+                series_arrays.shared_cache.refresh(changed_sheets)
             try:
                 analyzer.close_driver()
             except Exception:
@@ -232,50 +296,91 @@ def execute_crawl_job(job_id: str):
                 job["finished_at"] = time.time()
                 job["error"] = str(e)
     finally:
-        # 等待日志全部写入队列
-        time.sleep(1)
-        crawler_running = False
-        # 追加结束消息到该 job 的缓冲与全局队列，确保前端能接收到
-        end_msgs = []
-        end_msgs.append({
-            "level": "INFO",
-            "message": "=== 数据更新完成 ===",
-            "timestamp": datetime.now().strftime('%H:%M:%S'),
-            "job_id": job_id,
-            "seq": next_log_seq(),
-        })
-        end_msgs.append({
+        _job_context.job_id = None
+        if preempted:
+            requeue_preempted_job(job_id)
+        else:
+            publish_end_messages(job_id)
+            logger.info("数据爬取完成")
+            with jobs_lock:
+                job = jobs.get(job_id)
+                if job:
+                    if job.get("status") not in ("failed", "cancelled"):
+                        job["status"] = "completed"
+                    job["finished_at"] = time.time()
+                job_tokens.pop(job_id, None)
+            # 显式完成事件：订阅者读完剩余日志后结束流
+            log_bus.shared_bus.close(job_id)
+            evict_finished_jobs()
+
+
+def publish_end_messages(job_id):
+    """追加结束消息到该 job 的日志流与全局流，确保前端能接收到"""
+    for message in ("=== 数据更新完成 ===", "SHOW_SUMMARY"):
+        log_bus.shared_bus.publish({
             "level": "INFO",
-            "message": "SHOW_SUMMARY",
+            "message": message,
             "timestamp": datetime.now().strftime('%H:%M:%S'),
             "job_id": job_id,
             "seq": next_log_seq(),
-        })
-        with jobs_lock:
-            buf = job_log_buffers.setdefault(job_id, [])
-            buf.extend(end_msgs)
-        for m in end_msgs:
-            log_queue.put(m)
-
-        logger.info("数据爬取完成")
-        # 再等待片刻，确保SSE已发送结束消息
-        time.sleep(0.5)
-        with jobs_lock:
-            job = jobs.get(job_id)
-            if job:
-                job["status"] = "completed" if job.get("status") != "failed" else job["status"]
-                job["finished_at"] = time.time()
-        current_job_id = None
+        }, job_id)
+
+
+def requeue_preempted_job(job_id):
+    """被抢占的任务换新取消令牌后重新入队（日志流保持打开）；抢占期间收到取消请求时直接结束"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        if job.get("cancel_requested"):
+            job["status"] = "cancelled"
+            job["finished_at"] = time.time()
+            job_tokens.pop(job_id, None)
+        else:
+            job["status"] = "queued"
+            job["preemptions"] = job.get("preemptions", 0) + 1
+            job["enqueued_at"] = time.time()
+            job_tokens[job_id] = cancellation.CancelToken()
+    if job["status"] == "cancelled":
+        publish_end_messages(job_id)
+        log_bus.shared_bus.close(job_id)
+        evict_finished_jobs()
+        return
+    log_bus.shared_bus.suspend(job_id)
+    # 重新计算老化时间，避免刚被抢占的任务立即再次被取出
+    job_queue.put(job_id, job["lane"], job["enqueued_at"])
+
+
+# 已结束的任务状态
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def evict_finished_jobs():
+    """已结束的任务超过 JOB_HISTORY_LIMIT 时，按最近访问时间淘汰最旧的任务（日志与记录写入溢出文件）"""
+    with jobs_lock:
+        finished = [j for j in jobs.values() if j['status'] in FINISHED_STATUSES]
+        excess = len(finished) - config.JOB_HISTORY_LIMIT
+        if excess <= 0:
+            return
+        finished.sort(key=lambda j: j.get('accessed_at') or j.get('finished_at') or 0)
+        victims = finished[:excess]
+        for job in victims:
+            jobs.pop(job['id'], None)
+    for job in victims:
+        log_bus.shared_bus.evict(job['id'], job)
 
 
 def queue_worker():
-    """单实例队列worker，保证一次只执行一个任务。"""
+    """队列worker：按通道优先级取任务执行（各通道的并发数由 JOB_LANES 限制）。"""
+    global crawler_running
     while True:
         job_id = job_queue.get()  # 阻塞等待
+        crawler_running = True
         try:
             execute_crawl_job(job_id)
         finally:
-            job_queue.task_done()
+            job_queue.task_done(job_id)
+            crawler_running = bool(job_queue.running())
 
 # 模块导入即启动队列 worker（在开发模式/Flask 内置服务器下也生效）
 try:
@@ -284,36 +389,253 @@ except NameError:
     _worker_started = False
 
 if not _worker_started:
-    worker = threading.Thread(target=queue_worker, daemon=True)
-    worker.start()
+    for _ in range(max(1, config.JOB_WORKERS)):
+        worker = threading.Thread(target=queue_worker, daemon=True)
+        worker.start()
     _worker_started = True
-    logging.getLogger(__name__).info("任务队列Worker已启动")
+    logging.getLogger(__name__).info(f"任务队列Worker已启动（{max(1, config.JOB_WORKERS)} 个）")
+
+def find_coalescable_job(sources):
+    """
+    查找可以合并的任务（调用方持有 jobs_lock）：
+    覆盖所请求数据源的排队中或运行中任务；其次是在新鲜度窗口内成功完成的任务。
+    已完成的任务只有在检查点显示所请求的每个数据源都成功时才会被复用，
+    部分数据源失败的任务不会让后续请求拿到过期数据。
+
+    Returns:
+        dict 或 None
+    """
+    wanted = set(sources)
+    covering = [j for j in jobs.values() if wanted <= set(j.get('sources') or ())]
+
+    active = [j for j in covering if j['status'] in ('queued', 'running')]
+    if active:
+        # 优先加入运行中的任务，其次是最早入队的任务
+        return min(active, key=lambda j: (j['status'] != 'running', j['enqueued_at']))
+
+    if config.UPDATE_FRESHNESS_SECONDS:
+        horizon = time.time() - config.UPDATE_FRESHNESS_SECONDS
+        fresh = [
+            j for j in covering
+            if j['status'] == 'completed' and (j.get('finished_at') or 0) >= horizon
+            and _all_succeeded(j['id'], wanted)
+        ]
+        if fresh:
+            return max(fresh, key=lambda j: j['finished_at'])
+    return None
+
+
+def _all_succeeded(job_id, sources):
+    """检查点中 sources 是否全部成功（检查点缺失或读取失败时视为未成功）"""
+    try:
+        succeeded = checkpoints.get_journal().succeeded(job_id)
+    except Exception as e:
+        logger.warning(f"读取检查点失败，不复用任务 {job_id} 的结果: {str(e)}")
+        return False
+    return succeeded is not None and set(sources) <= succeeded
 
-# API路由
-@app.route('/api/update', methods=['GET'])
-def update_data():
-    """创建一个新任务并入队，返回 job_id 与队列位置。"""
-    global jobs
 
+def queue_position(job_id):
+    """排队中任务按实际调度顺序（通道优先级与老化）的位置"""
+    running = 1 if job_queue.running() else 0
+    for idx, (queued_id, _, _) in enumerate(job_queue.order(), start=1):
+        if queued_id == job_id:
+            return running + idx
+    return None
+
+
+def submit_update(sources, force=False, origin='manual', lane=None, retry_of=None):
+    """
+    提交更新任务：合并模式下（UPDATE_COALESCE）已有覆盖相同数据源的排队中/运行中任务，
+    或新鲜度窗口内刚成功完成的任务时直接返回该任务，否则创建新任务并入队。
+
+    Args:
+        sources: 数据源名列表（已解析）
+        force: 总是新建任务，并忽略数据源缓存重新爬取
+        origin: 任务来源（manual 手动请求 / scheduled 定时调度）
+        lane: 队列通道（interactive / scheduled / backfill），默认手动请求为 interactive、定时调度为 scheduled
+        retry_of: 重试该任务：只重新爬取其失败或未完成的数据源（sources），与其已成功的结果合并后写入；总是新建任务
+
+    Returns:
+        tuple: (任务, 是否合并到已有任务)
+    """
     with jobs_lock:
+        existing = None
+        if config.UPDATE_COALESCE and not force and not retry_of:
+            existing = find_coalescable_job(sources)
+        if existing is not None:
+            existing['coalesced'] = existing.get('coalesced', 0) + 1
+            logger.info(f"🔗 更新请求已合并到任务 {existing['id']}（{existing['status']}）")
+            return existing, True
+
         job_id = uuid.uuid4().hex
-        # 队列位置 = 当前队列长度 + （若当前有运行任务则+1，否则0）
-        position = job_queue.qsize() + (1 if crawler_running else 0) + 1  # 包含本任务
-        jobs[job_id] = {
+        job = {
             'id': job_id,
             'status': 'queued',
             'enqueued_at': time.time(),
+            'sources': sources,
+            'force': force,
+            'origin': origin,
+            'lane': lane or (lane_queue.LANE_SCHEDULED if origin == 'scheduled' else lane_queue.LANE_INTERACTIVE),
         }
+        if retry_of:
+            job['retry_of'] = retry_of
+        jobs[job_id] = job
+        job_tokens[job_id] = cancellation.CancelToken()
+
+    job_queue.put(job_id, job['lane'], job['enqueued_at'])
+    preempt_for(job)
+    return job, False
+
+
+def preempt_for(job):
+    """
+    新任务因 worker 已满而无法开始时，抢占一个优先级更低、可被抢占（JOB_LANES 的 preemptible）的运行中任务：
+    设置其取消令牌，该任务在下一个安全点退出并重新排队，让出的 worker 随即取出新任务。
+
+    Returns:
+        被抢占的任务 id，未抢占时返回 None
+    """
+    lanes = config.JOB_LANES
+    running = job_queue.running()
+    if len(running) < max(1, config.JOB_WORKERS):
+        return None
+    # 新任务所在通道已达并发上限时，抢占也无法让它开始
+    if sum(1 for lane in running.values() if lane == job['lane']) >= lanes[job['lane']]['max_running']:
+        return None
+    with jobs_lock:
+        candidates = [
+            jid for jid, lane in running.items()
+            if lanes[lane].get('preemptible')
+            and lanes[lane]['priority'] > lanes[job['lane']]['priority']
+            and jid in jobs and jobs[jid]['status'] == 'running'
+            and jobs[jid].get('preemptions', 0) < config.JOB_MAX_PREEMPTIONS
+        ]
+        if not candidates:
+            return None
+        # 优先抢占优先级最低、其次最晚开始（已完成工作最少）的任务
+        victim = max(candidates, key=lambda jid: (lanes[running[jid]]['priority'], jobs[jid].get('started_at') or 0))
+        token = job_tokens.get(victim)
+    if token is None or not token.cancel(cancellation.REASON_PREEMPTED):
+        return None
+    logger.info(f"⏸️ 任务 {job['id']}（{job['lane']}）抢占了运行中的任务 {victim}（{running[victim]}）")
+    return victim
+
+
+def submit_scheduled_update(sources):
+    """定时调度器的回调：为到期的数据源提交部分更新任务"""
+    job, coalesced = submit_update(market_data_crawler.resolve_sources(sources), origin='scheduled')
+    if not coalesced:
+        logger.info(f"⏰ 已提交定时更新任务 {job['id']}: {', '.join(job['sources'])}")
+    return job
+
+
+# 启用时在队列 worker 旁启动定时调度器（多进程部署时由文件锁保证只有一个进程调度）
+try:
+    _scheduler_started
+except NameError:
+    _scheduler_started = False
 
-    job_queue.put(job_id)
+if config.SCHEDULER_ENABLED and not _scheduler_started:
+    source_scheduler = scheduler.Scheduler(config.SOURCE_SCHEDULES, submit_scheduled_update)
+    source_scheduler.start()
+    _scheduler_started = True
 
+# API路由
+@app.route('/api/update', methods=['GET'])
+def update_data():
+    """
+    创建一个新任务并入队，返回 job_id 与队列位置。
+
+    合并模式下（UPDATE_COALESCE），已有覆盖相同数据源的排队中/运行中任务时直接返回该任务；
+    新鲜度窗口内刚成功完成的任务直接返回其结果。force=1 时总是新建任务，并忽略数据源缓存重新爬取。
+    sources 为逗号分隔的数据源名或分组（currency/daily/monthly），只更新这些数据源。
+    lane 指定队列通道（默认 interactive；大批量补数可使用 backfill）。
+    retry_failed=<job_id> 只重新爬取该任务失败或未完成的数据源，与其已成功的结果（检查点）合并后写入。
+    """
+    retry_of = request.args.get('retry_failed')
+    try:
+        if retry_of:
+            with jobs_lock:
+                previous = jobs.get(retry_of)
+                if previous and previous['status'] not in FINISHED_STATUSES:
+                    return jsonify({'status': 'error', 'message': '该任务尚未结束，无法重试'}), 409
+            _, sources, _ = checkpoints.get_journal().retry_plan(retry_of)
+        else:
+            sources = market_data_crawler.resolve_sources(request.args.get('sources'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    force = request.args.get('force') in ('1', 'true')
+    lane = request.args.get('lane') or lane_queue.LANE_INTERACTIVE
+    if lane not in config.JOB_LANES:
+        return jsonify({'status': 'error', 'message': f"未知的队列通道: {lane}（可用: {', '.join(config.JOB_LANES)}）"}), 400
+
+    job, coalesced = submit_update(sources, force=force, lane=lane, retry_of=retry_of)
+    with jobs_lock:
+        status = job['status']
+        position = queue_position(job['id']) if status == 'queued' else 1
+
+    if coalesced and status == 'completed':
+        return jsonify({
+            'status': 'completed',
+            'job_id': job['id'],
+            'coalesced': True,
+            'updated': job.get('updated', False),
+            'finished_at': job.get('finished_at'),
+            'message': '最近一次更新刚刚完成，直接返回其结果'
+        })
+    if coalesced:
+        return jsonify({
+            'status': status,
+            'job_id': job['id'],
+            'position': position,
+            'coalesced': True,
+            'message': '已有相同的更新任务在进行中，已加入该任务'
+        })
     return jsonify({
         'status': 'queued',
-        'job_id': job_id,
+        'job_id': job['id'],
         'position': position,
+        'sources': sources,
+        'lane': job['lane'],
         'message': '任务已入队，等待执行'
     })
 
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    取消任务：排队中的任务直接移出队列；运行中的任务设置取消令牌，
+    立即关闭其 WebDriver，并在下一个安全点（数据源之间、等待中、写入之前）退出，文件锁随之释放。
+    """
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job:
+            return jsonify({'status': 'unknown', 'message': '未找到该任务'}), 404
+        status = job['status']
+        if status in FINISHED_STATUSES:
+            return jsonify({'status': status, 'message': '任务已结束，无法取消'}), 409
+        if status == 'queued' and job_queue.remove(job_id):
+            job['status'] = 'cancelled'
+            job['finished_at'] = time.time()
+            job_tokens.pop(job_id, None)
+            token = None
+        else:
+            # 已被取出执行（或正被抢占后重新排队）：由执行线程自行退出
+            job['status'] = 'cancelling'
+            job['cancel_requested'] = True
+            token = job_tokens.get(job_id)
+
+    if token is None:
+        logger.info(f"⛔ 排队中的任务 {job_id} 已取消")
+        publish_end_messages(job_id)
+        log_bus.shared_bus.close(job_id)
+        evict_finished_jobs()
+        return jsonify({'status': 'cancelled', 'job_id': job_id, 'message': '任务已取消'})
+
+    token.cancel()
+    logger.info(f"⛔ 已请求取消运行中的任务 {job_id}")
+    return jsonify({'status': 'cancelling', 'job_id': job_id, 'message': '正在取消任务'}), 202
+
 @app.route('/api/status', methods=['GET'])
 def check_status():
     global crawler_running, data_updated
@@ -323,11 +645,14 @@ def check_status():
     if jid:
         with jobs_lock:
             job = jobs.get(jid)
-            # 计算队列位置
-            queued = [j for j in jobs.values() if j['status'] == 'queued']
-            queued_sorted = sorted(queued, key=lambda x: x['enqueued_at'])
-            position_map = {j['id']: ((1 if current_job_id else 0) + idx) for idx, j in enumerate(queued_sorted, start=1)}
+            if job:
+                job['accessed_at'] = time.time()
+            # 计算队列位置（按实际调度顺序）
+            position = queue_position(jid) if job and job['status'] == 'queued' else None
 
+        if not job:
+            # 已淘汰的任务从溢出目录读取记录
+            job = log_bus.shared_bus.load_record(jid)
         if not job:
             return jsonify({'status': 'unknown', 'message': '未找到该任务'}), 404
 
@@ -335,11 +660,15 @@ def check_status():
         if status == 'queued':
             return jsonify({
                 'status': 'queued',
-                'position': position_map.get(jid, None),
+                'position': position,
                 'message': '任务排队中'
             })
         if status == 'running':
             return jsonify({'status': 'running', 'message': '任务运行中'})
+        if status == 'cancelling':
+            return jsonify({'status': 'cancelling', 'message': '正在取消任务'})
+        if status == 'cancelled':
+            return jsonify({'status': 'cancelled', 'message': '任务已取消'})
         if status == 'completed':
             return jsonify({
                 'status': 'completed',
@@ -371,53 +700,39 @@ def get_logs():
     job_id = request.args.get('job_id')
 
     def generate_for_job(jid: str):
-        # 初次发送该任务现有的所有日志
+        # 订阅该任务的日志流：先发送已有日志，之后每条新日志写入时立即推送，任务完成事件到达后结束
         with jobs_lock:
-            buf = [entry for entry in job_log_buffers.get(jid, []) if not is_system_log(entry.get('message',''))]
-        if buf:
-            json_str = json.dumps(buf, ensure_ascii=False)
-            yield f"data: {json_str}\n\n"
-
-        last_size = len(buf)
-        finished_sent = False
-
+            job = jobs.get(jid)
+            if job:
+                job['accessed_at'] = time.time()
+        # 未知任务（且没有溢出文件可回放）直接结束流
+        stream = log_bus.shared_bus.stream(jid, create=job is not None)
+        if stream is None:
+            return
+        cursor = 0
         while True:
-            time.sleep(0.5)
-            with jobs_lock:
-                buf_now = [entry for entry in job_log_buffers.get(jid, []) if not is_system_log(entry.get('message',''))]
-                job_state = jobs.get(jid, {})
-                is_running_this_job = current_job_id == jid and crawler_running
-
-            if len(buf_now) > last_size:
-                new_logs = buf_now[last_size:]
+            new_logs, cursor, finished = log_bus.shared_bus.wait(stream, cursor)
+            if new_logs:
                 json_str = json.dumps(new_logs, ensure_ascii=False)
                 yield f"data: {json_str}\n\n"
-                last_size = len(buf_now)
-
-            # 若任务已完成，仅在同时包含 SUMMARY_END 与 EXCEL_UNLOCKED 且无新增日志时才结束流
-            if not is_running_this_job and job_state.get('status') in ('completed', 'failed'):
-                has_summary_end = any((entry.get('message') == 'SUMMARY_END') for entry in buf_now)
-                has_excel_unlocked = any((entry.get('message') == 'EXCEL_UNLOCKED') for entry in buf_now)
-                if has_summary_end and has_excel_unlocked and len(buf_now) == last_size:
-                    break
+            elif not finished:
+                # 心跳（SSE 注释行，前端忽略），用于保持连接并及时发现客户端断开
+                yield ": keep-alive\n\n"
+            if finished:
+                break
 
     def generate_global():
-        # 旧行为：推送全局日志（可能包含其他任务日志）
-        logs = [entry for entry in list(log_queue.queue) if not is_system_log(entry.get('message',''))]
-        if logs:
-            json_str = json.dumps(logs, ensure_ascii=False)
-            yield f"data: {json_str}\n\n"
-
-        last_size = len(logs)
+        # 旧行为：推送全局日志（当前或最近一次任务的日志），任务结束后发送结束消息
+        stream = log_bus.shared_bus.stream()
+        cursor = 0
         while True:
-            time.sleep(0.5)
-            current_logs = [entry for entry in list(log_queue.queue) if not is_system_log(entry.get('message',''))]
-            if len(current_logs) > last_size:
-                new_logs = current_logs[last_size:]
+            new_logs, cursor, finished = log_bus.shared_bus.wait(stream, cursor)
+            if new_logs:
                 json_str = json.dumps(new_logs, ensure_ascii=False)
                 yield f"data: {json_str}\n\n"
-                last_size = len(current_logs)
-            if not crawler_running:
+            elif not finished:
+                yield ": keep-alive\n\n"
+            if finished:
                 # 发送结束消息
                 end_message = [
                     {"level": "INFO", "message": "=== 数据更新完成 ===", "timestamp": datetime.now().strftime('%H:%M:%S')},
@@ -438,53 +753,175 @@ def get_logs():
         }
     )
 
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
 @app.route('/api/download', methods=['GET'])
 def download_excel():
+    """
+    下载 Excel 文件：带强 ETag（保存时计算），支持 If-None-Match（304）与 Range（206）。
+    优先发送指针指向的不可变快照（无需文件锁），快照不可用时回退为正式文件；
+    full=1 时发送包含归档历史的合并导出文件。
+    配置 DOWNLOAD_ACCEL_REDIRECT_PREFIX 后改为返回 X-Accel-Redirect，由 nginx 直接从磁盘发送文件。
+    """
     try:
         excel_path = config.EXCEL_OUTPUT_PATH
 
         if not os.path.exists(excel_path):
             return jsonify({'error': 'Excel文件不存在'}), 404
 
+        # 分片布局：分片有变化时先惰性组装合并文件
+        if config.SHARDED_LAYOUT:
+            shards.assemble(excel_path)
+
         # 获取文件名（不包含路径）
         filename = os.path.basename(excel_path)
-
-        return send_file(
-            excel_path,
+        snapshot = snapshots.current(excel_path)
+        if snapshot is not None:
+            file_path, etag = snapshot.path, snapshot.sha
+        else:
+            file_path, etag = excel_path, workbook_etag.get_etag(excel_path)
+
+        # full=1：包含归档历史的合并导出（按需生成并缓存）
+        if request.args.get('full') in ('1', 'true'):
+            merged = archive.merged_export(file_path)
+            if merged is not None:
+                file_path, etag = merged
+
+        accel_prefix = config.DOWNLOAD_ACCEL_REDIRECT_PREFIX
+        if accel_prefix:
+            if etag and etag in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            response = Response(mimetype=XLSX_MIMETYPE)
+            relative = os.path.relpath(file_path, os.path.dirname(excel_path)).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative)
+            response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+            response.headers['Cache-Control'] = 'no-cache'
+            if etag:
+                response.set_etag(etag)
+            return response
+
+        response = send_file(
+            file_path,
             as_attachment=True,
             download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            mimetype=XLSX_MIMETYPE,
+            etag=etag or True,
+            conditional=True,
+            max_age=0
         )
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"下载Excel文件出错: {str(e)}")
         return jsonify({'error': f'下载出错: {str(e)}'}), 500
 
+def _parse_day_arg(name):
+    """解析查询参数中的日期（YYYY-MM-DD 等格式），未提供时返回 None，格式错误抛出 ValueError"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    day = series_arrays.to_epoch_day(value)
+    if day is None:
+        raise ValueError(f"参数 {name} 不是有效日期: {value}")
+    return day
+
+@app.route('/api/series/<path:sheet>', methods=['GET'])
+def get_series(sheet):
+    """
+    时间序列查询：/api/series/<sheet>?from=&to=&columns=&points=
+    从内存中的 NumPy 数组按日期区间切片，points 指定时使用 LTTB 降采样
+    """
+    try:
+        series = series_arrays.shared_cache.get(sheet)
+    except Exception as e:
+        logger.error(f"加载时间序列出错: {str(e)}")
+        return jsonify({'error': f'加载时间序列出错: {str(e)}'}), 500
+    if series is None:
+        return jsonify({'error': f'未找到工作表: {sheet}'}), 404
+
+    try:
+        start_day = _parse_day_arg('from')
+        end_day = _parse_day_arg('to')
+        columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()] or None
+        unknown = [c for c in columns or [] if c not in series.columns]
+        if unknown:
+            raise ValueError(f"未知的数值列: {', '.join(unknown)}，可用列: {', '.join(series.columns)}")
+        points = request.args.get('points', type=int) or config.SERIES_MAX_POINTS
+        points = max(3, min(points, config.SERIES_MAX_POINTS))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    data, total = series_arrays.query(series, start_day, end_day, columns, points)
+    return jsonify({
+        'sheet': sheet,
+        'total': total,
+        'points': points,
+        'series': data,
+    })
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """
+    增量同步：/api/changes?since=<version>
+    返回版本 since 之后新增或修订的行（紧凑JSON，每行按 columns 顺序排列）
+    """
+    raw_since = request.args.get('since', '0').strip()
+    # 显式解析：非整数（如 abc、1.5）或负数都返回 400，而不是静默按 0 处理
+    if not (raw_since.isascii() and raw_since.isdigit()):
+        return jsonify({'error': '参数 since 必须为非负整数'}), 400
+    since = int(raw_since)
+    try:
+        version, changes = series_store.get_store().changes_since(since)
+    except Exception as e:
+        logger.error(f"查询增量变更出错: {str(e)}")
+        return jsonify({'error': f'查询增量变更出错: {str(e)}'}), 500
+    return jsonify({
+        'since': since,
+        'version': version,
+        'changes': changes,
+    })
+
 @app.route('/api/queue', methods=['GET'])
 def queue_info():
-    """返回队列看板信息。"""
+    """返回队列看板信息（排队任务按实际调度顺序排列）。"""
+    order = job_queue.order()
+    running_ids = job_queue.running()
     with jobs_lock:
-        # 计算排队中的任务（非 running/completed/failed）
-        queued = [j for j in jobs.values() if j['status'] == 'queued']
-        queued_sorted = sorted(queued, key=lambda x: x['enqueued_at'])
-
-        running = None
-        if current_job_id and current_job_id in jobs:
-            running = jobs[current_job_id]
+        running_jobs = [jobs[jid] for jid in running_ids if jid in jobs]
+        running_jobs.sort(key=lambda j: j.get('started_at') or 0)
+        running = running_jobs[0] if running_jobs else None
+
+        # 排队中的任务：按通道优先级与老化后的调度顺序
+        queued_sorted = []
+        for idx, (jid, lane, priority) in enumerate(order, start=1):
+            j = jobs.get(jid)
+            if j is None:
+                continue
+            j['position'] = (1 if running else 0) + idx
+            j['priority'] = priority
+            queued_sorted.append(j)
 
-        completed_recent = [j for j in jobs.values() if j['status'] in ('completed', 'failed')]
+        completed_recent = [j for j in jobs.values() if j['status'] in FINISHED_STATUSES]
         # 只返回最近的最多10条历史
         completed_recent = sorted(completed_recent, key=lambda x: x.get('finished_at', 0), reverse=True)[:10]
 
-        # 计算队列内位置
-        for idx, j in enumerate(queued_sorted, start=1):
-            j['position'] = (1 if running else 0) + idx
-
         return jsonify({
             'running': running,
+            'running_jobs': running_jobs,
             'queued': queued_sorted,
             'history': completed_recent,
             'queue_size': len(queued_sorted),
-            'running_flag': crawler_running
+            'running_flag': crawler_running,
+            'lanes': {
+                name: {
+                    'running': sum(1 for lane in running_ids.values() if lane == name),
+                    'max_running': spec['max_running'],
+                    'queued': sum(1 for _, lane, _ in order if lane == name),
+                }
+                for name, spec in config.JOB_LANES.items()
+            },
         })
 
 # 前端路由
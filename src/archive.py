@@ -0,0 +1,212 @@
+"""
+按年份分区的归档工作簿
+
+日频工作表中早于保留期限（ARCHIVE_HORIZON_DAYS）的行被移动到按年份划分的归档工作簿
+（archive/Market Index 2023.xlsx），正式文件只保留最近的窗口，加载与保存耗时不再随历史增长。
+需要完整历史时，按需把归档与正式文件合并为一份导出文件（带缓存）。
+
+归档写入按日期键去重：先保存归档、再删除正式文件中的行，中途失败重跑不会产生重复。
+"""
+import copy
+import hashlib
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook, load_workbook
+
+try:
+    import config
+    import tail_index
+except ImportError:
+    from src import config
+    from src import tail_index
+
+logger = logging.getLogger(__name__)
+
+MERGED_PREFIX = 'merged-'
+
+
+def archive_dir():
+    return config.ARCHIVE_DIR
+
+
+def _stem(excel_path=None):
+    return os.path.splitext(os.path.basename(excel_path or config.EXCEL_OUTPUT_PATH))[0]
+
+
+def archive_path(year, excel_path=None):
+    """返回某一年的归档工作簿路径"""
+    return os.path.join(archive_dir(), f"{_stem(excel_path)} {year}.xlsx")
+
+
+def archive_paths(excel_path=None):
+    """返回已存在的归档工作簿路径，按年份升序"""
+    pattern = re.compile(re.escape(_stem(excel_path)) + r' (\d{4})\.xlsx$')
+    try:
+        names = os.listdir(archive_dir())
+    except OSError:
+        return []
+    years = sorted(int(m.group(1)) for m in map(pattern.match, names) if m)
+    return [archive_path(year, excel_path) for year in years]
+
+
+def _is_daily_sheet(sheet_name):
+    return sheet_name not in config.MONTHLY_DATA_PAIRS and (
+        sheet_name in config.COLUMN_DEFINITIONS or sheet_name in config.CURRENCY_PAIRS
+    )
+
+
+def _copy_cell(source, target):
+    target.value = source.value
+    if source.has_style:
+        target.number_format = source.number_format
+        target.alignment = copy.copy(source.alignment)
+
+
+def _expired_prefix(ws, cutoff):
+    """返回从第 2 行开始、日期早于 cutoff 的连续行数（日频数据按日期升序排列）"""
+    count = 0
+    for row_num in range(2, ws.max_row + 1):
+        dt = tail_index.parse_sheet_date(ws.cell(row=row_num, column=1).value, ws.title)
+        if dt is None or dt.date() >= cutoff:
+            break
+        count += 1
+    return count
+
+
+def _save_atomic(wb, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 临时文件名带进程与线程标识，并发生成同一导出文件时互不干扰
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    wb.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _append_rows(archive_wb, sheet_name, header, rows):
+    """把行追加到归档工作表，跳过已归档的日期，返回新增行数"""
+    if sheet_name in archive_wb.sheetnames:
+        ws = archive_wb[sheet_name]
+    else:
+        ws = archive_wb.create_sheet(sheet_name)
+        for col_idx, cell in enumerate(header, 1):
+            _copy_cell(cell, ws.cell(row=1, column=col_idx))
+
+    existing = {
+        tail_index.date_key(values[0], sheet_name)
+        for values in ws.iter_rows(min_row=2, max_col=1, values_only=True)
+    }
+    next_row = ws.max_row + 1
+    added = 0
+    for cells in rows:
+        if tail_index.date_key(cells[0].value, sheet_name) in existing:
+            continue
+        for col_idx, cell in enumerate(cells, 1):
+            _copy_cell(cell, ws.cell(row=next_row, column=col_idx))
+        next_row += 1
+        added += 1
+    return added
+
+
+def archive_expired_rows(wb, horizon_days=None, today=None, sheet_names=None):
+    """
+    将正式工作簿中早于保留期限的日频行移动到按年份划分的归档工作簿（在文件锁内、保存前调用）
+
+    sheet_names 指定时只处理这些工作表（部分更新时不改动其他工作表）。
+
+    Returns:
+        dict: {sheet_name: 从正式工作簿移除的行数}
+    """
+    horizon_days = horizon_days or config.ARCHIVE_HORIZON_DAYS
+    if not horizon_days:
+        return {}
+    cutoff = (today or datetime.now()).date() - timedelta(days=horizon_days)
+
+    expired = {}   # {sheet_name: 行数}
+    by_year = {}   # {year: {sheet_name: [row cells]}}
+    for ws in wb.worksheets:
+        if not _is_daily_sheet(ws.title) or (sheet_names is not None and ws.title not in sheet_names):
+            continue
+        count = _expired_prefix(ws, cutoff)
+        if not count:
+            continue
+        expired[ws.title] = count
+        for cells in ws.iter_rows(min_row=2, max_row=count + 1):
+            year = tail_index.parse_sheet_date(cells[0].value, ws.title).year
+            by_year.setdefault(year, {}).setdefault(ws.title, []).append(cells)
+
+    if not expired:
+        return {}
+
+    # 先写归档（按日期去重），全部成功后再从正式工作簿删除
+    for year, sheets in sorted(by_year.items()):
+        path = archive_path(year)
+        if os.path.exists(path):
+            archive_wb = load_workbook(path)
+        else:
+            archive_wb = Workbook()
+            archive_wb.remove(archive_wb.active)
+        added = {
+            sheet_name: _append_rows(archive_wb, sheet_name, list(wb[sheet_name][1]), rows)
+            for sheet_name, rows in sheets.items()
+        }
+        _save_atomic(archive_wb, path)
+        logger.info(f"🗃️ 已归档到 {os.path.basename(path)}: {', '.join(f'{k}({v})' for k, v in added.items())}")
+
+    for sheet_name, count in expired.items():
+        wb[sheet_name].delete_rows(2, count)
+    return expired
+
+
+def _export_key(source_path, paths):
+    digest = hashlib.sha1()
+    for path in [source_path] + paths:
+        st = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{st.st_mtime_ns}:{st.st_size}:{st.st_ino};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def merged_export(source_path):
+    """
+    返回包含完整历史的合并导出文件（归档行按日期插入到各工作表表头之后），
+    按源文件与归档文件的标识缓存；没有归档时返回 None。
+
+    Returns:
+        (path, key) 或 None
+    """
+    paths = archive_paths()
+    if not paths:
+        return None
+    key = _export_key(source_path, paths)
+    dest = os.path.join(archive_dir(), f"{MERGED_PREFIX}{key}.xlsx")
+    if os.path.exists(dest):
+        return dest, key
+
+    logger.info(f"📦 生成合并导出文件（{len(paths)} 个归档工作簿）")
+    wb = load_workbook(source_path)
+    archived = {}  # {sheet_name: [row cells]}，按年份升序
+    archive_wbs = [load_workbook(path) for path in paths]
+    for archive_wb in archive_wbs:
+        for ws in archive_wb.worksheets:
+            archived.setdefault(ws.title, []).extend(ws.iter_rows(min_row=2))
+
+    for sheet_name, rows in archived.items():
+        if sheet_name not in wb.sheetnames or not rows:
+            continue
+        ws = wb[sheet_name]
+        ws.insert_rows(2, amount=len(rows))
+        for row_num, cells in enumerate(rows, start=2):
+            for col_idx, cell in enumerate(cells, 1):
+                _copy_cell(cell, ws.cell(row=row_num, column=col_idx))
+
+    _save_atomic(wb, dest)
+    # 只保留最新的合并导出文件
+    for name in os.listdir(archive_dir()):
+        if name.startswith(MERGED_PREFIX) and name != os.path.basename(dest):
+            try:
+                os.remove(os.path.join(archive_dir(), name))
+            except OSError:
+                pass
+    return dest, key
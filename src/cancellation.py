@@ -0,0 +1,90 @@
+"""
+协作式任务取消（取消令牌）
+
+每个任务持有一个 CancelToken，取消请求（/api/jobs/<id>/cancel 或高优先级任务抢占）只设置令牌，
+由执行任务的线程在安全点自行检查并退出：
+  - 数据源之间（check）
+  - 等待/重试间隔中（wait：被取消时立即返回，不再睡满）
+  - 写入存储与 Excel 之前（check）
+取消时注册的回调（如关闭 WebDriver）立即执行，正在进行的页面请求随之中断，不必等待超时。
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REASON_CANCELLED = 'cancelled'
+REASON_PREEMPTED = 'preempted'
+
+
+class JobCancelled(Exception):
+    """任务已被取消（reason 为 cancelled 或 preempted）"""
+
+    def __init__(self, reason=REASON_CANCELLED):
+        super().__init__(f"任务已取消（{reason}）")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    用法：
+        token = CancelToken()
+        token.add_callback(analyzer.close_driver)   # 取消时立即释放资源
+        token.check()                               # 安全点：已取消时抛出 JobCancelled
+        if token.wait(1): ...                       # 可被取消打断的等待
+        token.cancel()                              # 其他线程中请求取消
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=REASON_CANCELLED):
+        """请求取消并执行回调；重复取消不产生效果，返回本次是否生效"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _run_callback(callback)
+        return True
+
+    def add_callback(self, callback):
+        """注册取消回调；已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        _run_callback(callback)
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    def wait(self, seconds):
+        """等待 seconds 秒，期间被取消时立即返回 True"""
+        return self._event.wait(seconds)
+
+
+def pause(token, seconds):
+    """可被取消打断的 sleep（token 为 None 时等同 time.sleep），被取消时返回 True"""
+    if token is None:
+        time.sleep(seconds)
+        return False
+    return token.wait(seconds)
+
+
+def _run_callback(callback):
+    try:
+        callback()
+    except Exception as e:
+        logger.warning(f"执行取消回调失败: {str(e)}")
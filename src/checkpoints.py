@@ -0,0 +1,176 @@
+"""
+任务检查点日志（按数据源）
+
+update_excel 每得到一个数据源的结果（爬取成功、使用缓存或失败）就立即写入 SQLite 日志（checkpoints.db），
+任务超时、被取消或写入阶段失败时，已经得到的结果不会丢失。
+
+retry_failed=<job_id>：只重新爬取该任务中失败或未完成的数据源，与该任务已成功的结果合并后写入；
+写入阶段失败的任务没有需要重新爬取的数据源，重试时直接用已保存的结果重新写入。
+被抢占后重新排队的任务以自己的编号作为 retry_failed 继续执行，只爬取抢占时尚未完成的数据源。
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+try:
+    import config
+    import source_cache
+except ImportError:
+    from src import config
+    from src import source_cache
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = 'checkpoint_jobs'
+SOURCES_TABLE = 'checkpoint_sources'
+
+
+class Journal:
+    """
+    检查点日志（SQLite，多线程/多进程安全）
+
+    用法：
+        journal.begin(job_id, sources)                   # 任务开始，记录请求的数据源
+        journal.record_success(job_id, source, data)     # 每个数据源结果到达时立即写入
+        journal.record_failure(job_id, source, reason)
+        results, pending, sources = journal.retry_plan(job_id)  # 重试：已成功的结果与需要重新爬取的数据源
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {JOBS_TABLE} '
+                '(job_id TEXT PRIMARY KEY, started_at REAL NOT NULL, sources TEXT NOT NULL, retry_of TEXT)'
+            )
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} '
+                '(job_id TEXT NOT NULL, source TEXT NOT NULL, ok INTEGER NOT NULL, reason TEXT, '
+                'payload TEXT, recorded_at REAL NOT NULL, PRIMARY KEY (job_id, source))'
+            )
+            self._local.conn = conn
+        return conn
+
+    def begin(self, job_id, sources, retry_of=None):
+        """
+        记录任务开始及其请求的数据源；重试任务继承原任务已成功的结果，使重试的重试同样只处理剩余部分。
+        retry_of 为任务自身（被抢占后继续执行）时保留已有的检查点。
+        """
+        if retry_of == job_id and self.sources(job_id) is not None:
+            return
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                f'INSERT OR REPLACE INTO {JOBS_TABLE} (job_id, started_at, sources, retry_of) VALUES (?, ?, ?, ?)',
+                (job_id, time.time(), json.dumps(list(sources), ensure_ascii=False), retry_of),
+            )
+            if retry_of:
+                conn.execute(
+                    f'INSERT OR REPLACE INTO {SOURCES_TABLE} (job_id, source, ok, reason, payload, recorded_at) '
+                    f'SELECT ?, source, ok, reason, payload, recorded_at FROM {SOURCES_TABLE} '
+                    'WHERE job_id = ? AND ok = 1',
+                    (job_id, retry_of),
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.collect()
+
+    def _record(self, job_id, source, ok, reason=None, payload=None):
+        self._connect().execute(
+            f'INSERT OR REPLACE INTO {SOURCES_TABLE} (job_id, source, ok, reason, payload, recorded_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, source, int(ok), reason, payload, time.time()),
+        )
+
+    def record_success(self, job_id, source, data):
+        self._record(job_id, source, True, payload=source_cache.dumps(data))
+
+    def record_failure(self, job_id, source, reason):
+        self._record(job_id, source, False, reason=reason)
+
+    def sources(self, job_id):
+        """任务请求的数据源，未知任务返回 None"""
+        row = self._connect().execute(
+            f'SELECT sources FROM {JOBS_TABLE} WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def succeeded(self, job_id):
+        """任务已成功的数据源集合（不加载结果），未知任务返回 None"""
+        if self.sources(job_id) is None:
+            return None
+        rows = self._connect().execute(
+            f'SELECT source FROM {SOURCES_TABLE} WHERE job_id = ? AND ok = 1', (job_id,)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def retry_plan(self, job_id):
+        """
+        重试任务的计划
+
+        Returns:
+            tuple: (已成功的结果 {source: data}, 需要重新爬取的数据源（失败或未完成，按原顺序）, 原任务请求的全部数据源)
+
+        Raises:
+            ValueError: 没有该任务的检查点
+        """
+        requested = self.sources(job_id)
+        if requested is None:
+            raise ValueError(f"未找到任务 {job_id} 的检查点（可能已被清理）")
+        results = {}
+        rows = self._connect().execute(
+            f'SELECT source, payload FROM {SOURCES_TABLE} WHERE job_id = ? AND ok = 1', (job_id,)
+        ).fetchall()
+        for source, payload in rows:
+            try:
+                results[source] = source_cache.loads(payload)
+            except ValueError:
+                continue
+        pending = [source for source in requested if source not in results]
+        return results, pending, requested
+
+    def collect(self, keep=None):
+        """只保留最近 keep 个任务的检查点"""
+        keep = config.CHECKPOINT_RETENTION if keep is None else keep
+        if not keep:
+            return
+        conn = self._connect()
+        expired = [row[0] for row in conn.execute(
+            f'SELECT job_id FROM {JOBS_TABLE} ORDER BY started_at DESC LIMIT -1 OFFSET ?', (keep,)
+        )]
+        if not expired:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(f'DELETE FROM {SOURCES_TABLE} WHERE job_id = ?', [(job_id,) for job_id in expired])
+            conn.executemany(f'DELETE FROM {JOBS_TABLE} WHERE job_id = ?', [(job_id,) for job_id in expired])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(db_path=None):
+    """返回进程内共享的检查点日志实例（按文件路径）"""
+    db_path = db_path or config.CHECKPOINT_PATH
+    with _journals_lock:
+        journal = _journals.get(db_path)
+        if journal is None:
+            journal = Journal(db_path)
+            _journals[db_path] = journal
+        return journal
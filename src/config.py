@@ -215,6 +215,164 @@ COLUMN_DEFINITIONS = {
 }
 
 # Excel配置（使用适用于打包环境的路径）
-# 直接使用文件名，不包含data目录
-EXCEL_OUTPUT_PATH = resource_path("Market Index.xlsx")
+# 直接使用文件名，不包含data目录；设置环境变量 MARKET_INDEX_PATH 时使用该路径（如测试中的临时文件）
+EXCEL_OUTPUT_PATH = os.environ.get("MARKET_INDEX_PATH") or resource_path("Market Index.xlsx")
 
+# 尾部索引（sidecar）文件后缀，位于Excel文件旁边，记录各工作表的最后数据行
+TAIL_INDEX_SUFFIX = ".tail.json"
+
+# 服务进程内工作簿缓存的内存预算（MB），超出预算时按LRU淘汰
+WORKBOOK_CACHE_BUDGET_MB = 256
+
+# 合并引擎载入的窗口行数：爬取数据与工作表最后W行按日期键连接，窗口内的修订会被原地更正
+MERGE_WINDOW_ROWS = 30
+
+# SQLite时间序列数据库（规范数据源，WAL模式），位于Excel文件旁边；Excel由其按工作表增量渲染
+SERIES_DB_PATH = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "market_data.db")
+
+# 时间序列查询接口（/api/series）单列返回的最大点数，超出时使用LTTB降采样
+SERIES_MAX_POINTS = 5000
+
+# 供分析脚本内存映射读取的 .npy 时间序列目录（每个工作表一组文件，任务后重写变化的工作表；None 表示不导出）
+SERIES_NPY_DIR = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "series_npy")
+
+# 派生指标：数据库写入后按新增行增量更新（运行状态持久化在数据库中），结果写入 _derived_values 表
+DERIVED_METRICS_ENABLED = False
+
+# 派生指标定义：rolling_mean（移动平均）、yoy（同比）、spread（利差）、ratio（交叉汇率）
+DERIVED_METRICS = [
+    {'name': 'USD CNY MA20', 'kind': 'rolling_mean', 'sheet': 'USD CNY', 'column': '收盘', 'window': 20},
+    {'name': 'USD CNY MA60', 'kind': 'rolling_mean', 'sheet': 'USD CNY', 'column': '收盘', 'window': 60},
+    {'name': 'USD 10Y 同比', 'kind': 'yoy', 'sheet': 'USD 10Y', 'column': '收盘'},
+    {'name': 'SOFR-ESTER 利差', 'kind': 'spread', 'left': ('SOFR', 'RATE(%)'), 'right': ('ESTER', 'value')},
+    {'name': 'EUR USD 交叉汇率', 'kind': 'ratio', 'left': ('EUR CNY', '收盘'), 'right': ('USD CNY', '收盘')},
+]
+
+# 更新请求合并：已有覆盖相同数据源的排队中/运行中任务时，新的 /api/update 请求直接加入该任务
+UPDATE_COALESCE = True
+
+# 新鲜度窗口（秒）：最近一次成功的完整更新在该时间内完成时直接返回其结果（0 表示不启用）
+UPDATE_FRESHNESS_SECONDS = 120
+
+# 按数据源缓存爬取结果（source_cache.db），缓存未过期的数据源在新任务中跳过爬取
+SOURCE_CACHE_ENABLED = True
+SOURCE_CACHE_PATH = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "source_cache.db")
+
+# 缓存有效时长（秒）：按节奏（currency/daily）或按数据源名配置；monthly_retry 为月度数据尚未发布新一期时的重试间隔
+SOURCE_CACHE_TTL = {
+    'currency': 10 * 60,
+    'daily': 4 * 3600,
+    'monthly_retry': 6 * 3600,
+    'SOFR': 6 * 3600,
+    'ESTER': 6 * 3600,
+    'Shibor': 3 * 3600,
+}
+
+# 月度数据的发布日（每月几号），缓存有效至下一个发布日；未配置的数据源（如不定期公布的美国利率）按 daily 时长缓存
+SOURCE_RELEASE_DAYS = {
+    'Import and Export': 7,
+    'PPI': 9,
+    'CPI': 9,
+    'Money Supply': 10,
+    'New Bank Loan Addition': 10,
+    'PMI': 1,
+}
+
+# 任务检查点日志（checkpoints.db）：每个数据源的爬取结果一到达即写入，retry_failed=<job_id> 只重新爬取失败的数据源
+CHECKPOINT_PATH = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "checkpoints.db")
+
+# 保留检查点的任务数量，超出时删除最旧任务的检查点
+CHECKPOINT_RETENTION = 200
+
+# 进程内定时调度器：按 SOURCE_SCHEDULES 在数据源发布后自动提交只包含到期数据源的部分更新任务
+SCHEDULER_ENABLED = False
+
+# 调度器文件锁（多进程部署时只有一个进程运行调度器）
+SCHEDULER_LOCK_PATH = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "scheduler.lock")
+
+# 调度定义：sources 为数据源名或分组，times 为 tz 时区的当地时刻（对齐发布时间），
+# weekdays 为星期几（0 为周一），monthdays 为每月几号，jitter 为随机延后的最大秒数
+SOURCE_SCHEDULES = [
+    {'name': '汇率（亚洲收盘后）', 'sources': ['currency'], 'times': ['16:45'], 'tz': 'Asia/Shanghai',
+     'weekdays': [0, 1, 2, 3, 4], 'jitter': 900},
+    {'name': 'SOFR（纽约 8:00 发布后）', 'sources': ['SOFR'], 'times': ['08:20'], 'tz': 'America/New_York',
+     'weekdays': [0, 1, 2, 3, 4], 'jitter': 600},
+    {'name': 'ESTER（法兰克福 8:00 发布后）', 'sources': ['ESTER'], 'times': ['08:20'], 'tz': 'Europe/Berlin',
+     'weekdays': [0, 1, 2, 3, 4], 'jitter': 600},
+    {'name': 'Shibor（11:00 发布后）', 'sources': ['Shibor'], 'times': ['11:15'], 'tz': 'Asia/Shanghai',
+     'weekdays': [0, 1, 2, 3, 4], 'jitter': 600},
+    {'name': '钢价与日元利率', 'sources': ['Steel price', 'JPY rate'], 'times': ['17:30'], 'tz': 'Asia/Shanghai',
+     'weekdays': [0, 1, 2, 3, 4], 'jitter': 1200},
+    {'name': 'LPR（每月20日）', 'sources': ['LPR'], 'times': ['09:30'], 'tz': 'Asia/Shanghai',
+     'monthdays': [20, 21, 22, 23], 'jitter': 600},
+    {'name': '美国利率', 'sources': ['US Interest Rate'], 'times': ['14:30'], 'tz': 'America/New_York',
+     'weekdays': [0, 1, 2, 3, 4], 'jitter': 900},
+    {'name': 'CPI/PPI（发布日前后）', 'sources': ['CPI', 'PPI'], 'times': ['09:45'], 'tz': 'Asia/Shanghai',
+     'monthdays': [9, 10, 11, 12, 13, 15], 'jitter': 900},
+    {'name': '进出口（发布日前后）', 'sources': ['Import and Export'], 'times': ['11:30'], 'tz': 'Asia/Shanghai',
+     'monthdays': [7, 8, 9, 10, 13, 14], 'jitter': 900},
+    {'name': '货币供应与新增贷款', 'sources': ['Money Supply', 'New Bank Loan Addition'], 'times': ['17:30'],
+     'tz': 'Asia/Shanghai', 'monthdays': [10, 11, 12, 13, 14, 15], 'jitter': 1200},
+    {'name': 'PMI（月末/月初）', 'sources': ['PMI'], 'times': ['09:45'], 'tz': 'Asia/Shanghai',
+     'monthdays': [30, 31, 1], 'jitter': 900},
+]
+
+# 任务队列通道：priority 为基础优先级（越小越优先），max_running 为该通道同时运行的任务数上限，
+# preemptible 表示 worker 已满时该通道的运行中任务可被更高优先级的新任务抢占（取消后重新排队）
+JOB_LANES = {
+    'interactive': {'priority': 0, 'max_running': 1, 'preemptible': False},
+    'scheduled': {'priority': 10, 'max_running': 1, 'preemptible': True},
+    'backfill': {'priority': 20, 'max_running': 1, 'preemptible': True},
+}
+
+# 每个任务最多被抢占的次数，达到后不再被抢占（避免低优先级任务反复重跑）
+JOB_MAX_PREEMPTIONS = 2
+
+# 老化：排队任务每等待该秒数，有效优先级提升 1，低优先级任务不会被饿死
+JOB_AGING_SECONDS = 60
+
+# 队列 worker 线程数（同时运行的任务总数上限）。各通道另受 JOB_LANES 的 max_running 限制，
+# 同一通道的任务不会占满全部 worker；worker 少于各通道 max_running 之和，都被占用时交互任务通过抢占尽快开始
+JOB_WORKERS = 2
+
+# 每个任务在内存中保留的日志条数，超出时最旧的一半写入该任务的 gzip 溢出文件
+LOG_BUFFER_PER_JOB = 2000
+
+# 全局日志流（不带 job_id 的订阅）保留的日志条数，超出时丢弃最旧的日志
+LOG_BUFFER_GLOBAL = 2000
+
+# 内存中保留的已结束任务数量，超出时按最近访问时间淘汰（日志与任务记录写入溢出目录，仍可回放）
+JOB_HISTORY_LIMIT = 50
+
+# 任务日志溢出目录与保留的任务数量
+LOG_SPILL_DIR = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "job_logs")
+LOG_SPILL_RETENTION = 500
+
+# Excel文件强ETag的sidecar文件后缀（保存时计算内容哈希）
+ETAG_SUFFIX = ".etag.json"
+
+# nginx X-Accel-Redirect 下载模式：设置为nginx中internal location的前缀（如 "/protected-excel/"）后，
+# /api/download 只返回响应头，由nginx通过sendfile直接发送文件；为 None 时由Flask发送
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = None
+
+# 不可变工作簿快照目录（按内容哈希命名），下载接口通过指针文件读取最新快照
+SNAPSHOT_DIR = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "snapshots")
+
+# 保留的历史快照数量，超出部分在保存后回收
+SNAPSHOT_RETENTION = 10
+
+# 归档：日频工作表中早于该天数的行移动到按年份划分的归档工作簿（None 表示不归档）
+ARCHIVE_HORIZON_DAYS = None
+
+# 归档工作簿与合并导出文件所在目录
+ARCHIVE_DIR = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "archive")
+
+# 分片布局：每个工作表保存在独立的分片文件中并各自加锁，合并的Excel文件在任务写入分片后组装
+# 部分更新（sources=）只有在分片布局下才按工作表读写；单文件布局仍需加载并保存整个工作簿
+SHARDED_LAYOUT = False
+
+# 分片文件所在目录
+SHARD_DIR = os.path.join(os.path.dirname(EXCEL_OUTPUT_PATH), "shards")
+
+# 并行写入分片的线程数
+SHARD_WRITE_WORKERS = 4
@@ -0,0 +1,303 @@
+"""
+增量派生指标（移动平均、同比、利差、交叉汇率）
+
+每次数据库写入后，根据各工作表新增的日期键增量更新 DERIVED_METRICS 中定义的指标：
+  - rolling_mean：最近 window 行的移动平均，环形缓冲区 + 滚动和，每行 O(1)
+  - yoy：与一年前同期（不晚于上一年同日的最近一行）相比的变化率，缓冲区只保留约一年的数据
+  - spread / ratio：两个工作表同一日期的差值 / 比值，只计算本次新增或修订的日期
+
+单序列指标的运行状态（缓冲区、滚动和、最后处理的日期键）持久化在数据库中，
+下次任务从上次停下的位置继续。已处理的行被修订时（如最新的汇率行几乎每次都会修订）：
+修订位于最近一个窗口内（移动平均的最后 window 行、同比的最近一年）时，
+从数据库读取修订日期之前的少量行恢复状态，只重算修订日期之后的尾部；
+更早的修订、早于最后处理日期的新增或指标定义变化时，该指标从数据库全量重建。
+结果写入数据库的 _derived_values 表，与状态在同一事务中提交。
+"""
+import json
+import logging
+import math
+from collections import deque
+from datetime import date, timedelta
+
+try:
+    import config
+    import ingest
+    import tail_index
+except ImportError:
+    from src import config
+    from src import ingest
+    from src import tail_index
+
+logger = logging.getLogger(__name__)
+
+STATE_TABLE = '_derived_state'
+VALUES_TABLE = '_derived_values'
+
+
+def _number(value):
+    number = ingest.parse_number(value)
+    if number is None or not math.isfinite(number):
+        return None
+    return float(number)
+
+
+def _year_before(key):
+    """ISO 日期键的上一年同日（2 月 29 日取 2 月 28 日）"""
+    day = date.fromisoformat(key)
+    try:
+        return day.replace(year=day.year - 1).isoformat()
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28).isoformat()
+
+
+def _next_day(key):
+    return (date.fromisoformat(key) + timedelta(days=1)).isoformat()
+
+
+class RollingMean:
+    """最近 window 行的移动平均"""
+
+    def __init__(self, window, state=None):
+        self.window = window
+        state = state or {}
+        self.buffer = deque(state.get('buffer', []), maxlen=window)
+        self.total = state.get('total', sum(self.buffer))
+
+    def update(self, key, value):
+        if len(self.buffer) == self.window:
+            self.total -= self.buffer[0]
+        self.buffer.append(value)
+        self.total += value
+        if len(self.buffer) < self.window:
+            return None
+        return self.total / self.window
+
+    def state(self):
+        return {'buffer': list(self.buffer), 'total': self.total}
+
+
+class YearOverYear:
+    """与一年前同期相比的变化率"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.buffer = deque(tuple(item) for item in state.get('buffer', []))
+
+    def update(self, key, value):
+        target = _year_before(key)
+        # 丢弃早于基期的数据，保留不晚于基期的最近一行作为基期值
+        while len(self.buffer) > 1 and self.buffer[1][0] <= target:
+            self.buffer.popleft()
+        base = self.buffer[0] if self.buffer and self.buffer[0][0] <= target else None
+        self.buffer.append((key, value))
+        if base is None or base[1] == 0:
+            return None
+        return value / base[1] - 1
+
+    def state(self):
+        return {'buffer': [list(item) for item in self.buffer]}
+
+
+_SERIES_KINDS = {
+    'rolling_mean': lambda metric, state: RollingMean(metric['window'], state),
+    'yoy': lambda metric, state: YearOverYear(state),
+}
+
+_PAIR_KINDS = {
+    'spread': lambda left, right: left - right,
+    'ratio': lambda left, right: left / right if right else None,
+}
+
+
+def _within_window(store, metric, last_key, key):
+    """key 是否位于最后处理日期之前的最近一个窗口内（此范围内的修订只需重算尾部）"""
+    if metric['kind'] == 'rolling_mean':
+        recent = store.column_values(metric['sheet'], metric['column'], before=_next_day(last_key),
+                                     limit=metric['window'])
+        return bool(recent) and key >= recent[0][0]
+    return key > _year_before(last_key)
+
+
+def _primer_rows(store, metric, key):
+    """
+    从 key 开始重算所需的前置行（紧邻 key 之前，按日期升序），用于恢复指标状态；
+    无法确定完整的前置行时返回 None（改为全量重建）
+    """
+    sheet, column = metric['sheet'], metric['column']
+    if metric['kind'] == 'rolling_mean':
+        count = metric['window'] - 1
+        rows = store.column_values(sheet, column, before=key, limit=count) if count > 0 else []
+        # 前置行中有非数值时，状态中的缓冲区会包含更早的行
+        if len(rows) == count and any(_number(value) is None for _, value in rows):
+            return None
+        return rows
+    # 同比：从不晚于 key 的基期的最近一行开始
+    base = store.column_values(sheet, column, before=_next_day(_year_before(key)), limit=1)
+    if not base:
+        return store.column_values(sheet, column, before=key)
+    if _number(base[0][1]) is None:
+        return None
+    return base + store.column_values(sheet, column, after=base[0][0], before=key)
+
+
+def _params(metric):
+    return json.dumps(metric, sort_keys=True, ensure_ascii=False, default=list)
+
+
+def _ensure_tables(conn):
+    conn.execute(
+        f'CREATE TABLE IF NOT EXISTS "{STATE_TABLE}" '
+        '(metric TEXT PRIMARY KEY, params TEXT NOT NULL, last_key TEXT, state TEXT NOT NULL)'
+    )
+    conn.execute(
+        f'CREATE TABLE IF NOT EXISTS "{VALUES_TABLE}" '
+        '(metric TEXT NOT NULL, date_key TEXT NOT NULL, value REAL, PRIMARY KEY (metric, date_key))'
+    )
+
+
+def _update_series_metric(conn, store, metric, delta):
+    """单序列指标：从上次的状态继续处理新增的行，无法增量时全量重建"""
+    name, sheet = metric['name'], metric['sheet']
+    row = conn.execute(
+        f'SELECT params, last_key, state FROM "{STATE_TABLE}" WHERE metric = ?', (name,)
+    ).fetchone()
+
+    rebuild = row is None or row[0] != _params(metric)
+    last_key = None if rebuild else row[1]
+    replay_from = None
+    if not rebuild and delta is not None and last_key is not None:
+        corrected = [key for key in delta.corrected if key <= last_key]
+        if any(key <= last_key for key in delta.inserted):
+            # 早于最后处理日期的新增改变了行的先后顺序
+            rebuild = True
+        elif corrected:
+            replay_from = min(corrected)
+            rebuild = not (tail_index.is_date_key(replay_from) and tail_index.is_date_key(last_key)
+                           and _within_window(store, metric, last_key, replay_from))
+    if not rebuild and not delta:
+        return 0
+
+    primer = None
+    if replay_from is not None and not rebuild:
+        primer = _primer_rows(store, metric, replay_from)
+        rebuild = primer is None
+
+    if rebuild:
+        conn.execute(f'DELETE FROM "{VALUES_TABLE}" WHERE metric = ?', (name,))
+        last_key = None
+        engine = _SERIES_KINDS[metric['kind']](metric, None)
+    elif primer is not None:
+        # 窗口内的修订：用修订日期之前的行恢复状态，只重算尾部
+        conn.execute(f'DELETE FROM "{VALUES_TABLE}" WHERE metric = ? AND date_key >= ?', (name, replay_from))
+        engine = _SERIES_KINDS[metric['kind']](metric, None)
+        for key, raw in primer:
+            value = _number(raw)
+            if value is not None:
+                engine.update(key, value)
+        last_key = primer[-1][0] if primer else None
+    else:
+        engine = _SERIES_KINDS[metric['kind']](metric, json.loads(row[2]))
+
+    written = []
+    for key, raw in store.column_values(sheet, metric['column'], after=last_key):
+        last_key = key
+        value = _number(raw)
+        if value is None:
+            continue
+        result = engine.update(key, value)
+        if result is not None:
+            written.append((name, key, result))
+
+    conn.executemany(f'INSERT OR REPLACE INTO "{VALUES_TABLE}" (metric, date_key, value) VALUES (?, ?, ?)', written)
+    conn.execute(
+        f'INSERT OR REPLACE INTO "{STATE_TABLE}" (metric, params, last_key, state) VALUES (?, ?, ?, ?)',
+        (name, _params(metric), last_key, json.dumps(engine.state())),
+    )
+    if rebuild:
+        logger.info(f"🔄 派生指标 {name} 已全量重建（{len(written)} 个值）")
+    elif primer is not None:
+        logger.debug(f"派生指标 {name} 自 {replay_from} 起重算（{len(written)} 个值）")
+    return len(written)
+
+
+def _update_pair_metric(conn, store, metric, deltas):
+    """双序列指标：只计算本次两侧新增或修订的日期（首次运行时计算全部日期）"""
+    name = metric['name']
+    (left_sheet, left_col), (right_sheet, right_col) = metric['left'], metric['right']
+    row = conn.execute(f'SELECT params FROM "{STATE_TABLE}" WHERE metric = ?', (name,)).fetchone()
+
+    if row is None or row[0] != _params(metric):
+        conn.execute(f'DELETE FROM "{VALUES_TABLE}" WHERE metric = ?', (name,))
+        keys = None
+    else:
+        keys = set()
+        for sheet in (left_sheet, right_sheet):
+            delta = deltas.get(sheet)
+            if delta:
+                keys.update(delta.inserted)
+                keys.update(delta.corrected)
+        if not keys:
+            return 0
+
+    left = dict(store.column_values(left_sheet, left_col, keys=keys))
+    right = dict(store.column_values(right_sheet, right_col, keys=keys))
+    combine = _PAIR_KINDS[metric['kind']]
+    written = []
+    for key in sorted(left.keys() & right.keys()):
+        a, b = _number(left[key]), _number(right[key])
+        if a is None or b is None:
+            continue
+        result = combine(a, b)
+        if result is not None:
+            written.append((name, key, result))
+
+    conn.executemany(f'INSERT OR REPLACE INTO "{VALUES_TABLE}" (metric, date_key, value) VALUES (?, ?, ?)', written)
+    conn.execute(
+        f'INSERT OR REPLACE INTO "{STATE_TABLE}" (metric, params, last_key, state) VALUES (?, ?, ?, ?)',
+        (name, _params(metric), max(left.keys() & right.keys(), default=None), '{}'),
+    )
+    return len(written)
+
+
+def update_metrics(store, deltas, metrics=None):
+    """
+    在数据库写入之后增量更新派生指标（单个事务）
+
+    Args:
+        store: series_store.SeriesStore
+        deltas: write_results 返回的 {sheet_name: StoreDelta}
+
+    Returns:
+        dict: {指标名: 本次写入的值数量}
+    """
+    metrics = config.DERIVED_METRICS if metrics is None else metrics
+    updated = {}
+    with store.transaction() as conn:
+        _ensure_tables(conn)
+        for metric in metrics:
+            kind = metric['kind']
+            if kind in _SERIES_KINDS:
+                if not store.has_table(metric['sheet']):
+                    continue
+                count = _update_series_metric(conn, store, metric, deltas.get(metric['sheet']))
+            elif kind in _PAIR_KINDS:
+                if not (store.has_table(metric['left'][0]) and store.has_table(metric['right'][0])):
+                    continue
+                count = _update_pair_metric(conn, store, metric, deltas)
+            else:
+                logger.warning(f"未知的派生指标类型: {kind}（{metric['name']}）")
+                continue
+            if count:
+                updated[metric['name']] = count
+    if updated:
+        logger.info(f"📐 派生指标已更新: {', '.join(f'{k}({v})' for k, v in updated.items())}")
+    return updated
+
+
+def read_metric(store, name):
+    """返回派生指标的 [(日期键, 值)]，按日期升序"""
+    conn = store._connect()
+    _ensure_tables(conn)
+    return conn.execute(
+        f'SELECT date_key, value FROM "{VALUES_TABLE}" WHERE metric = ? ORDER BY date_key', (name,)
+    ).fetchall()
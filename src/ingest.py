@@ -0,0 +1,146 @@
+"""
+类型化数据摄取层
+
+爬虫返回的记录全部是字符串（"7.1234"、"-0.12%"、"1.2K"、"2025/9/15"）。
+本模块在写入之前把每条记录一次性转换为带类型的值：日期列转为 datetime，
+数值列转为 float（百分数转为小数并标记为 Percent，单位后缀按倍数展开）。
+日期解析器带缓存，后续的比较、差异计算和写入都不再重复解析字符串，
+工作簿中保存的也是公式和 pandas 可以直接读取的真实数值。
+"""
+import re
+from datetime import datetime, date
+from functools import lru_cache
+
+try:
+    import config
+except ImportError:
+    from src import config
+
+# 数值文本：可选符号、千分位、小数，后接可选的单位后缀或百分号
+_NUMBER_RE = re.compile(r'^([+\-−]?)\s*(\d{1,3}(?:,\d{3})+|\d*)(\.\d+)?\s*([KMBT万亿%]?)$', re.IGNORECASE)
+
+_UNIT_MULTIPLIERS = {
+    'K': 1e3,
+    'M': 1e6,
+    'B': 1e9,
+    'T': 1e12,
+    '万': 1e4,
+    '亿': 1e8,
+}
+
+# 数据源中出现过的日期格式（按常见程度排列）
+_DATE_FORMATS = (
+    "%Y/%m/%d",
+    "%Y-%m-%d",
+    "%Y年%m月%d日",
+    "%m/%d/%Y",
+    "%m-%d-%Y",
+    "%m月 %d, %Y",
+    "%b %d, %Y",
+    "%B %d, %Y",
+)
+
+# 除工作表第一列之外，需要按日期解析的列
+DATE_COLUMNS = {'发布日期'}
+
+
+class Percent(float):
+    """以小数保存的百分数（写入Excel时使用百分比格式显示）"""
+    __slots__ = ()
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text, fmt):
+    """按指定格式解析日期（带缓存）"""
+    return datetime.strptime(text, fmt)
+
+
+@lru_cache(maxsize=4096)
+def parse_any_date(text):
+    """依次尝试已知格式解析日期（带缓存），失败时抛出 ValueError"""
+    text = text.strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析日期: {text}")
+
+
+def to_datetime(value):
+    """将 datetime/date/日期字符串统一转换为 datetime"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return parse_any_date(str(value))
+
+
+@lru_cache(maxsize=8192)
+def _parse_number_text(text):
+    match = _NUMBER_RE.match(text)
+    if not match:
+        return None
+    sign, integer, fraction, suffix = match.groups()
+    if not integer and not fraction:
+        return None
+    number = float((integer or '0').replace(',', '') + (fraction or ''))
+    if sign in ('-', '−'):
+        number = -number
+    if suffix == '%':
+        return Percent(number / 100)
+    if suffix:
+        number *= _UNIT_MULTIPLIERS[suffix.upper() if suffix.isascii() else suffix]
+    return number
+
+
+def parse_number(value):
+    """
+    将数值文本转换为 float；百分数返回 Percent（小数），单位后缀（K/M/B/万/亿）按倍数展开。
+    非数值文本（如 '-'、'SOFR'）返回 None。
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if not isinstance(value, Percent) else value
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    return _parse_number_text(text)
+
+
+def coerce_value(value):
+    """数值文本转为数值，无法识别的值原样保留"""
+    number = parse_number(value)
+    return value if number is None else number
+
+
+def coerce_record(sheet_name, record):
+    """
+    将一条爬取记录转换为带类型的记录
+
+    日频工作表的日期列以及 DATE_COLUMNS 中的列转为 datetime；
+    月度工作表的日期列是期间标签（如 2025年08月份），保持文本。
+    """
+    typed = {}
+    is_monthly = sheet_name in config.MONTHLY_DATA_PAIRS
+    for key, value in record.items():
+        if (key == '日期' and not is_monthly) or key in DATE_COLUMNS:
+            try:
+                typed[key] = to_datetime(value) if value not in ('', None) else value
+            except ValueError:
+                typed[key] = value
+        else:
+            typed[key] = coerce_value(value)
+    return typed
+
+
+def coerce_results(sheet_name, data):
+    """转换某个数据源的爬取结果（记录列表，兼容单条记录）"""
+    if isinstance(data, dict):
+        return coerce_record(sheet_name, data)
+    if isinstance(data, list):
+        return [coerce_record(sheet_name, record) for record in data]
+    return data
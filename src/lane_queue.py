@@ -0,0 +1,104 @@
+"""
+按通道划分优先级的任务队列（interactive / scheduled / backfill）
+
+每个任务进入一个通道，通道有基础优先级（数值越小越优先）与并发上限。
+取任务时在未达到并发上限的通道中选择有效优先级最高的任务：
+有效优先级 = 基础优先级 - 已等待秒数 / 老化间隔，等待越久优先级越高，低优先级任务不会被饿死。
+同一有效优先级按入队时间先后。
+"""
+import threading
+import time
+
+LANE_INTERACTIVE = 'interactive'
+LANE_SCHEDULED = 'scheduled'
+LANE_BACKFILL = 'backfill'
+
+
+class LaneQueue:
+    """
+    用法：
+        q = LaneQueue(config.JOB_LANES, config.JOB_AGING_SECONDS)
+        q.put(job_id, 'interactive')
+        job_id = q.get()        # worker 线程中阻塞获取
+        ...
+        q.task_done(job_id)     # 任务结束，释放通道并发名额
+    """
+
+    def __init__(self, lanes, aging_seconds):
+        self.lanes = lanes
+        self.aging_seconds = aging_seconds
+        self._cond = threading.Condition()
+        self._items = {}      # {job_id: (lane, enqueued_at)}
+        self._running = {}    # {job_id: lane}
+
+    def _lane(self, lane):
+        return lane if lane in self.lanes else LANE_INTERACTIVE
+
+    def put(self, job_id, lane=LANE_INTERACTIVE, enqueued_at=None):
+        with self._cond:
+            self._items[job_id] = (self._lane(lane), enqueued_at or time.time())
+            self._cond.notify_all()
+
+    def effective_priority(self, lane, enqueued_at, now=None):
+        waited = max(0.0, (now or time.time()) - enqueued_at)
+        aging = waited / self.aging_seconds if self.aging_seconds else 0.0
+        return self.lanes[lane]['priority'] - aging
+
+    def _sort_key(self, job_id, now):
+        lane, enqueued_at = self._items[job_id]
+        return (self.effective_priority(lane, enqueued_at, now), enqueued_at)
+
+    def _lane_running(self, lane):
+        return sum(1 for running_lane in self._running.values() if running_lane == lane)
+
+    def _eligible(self):
+        """返回可以立即开始的任务（通道未达到并发上限）中优先级最高者"""
+        now = time.time()
+        candidates = [
+            job_id for job_id, (lane, _) in self._items.items()
+            if self._lane_running(lane) < self.lanes[lane]['max_running']
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda job_id: self._sort_key(job_id, now))
+
+    def get(self, timeout=None):
+        """阻塞直到有可以开始的任务，返回 job_id（超时返回 None）"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._eligible() is not None, timeout):
+                return None
+            job_id = self._eligible()
+            lane, _ = self._items.pop(job_id)
+            self._running[job_id] = lane
+            return job_id
+
+    def task_done(self, job_id):
+        with self._cond:
+            self._running.pop(job_id, None)
+            self._cond.notify_all()
+
+    def remove(self, job_id):
+        """从队列中移除尚未开始的任务，成功时返回 True"""
+        with self._cond:
+            removed = self._items.pop(job_id, None) is not None
+            self._cond.notify_all()
+            return removed
+
+    def order(self):
+        """当前的调度顺序：[(job_id, 通道, 有效优先级)]，按将被取出的先后排列（不考虑并发上限）"""
+        with self._cond:
+            now = time.time()
+            ordered = sorted(self._items, key=lambda job_id: self._sort_key(job_id, now))
+            return [
+                (job_id, self._items[job_id][0], round(self._sort_key(job_id, now)[0], 2))
+                for job_id in ordered
+            ]
+
+    def running(self):
+        """正在运行的任务：{job_id: 通道}"""
+        with self._cond:
+            return dict(self._running)
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
@@ -0,0 +1,312 @@
+"""
+推送式日志事件总线（供 /api/logs 的 SSE 流使用）
+
+日志处理器 emit 时把日志追加到全局流与所属任务的流，并通过条件变量立即唤醒等待中的订阅者。
+每个订阅者只持有自己的游标（已读取日志的绝对序号），每次被唤醒只取游标之后的新日志，
+无需复制整个缓冲区或重复扫描；任务结束通过显式的完成事件（close）通知订阅者结束流。
+
+内存有界：
+  - 全局流是固定容量的环形缓冲区，超出容量的旧日志直接丢弃
+  - 任务流超出容量时，最旧的一半以 gzip 分段追加写入该任务的溢出文件（job_logs/<job_id>.log.gz）
+  - 已结束的任务被淘汰（evict）时，剩余日志同样写入溢出文件并从内存移除；
+    之后订阅该任务时从溢出文件回放
+  - 溢出文件在总线锁之外写入：日志先写入文件，再从内存移除，订阅者始终能读到完整的日志；
+    写入失败只计数并输出到 stderr，不再经由日志系统（否则会重新进入总线）
+"""
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from itertools import islice
+
+try:
+    import config
+except ImportError:
+    from src import config
+
+logger = logging.getLogger(__name__)
+
+# 没有新日志时订阅者的最长等待时间（秒），超时后发送 SSE 心跳并检查连接
+HEARTBEAT_SECONDS = 15
+SPILL_SUFFIX = '.log.gz'
+RECORD_SUFFIX = '.job.json'
+
+
+class LogStream:
+    """
+    单个日志流：内存中保留序号 [base, total) 的日志，更早的日志在溢出文件中（或已丢弃）
+    """
+
+    __slots__ = ('entries', 'base', 'closed', 'spill_path', 'spill_lock')
+
+    def __init__(self, capacity=None, closed=False, spill_path=None, base=0):
+        self.entries = deque(maxlen=capacity if spill_path is None else None)
+        self.base = base
+        self.closed = closed
+        self.spill_path = spill_path
+        # 串行化同一任务流的溢出写入（不持有总线锁）
+        self.spill_lock = threading.Lock()
+
+    @property
+    def total(self):
+        return self.base + len(self.entries)
+
+
+class LogBus:
+    """
+    按任务划分的日志流集合
+
+    用法：
+        bus.publish(entry, job_id)                       # 日志处理器中调用
+        stream = bus.stream(job_id)                      # 订阅（已淘汰的任务从溢出文件回放）
+        entries, cursor, done = bus.wait(stream, cursor) # 阻塞直到有新日志或流结束
+        bus.close(job_id)                                # 任务结束
+        bus.evict(job_id)                                # 淘汰已结束任务的内存日志
+    """
+
+    def __init__(self, job_capacity, global_capacity, spill_dir, spill_retention=None):
+        self.job_capacity = max(2, job_capacity)
+        self.global_capacity = global_capacity
+        self.spill_dir = spill_dir
+        self.spill_retention = spill_retention
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._active = set()
+        # 全局流（兼容不带 job_id 的订阅）：每个任务开始时换新，任务结束时关闭
+        self._global = LogStream(global_capacity, closed=True)
+        # 溢出写入失败的次数（失败时这部分日志丢失）
+        self.spill_failures = 0
+
+    def spill_path(self, job_id):
+        return os.path.join(self.spill_dir, f"{job_id}{SPILL_SUFFIX}")
+
+    def publish(self, entry, job_id=None):
+        stream = None
+        with self._cond:
+            self._append(self._global, entry)
+            if job_id:
+                stream = self._job_stream(job_id)
+                self._append(stream, entry)
+            self._cond.notify_all()
+        if stream is not None and len(stream.entries) > self.job_capacity:
+            self._spill(stream, keep=self.job_capacity - self.job_capacity // 2)
+
+    def _append(self, stream, entry):
+        if stream.spill_path is None:
+            # 全局流：deque 达到容量时自动丢弃最旧的日志
+            if len(stream.entries) == stream.entries.maxlen:
+                stream.base += 1
+            stream.entries.append(entry)
+            return
+        stream.entries.append(entry)
+
+    def _spill(self, stream, keep=0):
+        """
+        把任务流中除最新 keep 条以外的日志追加写入溢出文件（每次一个 gzip 分段），调用方不得持有总线锁
+
+        锁内只取出待写入的日志，写入在锁外进行；写入完成后才从内存移除并推进 base，
+        因此序号小于 base 的日志总是已经在文件中。
+        """
+        with stream.spill_lock:
+            with self._cond:
+                count = len(stream.entries) - keep
+                if count <= 0:
+                    return
+                batch = list(islice(stream.entries, count))
+            error = None
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with gzip.open(stream.spill_path, 'at', encoding='utf-8') as f:
+                    f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in batch)
+            except OSError as e:
+                error = e
+            with self._cond:
+                # 只有持有 spill_lock 的线程会移除日志，新日志只追加在右侧，最左侧的 count 条就是 batch
+                for _ in range(count):
+                    stream.entries.popleft()
+                stream.base += count
+                if error is not None:
+                    self.spill_failures += 1
+                self._cond.notify_all()
+        if error is not None:
+            # 写入失败时这部分日志丢失，但不影响任务与内存上限；不能经由 logger 输出（会重新进入总线）
+            sys.stderr.write(f"写入任务日志溢出文件失败: {str(error)}\n")
+
+    def _job_stream(self, job_id):
+        stream = self._jobs.get(job_id)
+        if stream is None:
+            stream = self._jobs[job_id] = LogStream(spill_path=self.spill_path(job_id))
+        return stream
+
+    def stream(self, job_id=None, create=True):
+        """
+        返回任务的日志流；job_id 为空时返回当前的全局流
+
+        任务已被淘汰时返回只读的回放流（已结束，全部日志在溢出文件中）；
+        未知任务在 create=False 时返回 None。
+        """
+        with self._cond:
+            if not job_id:
+                return self._global
+            stream = self._jobs.get(job_id)
+            if stream is not None:
+                return stream
+        spill_path = self.spill_path(job_id)
+        if os.path.exists(spill_path):
+            return LogStream(closed=True, spill_path=spill_path, base=_count_lines(spill_path))
+        if not create:
+            return None
+        with self._cond:
+            return self._job_stream(job_id)
+
+    def start_job(self, job_id):
+        """任务开始：没有其他运行中的任务时换新全局流，使不带 job_id 的订阅者只看到本轮任务的日志"""
+        with self._cond:
+            if not self._active:
+                self._global.closed = True
+                self._global = LogStream(self.global_capacity)
+            self._active.add(job_id)
+            self._job_stream(job_id)
+            self._cond.notify_all()
+
+    def close(self, job_id):
+        """任务结束的显式完成事件：关闭任务流（最后一个运行中的任务结束时同时关闭全局流）并唤醒订阅者"""
+        with self._cond:
+            self._job_stream(job_id).closed = True
+            self._active.discard(job_id)
+            if not self._active:
+                self._global.closed = True
+            self._cond.notify_all()
+
+    def suspend(self, job_id):
+        """任务被抢占并重新排队：任务流保持打开（订阅者继续等待后续日志），其余与 close 相同"""
+        with self._cond:
+            self._active.discard(job_id)
+            if not self._active:
+                self._global.closed = True
+            self._cond.notify_all()
+
+    def record_path(self, job_id):
+        return os.path.join(self.spill_dir, f"{job_id}{RECORD_SUFFIX}")
+
+    def evict(self, job_id, record=None):
+        """淘汰已结束任务：剩余日志写入溢出文件并从内存移除，任务记录（若提供）一并保存"""
+        if record is not None:
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with open(self.record_path(job_id), 'w', encoding='utf-8') as f:
+                    json.dump(record, f, ensure_ascii=False)
+            except (OSError, TypeError, ValueError) as e:
+                logger.debug(f"保存任务记录失败: {str(e)}")
+        with self._cond:
+            stream = self._jobs.get(job_id)
+            if stream is None:
+                return
+            stream.closed = True
+            self._cond.notify_all()
+        # 先在锁外写完溢出文件再移除任务流，之后的订阅从完整的溢出文件回放
+        self._spill(stream)
+        with self._cond:
+            if self._jobs.get(job_id) is stream:
+                del self._jobs[job_id]
+        self._collect_spill_files()
+
+    def load_record(self, job_id):
+        """读取已淘汰任务的记录，不存在时返回 None"""
+        try:
+            with open(self.record_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _collect_spill_files(self):
+        """溢出文件超过保留数量时删除最旧的文件及其任务记录（不删除内存中仍在使用的任务）"""
+        if not self.spill_retention:
+            return
+        try:
+            entries = [
+                entry for entry in os.scandir(self.spill_dir)
+                if entry.is_file() and entry.name.endswith(SPILL_SUFFIX)
+            ]
+        except OSError:
+            return
+        if len(entries) <= self.spill_retention:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        with self._cond:
+            live = set(self._jobs)
+        for entry in entries[self.spill_retention:]:
+            if entry.name[:-len(SPILL_SUFFIX)] in live:
+                continue
+            for path in (entry.path, self.record_path(entry.name[:-len(SPILL_SUFFIX)])):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def snapshot(self, job_id):
+        """返回任务当前的全部日志（包括已写入溢出文件的部分）"""
+        with self._cond:
+            stream = self._jobs.get(job_id)
+            if stream is None:
+                return []
+            base, entries = stream.base, list(stream.entries)
+        return (_read_spilled(stream.spill_path, 0, base) if base else []) + entries
+
+    def wait(self, stream, cursor, timeout=HEARTBEAT_SECONDS):
+        """
+        等待游标之后的新日志
+
+        游标早于内存中最旧的日志时，任务流从溢出文件补读，全局流跳过已丢弃的部分。
+
+        Returns:
+            tuple: (新日志列表, 新游标, 流是否已结束且已读完)
+        """
+        with self._cond:
+            if stream.total <= cursor and not stream.closed:
+                self._cond.wait_for(lambda: stream.total > cursor or stream.closed, timeout)
+            if cursor >= stream.base or stream.spill_path is None:
+                cursor = max(cursor, stream.base)
+                new_entries = list(islice(stream.entries, cursor - stream.base, None))
+                cursor += len(new_entries)
+                return new_entries, cursor, stream.closed and cursor >= stream.total
+            spilled_until = stream.base
+
+        # 溢出文件只追加，序号小于 spilled_until 的日志都已完整写入，可在锁外读取
+        new_entries = _read_spilled(stream.spill_path, cursor, spilled_until)
+        # 读取失败时跳过这一段，避免订阅者原地重试
+        cursor = spilled_until
+        with self._cond:
+            return new_entries, cursor, stream.closed and cursor >= stream.total
+
+
+def _read_spilled(path, start, stop):
+    entries = []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in islice(f, start, stop):
+                entries.append(json.loads(line))
+    except (OSError, EOFError, ValueError) as e:
+        # 末尾可能是正在写入的分段，已读到的部分仍然有效
+        logger.debug(f"读取任务日志溢出文件失败: {str(e)}")
+    return entries
+
+
+def _count_lines(path):
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return sum(1 for _ in f)
+    except (OSError, EOFError):
+        return 0
+
+
+# 进程级共享总线
+shared_bus = LogBus(
+    config.LOG_BUFFER_PER_JOB,
+    config.LOG_BUFFER_GLOBAL,
+    config.LOG_SPILL_DIR,
+    config.LOG_SPILL_RETENTION,
+)
@@ -3,11 +3,24 @@ import pandas as pd
 import logging
 from datetime import datetime
 import config
+import tail_index
+import merge_engine
+import series_store
+import series_npy
+import derived_metrics
+import source_cache
+import cancellation
+import checkpoints
+import workbook_etag
+import snapshots
+import archive
+import shards
+import sheet_writers
+import ingest
+from workbook_cache import shared_cache as workbook_cache, file_identity
 from bs4 import BeautifulSoup
 import time
 import random
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment
 from openpyxl import Workbook
 import zipfile
 
@@ -182,8 +195,9 @@ def retry_on_timeout(func):
                 if retry_count >= max_retries:
                     logger.error(f"{func.__name__} 已达到最大重试次数({max_retries})，放弃尝试")
                     return None
-                # 每次重试增加等待时间
-                time.sleep(2 * retry_count)
+                # 每次重试增加等待时间（任务被取消时立即放弃）
+                if cancellation.pause(getattr(args[0], 'cancel_token', None) if args else None, 2 * retry_count):
+                    return None
             except Exception as e:
                 log_error(f"{func.__name__} 发生错误", e, show_traceback=False)
                 return None
@@ -194,6 +208,51 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 logging.getLogger('selenium').setLevel(logging.WARNING)
 logging.getLogger('webdriver_manager').setLevel(logging.WARNING)
 
+# 数据源分组：可在 /api/update?sources= 与命令行 --sources 中代替具体的数据源名
+SOURCE_GROUPS = {
+    'currency': lambda: list(config.CURRENCY_PAIRS),
+    'daily': lambda: list(config.DAILY_DATA_PAIRS),
+    'monthly': lambda: list(config.MONTHLY_DATA_PAIRS),
+}
+
+
+def all_sources():
+    """全部数据源（工作表名），即一次完整爬取覆盖的范围"""
+    return [name for group in SOURCE_GROUPS.values() for name in group()]
+
+
+def resolve_sources(spec):
+    """
+    将数据源列表（逗号分隔的字符串或列表，元素为数据源名或分组名）解析为数据源名列表
+
+    顺序与完整爬取的顺序一致；spec 为空时返回全部数据源。
+
+    Raises:
+        ValueError: 包含未知的数据源或分组
+    """
+    if isinstance(spec, str):
+        spec = spec.split(',')
+    names = [name.strip() for name in (spec or []) if name and name.strip()]
+    if not names:
+        return all_sources()
+
+    known = all_sources()
+    lookup = {name.lower(): name for name in known}
+    wanted = set()
+    unknown = []
+    for name in names:
+        group = SOURCE_GROUPS.get(name.lower())
+        if group is not None:
+            wanted.update(group())
+        elif name.lower() in lookup:
+            wanted.add(lookup[name.lower()])
+        else:
+            unknown.append(name)
+    if unknown:
+        raise ValueError(f"未知的数据源: {', '.join(unknown)}（可用分组: {', '.join(SOURCE_GROUPS)}）")
+    return [name for name in known if name in wanted]
+
+
 # 创建一个统计对象来跟踪成功和失败的爬取
 class CrawlStats:
     """爬取统计信息类，用于记录爬取成功、失败和跳过的数据"""
@@ -270,6 +329,13 @@ class MarketDataAnalyzer:
         # 在多线程环境中不使用信号处理
         # 因为信号处理只能在主线程中使用
 
+        # 是否使用按数据源缓存的爬取结果（强制更新时关闭）
+        self.use_source_cache = config.SOURCE_CACHE_ENABLED
+        # 取消令牌：由任务队列替换为任务自己的令牌，取消时在数据源之间与写入之前退出
+        self.cancel_token = cancellation.CancelToken()
+        # 检查点日志中的任务编号（由任务队列设置为 job_id；命令行运行时自动生成）
+        self.job_id = None
+
         # 单例模式，保存实例引用
         MarketDataAnalyzer._instance = self
 
@@ -477,113 +543,46 @@ class MarketDataAnalyzer:
         return random.choice(user_agents)
 
 
-    def format_exchange_rate_date(self,raw_date):
-        # 兼容多种日期格式（中文和常见分隔符）
-        text = str(raw_date).strip()
-        candidates = [
-            "%Y年%m月%d日",   # 2025年09月15日
-            "%Y/%m/%d",      # 2025/09/15
-            "%Y-%m-%d",      # 2025-09-15
-            "%m月 %d, %Y",   # 09月 15, 2025（历史实现）
-            "%b %d, %Y",     # Sep 15, 2025（英文缩写）
-            "%B %d, %Y",     # September 15, 2025（英文全称）
-        ]
-
-        dt = None
-        for fmt in candidates:
-            try:
-                dt = datetime.strptime(text, fmt)
-                break
-            except ValueError:
-                continue
+    @staticmethod
+    def _format_output_date(dt):
+        """统一的输出日期文本：YYYY/M/DD（与历史写入格式一致，跨平台无需区分strftime标志）"""
+        return f"{dt.year}/{dt.month}/{dt.day:02d}"
 
-        if dt is None:
+    def format_exchange_rate_date(self,raw_date):
+        # 兼容多种日期格式（中文和常见分隔符），解析结果带缓存
+        try:
+            dt = ingest.parse_any_date(str(raw_date))
+        except ValueError:
             logger.debug(f"无法解析汇率日期: '{raw_date}'，未匹配的格式。")
             raise ValueError(f"无法解析日期: {raw_date}")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(dt)
 
     def format_stee_price_date(self,raw_date):
-        # 解析中文月份
-        dt = datetime.strptime(raw_date, "%Y/%m/%d")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(ingest.parse_date(raw_date, "%Y/%m/%d"))
 
     def format_shibor_rate_date(self,raw_date):
-        # 解析中文月份
-        dt = datetime.strptime(raw_date, "%Y-%m-%d")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(ingest.parse_date(raw_date, "%Y-%m-%d"))
 
     def format_sofr_date(self, raw_date):
-        # 获取当前年份
-        current_year = datetime.now().year
-        # 拼接年份、月份和日期
-        full_date_str = f"{current_year}/{raw_date}"
-
+        # 页面只给出月/日，拼接当前年份
+        full_date_str = f"{datetime.now().year}/{raw_date}"
         try:
-            # 解析日期字符串为 datetime 对象
-            dt = datetime.strptime(full_date_str, "%Y/%m/%d")
-            # 判断操作系统
-            if platform.system() == "Windows":
-                return dt.strftime("%Y/%#m/%d")
-            else:  # Linux/macOS
-                return dt.strftime("%Y/%-m/%d")
+            return self._format_output_date(ingest.parse_date(full_date_str, "%Y/%m/%d"))
         except ValueError:
             print(f"日期解析失败，输入的日期 {raw_date} 格式可能不正确。")
             return None
 
     def format_ester_date(self, raw_date):
-        # 解析中文月份
-        dt = datetime.strptime(raw_date, "%m/%d/%Y")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(ingest.parse_date(raw_date, "%m/%d/%Y"))
 
     def format_jpy_rate_date(self, raw_date):
-        # 解析中文月份
-        dt = datetime.strptime(raw_date, "%m-%d-%Y")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(ingest.parse_date(raw_date, "%m-%d-%Y"))
 
     def format_lpr_date(self, raw_date):
-        # 解析中文月份
-        dt = datetime.strptime(raw_date, "%Y-%m-%d")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(ingest.parse_date(raw_date, "%Y-%m-%d"))
 
     def format_us_interest_rate_date(self, raw_date):
-        # 解析中文月份
-        dt = datetime.strptime(raw_date, "%Y-%m-%d")
-
-        # 判断操作系统
-        if platform.system() == "Windows":
-            return dt.strftime("%Y/%#m/%d")
-        else:  # Linux/macOS
-            return dt.strftime("%Y/%-m/%d")
+        return self._format_output_date(ingest.parse_date(raw_date, "%Y-%m-%d"))
 
     @log_execution_time
     @retry_on_timeout
@@ -705,12 +704,19 @@ class MarketDataAnalyzer:
 
     def find_last_row(self, sheet):
         """
-        改进的查找最后一行方法：逆向查找第一个非空行
+        查找最后一行：优先使用尾部索引（O(1)），并用行哈希校验索引与内存中的工作表一致；
+        索引缺失或不一致时回退为逆向查找第一个非空行
         """
-        for row in reversed(range(1, sheet.max_row + 1)):
-            if any(cell.value for cell in sheet[row]):
-                return row
-        return 1  # 如果全为空，从第一行开始
+        return tail_index.locate_last_row(sheet, getattr(self, '_tail_index', None))
+
+    def _columns_for(self, sheet_name):
+        """返回工作表对应的列定义（取自编译后的写入计划）"""
+        return sheet_writers.compile_plan(sheet_name).columns
+
+    def _note_written_row(self, sheet_name, row_num):
+        """记录本次写入到各工作表的最大行号，用于保存后更新尾部索引"""
+        written = self.__dict__.setdefault('_written_tails', {})
+        written[sheet_name] = max(written.get(sheet_name, 0), row_num)
 
     def write_monthly_data(self, worksheet, data, row):
         """
@@ -724,248 +730,385 @@ class MarketDataAnalyzer:
         # 获取工作表名称
         sheet_name = worksheet.title
 
-        # 获取该工作表对应的列定义
-        if sheet_name in config.COLUMN_DEFINITIONS:
-            columns = config.COLUMN_DEFINITIONS[sheet_name]
-        else:
-            logger.warning(f"未找到 {sheet_name} 的列定义，使用默认列")
-            columns = ['日期']
-
-        # 写入数据
-        for col_idx, col_name in enumerate(columns, 1):
-            value = data.get(col_name, '')
-            cell = worksheet.cell(row=row, column=col_idx, value=value)
-            if sheet_name == 'Import and Export' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'Money Supply' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'PPI' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'CPI' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'PMI' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'New Bank Loan Addition' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'US Interest Rate' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            else:
-                cell.alignment = Alignment(horizontal='right')
+        # 通过编译后的写入计划写入数据
+        self._note_written_row(sheet_name, row)
+        sheet_writers.compile_plan(sheet_name).write_row(worksheet, row, data)
 
         logger.info(f"已在 {sheet_name} 的第 {row} 行写入月度数据")
 
-    def write_daily_data(self, worksheet, data, last_row, sheet_name):
+    def plan_sheet_merge(self, worksheet, sheet_name, records):
         """
-        写入日频数据到Excel
+        合并引擎：把工作表最后 W 行载入为日期键映射，与爬取记录做一次哈希连接
 
         Args:
             worksheet: Excel工作表对象
-            data: 包含数据的列表（通常有多行）
-            last_row: 最后一行的行号
             sheet_name: 工作表名称
+            records: 爬取到的记录列表
 
         Returns:
-            bool: 是否更新了数据
+            merge_engine.ChangeSet: 新增、原地修订、未变化的记录
         """
-        # 检查数据是否为空
-        if not data or len(data) < 1:
-            logger.error(f"{sheet_name}: 数据不足，无法写入")
-            return False
+        last_row = self.find_last_row(worksheet)
+        window = merge_engine.window_from_sheet(worksheet, last_row, sheet_name)
+        return merge_engine.plan_merge(sheet_name, window, records, self._columns_for(sheet_name))
 
-        # 获取最新数据的日期
-        new_date_str = data[0].get("日期", "")
-        if not new_date_str:
-            logger.error(f"{sheet_name}: 数据中缺少日期字段")
-            return False
+    def apply_change_set(self, worksheet, change_set):
+        """
+        只写入变更集中的行：修订行原地覆盖，新增行从末尾开始批量追加
+
+        Args:
+            worksheet: Excel工作表对象
+            change_set: merge_engine.ChangeSet
+        """
+        sheet_name = change_set.sheet_name
+        is_monthly = sheet_name in config.MONTHLY_DATA_PAIRS
+
+        for row_num, record in change_set.updates:
+            if is_monthly:
+                self.write_monthly_data(worksheet, record, row_num)
+            else:
+                self.write_single_daily_row(worksheet, record, row_num, sheet_name)
+            logger.info(f"{sheet_name}: {record.get('日期', '')} 的数据已修订，已更新第 {row_num} 行")
+
+        if not change_set.inserts:
+            return
+        if is_monthly:
+            for row_num, record in change_set.inserts:
+                self.write_monthly_data(worksheet, record, row_num)
+        else:
+            records = [record for _, record in change_set.inserts]
+            self.write_daily_rows(worksheet, records, change_set.inserts[0][0], sheet_name)
 
-        # 获取最后一行的日期值
-        last_date_value = worksheet.cell(row=last_row, column=1).value
+    def write_single_daily_row(self, worksheet, row_data, row_num, sheet_name):
+        """
+        写入单行日频数据
+
+        Args:
+            worksheet: Excel工作表对象
+            row_data: 单行数据字典
+            row_num: 要写入的行号
+            sheet_name: 工作表名称
+        """
+        self._note_written_row(sheet_name, row_num)
+        sheet_writers.compile_plan(sheet_name).write_row(worksheet, row_num, row_data)
+
+    def write_daily_rows(self, worksheet, rows, start_row, sheet_name):
+        """
+        通过编译后的写入计划，从 start_row 开始连续批量写入多行日频数据
 
-        # 解析现有日期和新日期为datetime对象，用于比较
-        new_date_obj = None
-        last_date_obj = None
+        Args:
+            worksheet: Excel工作表对象
+            rows: 按写入顺序（从旧到新）排列的数据字典列表
+            start_row: 第一行的行号
+            sheet_name: 工作表名称
+        """
+        if not rows:
+            return
+        last_written = sheet_writers.compile_plan(sheet_name).write_rows(worksheet, start_row, rows)
+        self._note_written_row(sheet_name, last_written)
+        logger.debug(f"{sheet_name}: 已在第 {start_row}-{last_written} 行插入新数据（{len(rows)} 条）")
+
+    def _commit_tail_index(self, wb):
+        """保存后将本次写入的各工作表尾部写回索引，并以新文件签名盖章"""
+        index = getattr(self, '_tail_index', None)
+        if index is None:
+            return
+        try:
+            archived = getattr(self, '_archived_rows', {})
+            for sheet_name in set(self._written_tails) | set(archived):
+                ws = wb[sheet_name]
+                previous = index.peek(sheet_name)
+                row_num = self._written_tails.get(sheet_name, 0)
+                last_row = max(row_num, previous['last_row']) if previous else row_num
+                if sheet_name in archived:
+                    # 归档删除了表头之后的若干行，尾部行号随之前移
+                    last_row = last_row - archived[sheet_name] if last_row else self.find_last_row(ws)
+                    last_row = max(1, last_row)
+                window = merge_engine.sheet_window_rows(ws, last_row)
+                index.set(sheet_name, last_row, [cell.value for cell in ws[last_row]], window)
+            index.commit()
+        except Exception as e:
+            logger.warning(f"更新尾部索引失败: {str(e)}")
 
-        # 解析新日期为datetime对象
+    def _log_summary(self, stats):
+        """打印统计摘要，并以 SUMMARY_START/SUMMARY_END 标记输出（前端据此收集并在收到 SHOW_SUMMARY 时显示）"""
+        summary_text = stats.print_summary()
+        try:
+            logger.info("SUMMARY_START")
+            for line in summary_text.splitlines():
+                if line.strip():
+                    logger.info(line)
+            logger.info("SUMMARY_END")
+        except Exception:
+            # 回退：直接输出文本
+            logger.info(summary_text)
+        return summary_text
+
+    def _cached_result(self, source):
+        """返回数据源仍然新鲜的缓存结果；未启用缓存或已过期时返回 None"""
+        if not self.use_source_cache:
+            return None
         try:
-            if '/' in new_date_str:
-                year, month, day = map(int, new_date_str.split('/'))
-                new_date_obj = datetime(year, month, day)
-            elif '-' in new_date_str:
-                year, month, day = map(int, new_date_str.split('-'))
-                new_date_obj = datetime(year, month, day)
+            return source_cache.get_cache().get(source)
         except Exception as e:
-            logger.warning(f"{sheet_name}: 解析新日期 '{new_date_str}' 失败: {str(e)}")
+            logger.warning(f"读取数据源缓存失败 {source}: {str(e)}")
+            return None
 
+    def _cache_result(self, source, data):
+        """缓存爬取成功的结果（有效期由数据源的发布节奏决定）"""
+        try:
+            ttl = source_cache.get_cache().put(source, data)
+            logger.debug(f"已缓存 {source} 的爬取结果，有效期 {source_cache.describe_ttl(ttl)}")
+        except Exception as e:
+            logger.warning(f"写入数据源缓存失败 {source}: {str(e)}")
+
+    def _begin_checkpoint(self, sources, retry_of=None):
+        """开始本次任务的检查点日志（命令行运行时生成编号并提示如何重试）"""
+        if self.job_id is None:
+            import uuid
+            self.job_id = uuid.uuid4().hex
+            logger.info(f"📒 本次任务的检查点编号: {self.job_id}（部分失败时可用 --retry-failed {self.job_id} 只重试失败的数据源）")
+        try:
+            checkpoints.get_journal().begin(self.job_id, sources, retry_of=retry_of)
+        except Exception as e:
+            logger.warning(f"初始化检查点日志失败，本次任务不记录检查点: {str(e)}")
 
-        # 解析现有日期
-        if isinstance(last_date_value, datetime):
-            last_date_obj = last_date_value
-        else:
-            try:
-                if last_date_value:
-                    if sheet_name == 'SOFR':
-                        month, day, year = map(int, str(last_date_value).split('/'))
-                        last_date_obj = datetime(year, month, day)
-                    elif sheet_name == 'Shibor':
-                        year, month, day = map(int, str(last_date_value).split('-'))
-                        last_date_obj = datetime(year, month, day)
-                    else:
-                        year, month, day = map(int, str(last_date_value).split('/'))
-                        last_date_obj = datetime(year, month, day)
-            except Exception as e:
-                logger.warning(
-                    f"{sheet_name}: 解析最后一行日期 '{last_date_value}' 失败: {str(e)}"
-                    f"last_date_value 的值是: {last_date_value}，类型是: {type(last_date_value)} "
-                )
+    def _checkpoint(self, source, results, stats):
+        """数据源结果一到达即写入检查点日志（成功的结果或失败原因）"""
+        try:
+            if source in results:
+                checkpoints.get_journal().record_success(self.job_id, source, results[source])
+            elif source in stats.failure:
+                checkpoints.get_journal().record_failure(self.job_id, source, stats.failure[source])
+        except Exception as e:
+            logger.warning(f"写入检查点失败 {source}: {str(e)}")
 
-        if new_date_obj is None or last_date_obj is None:
-            # 若有日期对象为 None，则记录警告信息
-            logger.warning(
-                f"{sheet_name}: 日期对象比较失败，请重试后不行联系管理员。"
-                f"last_date_value 的值是: {last_date_value}，类型是: {type(last_date_value)} "
-                f"new_date_str 的值是: {new_date_str}，类型是: {type(new_date_str)}"
-            )
-        # 若两个日期对象都不为 None，则比较日期
-        elif new_date_obj.date() == last_date_obj.date():
-            # 若日期相同，则记录调试信息并返回 False
-            logger.debug(
-                f"{sheet_name}: 日期对象比较相同 ({new_date_obj.date()} == {last_date_obj.date()})，数据已是最新，无需更新"
+    def _sync_store(self, excel_path, results):
+        """
+        将爬取结果以单个事务写入 SQLite 存储（空表先从Excel回填），
+        返回用于渲染Excel的记录：各工作表在数据库中按日期升序的最后 W 行。
+        数据库不可用时回退为直接使用爬取结果。
+        """
+        try:
+            store = series_store.get_store()
+            store.backfill_from_workbook(
+                archive.archive_paths(excel_path) + [excel_path],
+                [name for name, data in results.items() if data],
             )
-            return False
-
-        # 在数据列表中查找最后一行日期的位置
-        last_date_index = -1
+            self.store_deltas = store.write_results(results)
+            changed = [delta for delta in self.store_deltas.values() if delta]
+            if changed:
+                described = ', '.join(f"{delta.sheet_name}({delta.describe()})" for delta in changed)
+                logger.info(f"🗄️ 数据库已更新（数据集版本 {changed[0].version}）: {described}")
+            else:
+                logger.info("🗄️ 数据库比对：爬取数据与数据库中的记录一致")
+            self._export_npy(store, results)
+            if config.DERIVED_METRICS_ENABLED:
+                self._update_derived(store)
+            return {
+                name: store.tail(name, config.MERGE_WINDOW_ROWS) if data else data
+                for name, data in results.items()
+            }
+        except Exception as e:
+            logger.warning(f"写入数据库失败，直接使用爬取结果更新Excel: {str(e)}")
+            self.store_deltas = {}
+            return results
 
-        # 使用datetime对象比较查找
-        if last_date_obj:
-            for i, item in enumerate(data):
-                item_date_str = item.get("日期", "")
-                try:
-                    if '/' in item_date_str:
-                        year, month, day = map(int, item_date_str.split('/'))
-                        item_date = datetime(year, month, day)
-                    elif '-' in item_date_str:
-                        year, month, day = map(int, item_date_str.split('-'))
-                        item_date = datetime(year, month, day)
-                    else:
-                        continue
+    def _export_npy(self, store, results):
+        """重写发生变化（或尚未导出）的工作表的 .npy 文件，失败不影响Excel更新"""
+        try:
+            changed = [name for name, delta in self.store_deltas.items() if delta]
+            missing = series_npy.stale_sheets([name for name, data in results.items() if data])
+            series_npy.export_sheets(store, list(dict.fromkeys(changed + missing)))
+        except Exception as e:
+            logger.warning(f"导出NumPy时间序列文件失败: {str(e)}")
 
-                    if item_date.date() == last_date_obj.date():
-                        logger.debug(f"{sheet_name}: 找到最后一行日期(对象比较): {item_date} 在索引 {i} 即将插入{i}个新数据 刷新最后一行数据")
-                        last_date_index = i
-                        break
-                except Exception as e:
-                    logger.debug(f"{sheet_name}: 解析日期 '{item_date_str}' 失败: {str(e)}")
-                    continue
+    def _update_derived(self, store):
+        """增量更新派生指标，失败不影响Excel更新"""
+        try:
+            derived_metrics.update_metrics(store, self.store_deltas)
+        except Exception as e:
+            logger.warning(f"更新派生指标失败: {str(e)}")
+
+    def _update_shards(self, excel_path, render_sources, results, stats):
+        """分片布局下的写入：每个工作表的分片独立加锁并行写入，不触碰合并的Excel文件"""
+        self.change_sets = {}
+        shards.split_workbook(excel_path, [name for name, data in render_sources.items() if data])
+        outcomes = shards.write_sheets(render_sources)
+
+        updated_sheets = []
+        for sheet_name, data in render_sources.items():
+            if not data:
+                stats.add_skipped(sheet_name, "数据为空")
+                continue
+            outcome = outcomes.get(sheet_name)
+            if outcome is None:
+                stats.add_skipped(sheet_name, "工作表不存在")
+                logger.warning(f"⚠️ 工作表 {sheet_name} 不存在，跳过更新")
+            elif isinstance(outcome, Exception):
+                stats.add_failure(sheet_name, f"写入分片失败: {str(outcome)}")
+                logger.error(f"❌ 写入分片 {sheet_name} 失败: {str(outcome)}")
+            elif outcome:
+                self.change_sets[sheet_name] = outcome
+                updated_sheets.append(sheet_name)
+                logger.info(f"📝 更新 {sheet_name}: {outcome.describe()}")
+            else:
+                self.change_sets[sheet_name] = outcome
+                logger.info(f"✓ {sheet_name} 数据已是最新")
 
-        # 如果找到了最后一行日期
-        if last_date_index != -1:
-            # 用找到的数据覆盖最后一行
-            self.write_single_daily_row(worksheet, data[last_date_index], last_row, sheet_name)
-            logger.debug(f"{sheet_name}: 已更新第 {last_row} 行数据")
+        logger.info("=" * 50)
+        self._log_summary(stats)
+        if updated_sheets:
+            logger.info(f"📝 已更新以下工作表: {', '.join(updated_sheets)}")
+        else:
+            logger.info("ℹ️ 所有工作表数据均已是最新，Excel文件未做修改")
+        # 分片锁已在各自写入完成时释放
+        logger.info("EXCEL_UNLOCKED")
+        if updated_sheets:
+            # 在任务线程中组装合并文件，下载请求直接命中组装结果；失败时由下载接口再次组装
+            try:
+                shards.assemble(excel_path)
+            except Exception as e:
+                logger.warning(f"组装合并Excel文件失败，将在下载时重试: {str(e)}")
+        return results
 
-            # 将最后一行日期之前的数据倒序插入
-            for i in range(last_date_index - 1, -1, -1):
-                # 插入新行
-                target_row = last_row + (last_date_index - i)
-                self.write_single_daily_row(worksheet, data[i], target_row, sheet_name)
-                logger.debug(f"{sheet_name}: 已在第 {target_row} 行插入新数据")
+    def _load_for_diff(self, excel_path):
+        """
+        不加锁读取用于比对的工作簿（优先使用进程级缓存），并确保尾部索引有效
 
-            return True
-        else:
-            # 如果没找到最后一行日期，记录日志
-            logger.warning(f"{sheet_name}: 爬取的最新数据并没有匹配上现有数据，无法更新.现有数据{data}，最后一行日期{last_date_obj}")
-            # 进一步处理：视为长期未更新，将现有数据倒序追加到Excel
+        Returns:
+            (workbook, 读取前的文件标识)，用于加锁后判断是否有其他写入者
+        """
+        identity = file_identity(excel_path)
+        if self._tail_index is not None:
+            # 尾部索引：失效时以read_only流式模式惰性重建，供find_last_row常数时间查找
             try:
-                logger.warning(f"{sheet_name}: 未找到匹配日期，判定为长期未更新。将倒序追加 {len(data)} 条数据到Excel")
-                # 从最旧到最新写入：因为data[0]通常是最新，因此倒序遍历
-                for idx in range(len(data) - 1, -1, -1):
-                    target_row = last_row + (len(data) - idx)
-                    self.write_single_daily_row(worksheet, data[idx], target_row, sheet_name)
-                    logger.debug(f"{sheet_name}: 倒序追加 —— 已在第 {target_row} 行写入索引 {idx} 的数据")
-                return True
+                self._tail_index.refresh()
             except Exception as e:
-                logger.error(f"{sheet_name}: 倒序追加写入失败: {str(e)}")
-                return False
+                logger.warning(f"尾部索引重建失败，将回退为逐行查找: {str(e)}")
+                self._tail_index = None
+        return workbook_cache.checkout(excel_path), identity
 
-    def write_single_daily_row(self, worksheet, row_data, row_num, sheet_name):
+    def _plan_workbook(self, wb, render_sources):
         """
-        写入单行日频数据
+        计算所有工作表的变更集（只读，不修改工作簿）
 
-        Args:
-            worksheet: Excel工作表对象
-            row_data: 单行数据字典
-            row_num: 要写入的行号
-            sheet_name: 工作表名称
+        Returns:
+            (planned, skipped): [(sheet_name, ChangeSet)] 与 [(sheet_name, 跳过原因)]
         """
-        # 获取该工作表对应的列定义
-        if sheet_name in config.COLUMN_DEFINITIONS:
-            columns = config.COLUMN_DEFINITIONS[sheet_name]
-        elif sheet_name in config.CURRENCY_PAIRS:
-            # 汇率数据使用通用列定义
-            if sheet_name == 'USD 10Y':
-                columns = config.COLUMN_DEFINITIONS['USD 10Y']
-            else:
-                columns = config.COLUMN_DEFINITIONS['CURRENCY']
-        else:
-            logger.warning(f"未找到 {sheet_name} 的列定义，使用默认列")
-            columns = ['日期']
-
-        # 写入数据
-        for col_idx, col_name in enumerate(columns, 1):
-            value = row_data.get(col_name, '')
-            if sheet_name == 'Shibor' and col_idx == 1:
-                value_dt = datetime.strptime(value, '%Y/%m/%d')
-                if isinstance(value_dt, datetime):
-                    value = value_dt.strftime('%Y-%m-%d')
-            if sheet_name == 'SOFR' and col_idx == 1:
-                value_dt = datetime.strptime(value, '%Y/%m/%d')
-                if isinstance(value_dt, datetime):
-                    value = value_dt.strftime('%m/%d/%Y')
-                    # 去掉月份和日期的前导零
-                    month, day, year = value.split('/')
-                    month = month.lstrip('0') if month.startswith('0') and len(month) > 1 else month
-                    day = day.lstrip('0') if day.startswith('0') and len(day) > 1 else day
-                    value = f"{month}/{day}/{year}"
-            cell = worksheet.cell(row=row_num, column=col_idx, value=value)
-            if sheet_name == 'Shibor':
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'SOFR' and col_idx == 1:
-                cell.alignment = Alignment(horizontal='left')
-            elif sheet_name == 'SOFR' and col_idx == 2:
-                cell.alignment = Alignment(horizontal='left')
+        planned, skipped = [], []
+        for sheet_name, data in render_sources.items():
+            if not data:
+                skipped.append((sheet_name, "数据为空"))
+            elif sheet_name not in wb.sheetnames:
+                skipped.append((sheet_name, "工作表不存在"))
             else:
-                cell.alignment = Alignment(horizontal='right')
+                # 合并引擎：与最后 W 行按日期键连接
+                planned.append((sheet_name, self.plan_sheet_merge(wb[sheet_name], sheet_name, data)))
+        return planned, skipped
+
+    def _sheets_needing_write(self, results, stats):
+        """
+        加锁前的尾部比对（快速路径）
 
-    def update_excel(self):
+        使用尾部索引（必要时以 read_only 模式重建，不加锁）中保存的最后 W 行窗口，
+        以与写入路径相同的合并引擎判定变更，返回确实存在新增或修订数据的工作表列表。
+        索引不可用时返回 None，表示需要走完整写入流程。
+        """
+        try:
+            tails = self._tail_index.refresh()
+        except Exception as e:
+            logger.warning(f"尾部索引不可用，跳过快速比对: {str(e)}")
+            return None
+
+        pending = []
+        for sheet_name, data in results.items():
+            if not data:
+                stats.add_skipped(sheet_name, "数据为空")
+                continue
+            entry = tails.get(sheet_name)
+            if entry is None:
+                stats.add_skipped(sheet_name, "工作表不存在")
+                continue
+
+            window = merge_engine.window_from_index(entry)
+            if merge_engine.plan_merge(sheet_name, window, data, self._columns_for(sheet_name)):
+                pending.append(sheet_name)
+
+        if pending:
+            logger.info(f"🔍 尾部索引比对：{len(pending)} 个工作表有新增或修订数据: {', '.join(pending)}")
+        return pending
+
+    def _acquire_file_lock(self, lock_fd, poll_seconds=0.2):
+        """获取Excel文件锁（排他）；等待其他写入者期间可被取消"""
+        while True:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if self.cancel_token.wait(poll_seconds):
+                    self.cancel_token.check()
+
+    def update_excel(self, sources=None, retry_failed=None):
         """
         更新现有Excel文件，追加数据到对应sheet的最后一行（顺序执行，单一WebDriver）
         统一复用一个禁用JS的WebDriver，限制进程数量，降低系统负载；
-        设置全局超时（默认5分钟）并在超时时强制清理Chrome进程。
+        设置全局超时（默认5分钟），超时时关闭本任务的WebDriver。
+
+        Args:
+            sources: 只更新这些数据源（数据源名或分组名，见 resolve_sources），默认全部；
+                     其他工作表既不爬取也不写入
+            retry_failed: 重试该任务（job_id）：只重新爬取其失败或未完成的数据源，
+                          与其已成功的结果（检查点日志）合并后写入；指定时忽略 sources
+
+        Raises:
+            cancellation.JobCancelled: cancel_token 被取消时（在数据源之间或写入之前退出，WebDriver 与文件锁已释放）
         """
         stats = CrawlStats()  # 创建统计对象
+        lock_fd = None
+        lock_acquired_at = None
 
         try:
             results = {}
             import gc
             import subprocess
-            import time as _time
             # 信号处理与总超时控制
             try:
                 import signal
             except Exception:
                 signal = None
 
+            # 本次要更新的数据源
+            if retry_failed:
+                recovered, pending, requested = checkpoints.get_journal().retry_plan(retry_failed)
+                selected = set(pending)
+                results.update(recovered)
+                for name in requested:
+                    if name in recovered:
+                        stats.add_success(name)
+            else:
+                selected = set(resolve_sources(sources))
+                requested = [name for name in all_sources() if name in selected]
+            self._begin_checkpoint(requested, retry_of=retry_failed)
+            currency_pairs = {k: v for k, v in config.CURRENCY_PAIRS.items() if k in selected}
+            daily_pairs = {k: v for k, v in config.DAILY_DATA_PAIRS.items() if k in selected}
+            monthly_pairs = {k: v for k, v in config.MONTHLY_DATA_PAIRS.items() if k in selected}
+
             # 计算总任务数并初始化进度
-            total_tasks = len(config.CURRENCY_PAIRS) + len(config.DAILY_DATA_PAIRS) + len(config.MONTHLY_DATA_PAIRS)
+            total_tasks = len(currency_pairs) + len(daily_pairs) + len(monthly_pairs)
             completed_tasks = 0
 
             logger.info("=" * 50)
             logger.info("🚀 开始数据爬取任务（顺序执行，单一WebDriver）")
             logger.info("=" * 50)
-            logger.info(f"📊 汇率数据: {len(config.CURRENCY_PAIRS)} 项")
-            logger.info(f"📈 日频数据: {len(config.DAILY_DATA_PAIRS)} 项")
-            logger.info(f"📅 月度数据: {len(config.MONTHLY_DATA_PAIRS)} 项")
+            if retry_failed:
+                logger.info(f"📒 从任务 {retry_failed} 的检查点恢复 {len(results)} 个数据源的结果")
+                logger.info(f"🔁 只重新爬取失败或未完成的数据源: {', '.join(pending) or '无（直接重新写入）'}")
+            elif sources and len(selected) < len(all_sources()):
+                logger.info(f"🎯 部分更新，仅处理: {', '.join(name for name in all_sources() if name in selected)}")
+            logger.info(f"📊 汇率数据: {len(currency_pairs)} 项")
+            logger.info(f"📈 日频数据: {len(daily_pairs)} 项")
+            logger.info(f"📅 月度数据: {len(monthly_pairs)} 项")
             logger.info(f"🔄 总任务数: {total_tasks} 项")
             logger.info("=" * 50)
 
@@ -1010,88 +1153,138 @@ class MarketDataAnalyzer:
             def _timed_out():
                 return time.time() > deadline
 
+            # 使用缓存结果（未过期）而跳过爬取的数据源
+            cached_sources = []
+
             # 1) 汇率数据（顺序）
             logger.info("开始爬取汇率数据（顺序执行）...")
-            for pair, url in config.CURRENCY_PAIRS.items():
+            for pair, url in currency_pairs.items():
+                self.cancel_token.check()
                 if _timed_out():
-                    logger.error("任务超时，强制kill Chrome")
-                    try:
-                        subprocess.run(["pkill", "-f", "chrome"], check=False)
-                    except Exception:
-                        pass
+                    # 只关闭本任务的WebDriver，不影响其他任务的浏览器
+                    logger.error("任务超时，关闭本任务的WebDriver")
+                    self.close_driver('default')
                     break
+                cached = self._cached_result(pair)
+                if cached:
+                    results[pair] = cached
+                    stats.add_success(pair)
+                    cached_sources.append(pair)
+                    _update_progress(pair, "currency, 缓存")
+                    self._checkpoint(pair, results, stats)
+                    continue
                 try:
                     data = self.crawl_exchange_rate(url)
+                    # 爬取期间被取消（WebDriver 已关闭）时不记为失败
+                    self.cancel_token.check()
                     if data:
                         results[pair] = data
+                        self._cache_result(pair, data)
                         stats.add_success(pair)
                         _update_progress(pair, "currency")
                     else:
                         stats.add_failure(pair, "爬取返回空数据")
                         _update_progress(pair, "currency", False)
+                except cancellation.JobCancelled:
+                    raise
                 except Exception as e:
                     stats.add_failure(pair, str(e))
                     _update_progress(pair, "currency", False, str(e))
                 finally:
+                    self._checkpoint(pair, results, stats)
                     gc.collect()
-                    _time.sleep(1)
+                    self.cancel_token.wait(1)
 
             # 2) 日频数据（顺序）
             logger.info("开始爬取日频数据（顺序执行）...")
-            for sheet_name, info in config.DAILY_DATA_PAIRS.items():
+            for sheet_name, info in daily_pairs.items():
+                self.cancel_token.check()
                 if _timed_out():
-                    logger.error("任务超时，强制kill Chrome")
-                    try:
-                        subprocess.run(["pkill", "-f", "chrome"], check=False)
-                    except Exception:
-                        pass
+                    # 只关闭本任务的WebDriver，不影响其他任务的浏览器
+                    logger.error("任务超时，关闭本任务的WebDriver")
+                    self.close_driver('default')
                     break
+                cached = self._cached_result(sheet_name)
+                if cached:
+                    results[sheet_name] = cached
+                    stats.add_success(sheet_name)
+                    cached_sources.append(sheet_name)
+                    _update_progress(sheet_name, "daily, 缓存")
+                    self._checkpoint(sheet_name, results, stats)
+                    continue
                 try:
                     crawler_method = getattr(self, info['crawler'])
                     data = crawler_method(info['url'])
+                    # 爬取期间被取消（WebDriver 已关闭）时不记为失败
+                    self.cancel_token.check()
                     if data:
                         results[sheet_name] = data
+                        self._cache_result(sheet_name, data)
                         stats.add_success(sheet_name)
                         _update_progress(sheet_name, "daily")
                     else:
                         stats.add_failure(sheet_name, "爬取返回空数据")
                         _update_progress(sheet_name, "daily", False)
+                except cancellation.JobCancelled:
+                    raise
                 except Exception as e:
                     stats.add_failure(sheet_name, str(e))
                     _update_progress(sheet_name, "daily", False, str(e))
                 finally:
+                    self._checkpoint(sheet_name, results, stats)
                     gc.collect()
-                    _time.sleep(1)
+                    self.cancel_token.wait(1)
 
             # 3) 月度数据（顺序）
             logger.info("开始爬取月度数据（顺序执行）...")
-            for sheet_name, info in config.MONTHLY_DATA_PAIRS.items():
+            for sheet_name, info in monthly_pairs.items():
+                self.cancel_token.check()
                 if _timed_out():
-                    logger.error("任务超时，强制kill Chrome")
-                    try:
-                        subprocess.run(["pkill", "-f", "chrome"], check=False)
-                    except Exception:
-                        pass
+                    # 只关闭本任务的WebDriver，不影响其他任务的浏览器
+                    logger.error("任务超时，关闭本任务的WebDriver")
+                    self.close_driver('default')
                     break
+                cached = self._cached_result(sheet_name)
+                if cached:
+                    results[sheet_name] = cached
+                    stats.add_success(sheet_name)
+                    cached_sources.append(sheet_name)
+                    _update_progress(sheet_name, "monthly, 缓存")
+                    self._checkpoint(sheet_name, results, stats)
+                    continue
                 try:
                     crawler_method = getattr(self, info['crawler'])
                     data = crawler_method(info['url'])
+                    # 爬取期间被取消（WebDriver 已关闭）时不记为失败
+                    self.cancel_token.check()
                     if data:
-                        if isinstance(data, list) and len(data) > 0:
-                            results[sheet_name] = data[0]
-                        else:
-                            results[sheet_name] = data
+                        # 保留全部记录（通常为最近两期），由合并引擎一并补齐或修订
+                        results[sheet_name] = data if isinstance(data, list) else [data]
+                        self._cache_result(sheet_name, results[sheet_name])
                         stats.add_success(sheet_name)
                         _update_progress(sheet_name, "monthly")
                     else:
                         stats.add_failure(sheet_name, "爬取返回空数据")
                         _update_progress(sheet_name, "monthly", False)
+                except cancellation.JobCancelled:
+                    raise
                 except Exception as e:
                     stats.add_failure(sheet_name, str(e))
                     _update_progress(sheet_name, "monthly", False, str(e))
                 finally:
+                    self._checkpoint(sheet_name, results, stats)
                     gc.collect()
-                    _time.sleep(1)
+                    self.cancel_token.wait(1)
+
+            if _timed_out():
+                # 超时后未爬取的数据源记为失败，可通过 retry_failed 单独重试
+                for name in requested:
+                    if name in selected and name not in results and name not in stats.failure:
+                        stats.add_failure(name, "任务超时，未爬取")
+                        self._checkpoint(name, results, stats)
+
+            if cached_sources:
+                logger.info(f"♻️ {len(cached_sources)} 个数据源的缓存结果仍然有效，已跳过爬取: {', '.join(cached_sources)}")
 
             # 单一WebDriver在此阶段可选择关闭以释放资源
             logger.info("爬取任务完成，关闭WebDriver实例以释放资源...")
@@ -1109,132 +1302,126 @@ class MarketDataAnalyzer:
             if not os.path.exists(excel_path):
                 raise FileNotFoundError(f"Excel文件不存在: {excel_path}。请确保文件存在于正确的位置。")
 
-            # 跨进程文件锁，防止并发读写导致损坏
+            # 写入存储与Excel之前的最后一个取消点（已爬取的结果仍保留在数据源缓存中）
+            self.cancel_token.check()
+
+            # 摄取层：日期转为datetime，数值转为float（百分数为小数），后续比较不再重复解析字符串
+            results = {name: ingest.coerce_results(name, data) for name, data in results.items()}
+
+            # 规范数据源：单事务写入SQLite存储，Excel由数据库中各工作表的最后W行渲染
+            render_sources = self._sync_store(excel_path, results)
+
+            # 分片布局：各工作表写入独立分片（各自加锁、并行），合并文件在下载时组装
+            if config.SHARDED_LAYOUT:
+                return self._update_shards(excel_path, render_sources, results, stats)
+
+            # 快速路径：加锁之前先用尾部索引比对，全部无变化时不打开Excel
+            self._tail_index = tail_index.TailIndex(excel_path)
+            self._written_tails = {}
+            self.change_sets = {}
+            pending_sheets = self._sheets_needing_write(render_sources, stats)
+            if pending_sheets is not None and not pending_sheets:
+                logger.info("⚡ 尾部索引比对：所有工作表均无新增或修订数据，跳过打开Excel文件")
+                logger.info("=" * 50)
+                self._log_summary(stats)
+                logger.info("ℹ️ 所有工作表数据均已是最新，Excel文件未做修改")
+                # 未获取文件锁，但仍需打点以便前端/后端完成判定
+                logger.info("EXCEL_UNLOCKED")
+                return results
+
+            # 乐观并发：不加锁读取工作簿并计算各工作表的变更集（文件通过 os.replace 原子替换，读取总是一致的）
+            try:
+                wb, base_identity = self._load_for_diff(excel_path)
+            except Exception as e:
+                logger.error(f"无法打开Excel文件（可能不是有效的xlsx或被占用）：{str(e)}")
+                return False
+            planned, skipped = self._plan_workbook(wb, render_sources)
+
+            # 跨进程文件锁，仅覆盖应用变更与保存这一步
             lock_path = excel_path + ".lock"
-            lock_fd = None
             try:
                 lock_fd = open(lock_path, 'w')
-                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                self._acquire_file_lock(lock_fd)
+                lock_acquired_at = time.monotonic()
                 logger.debug("已获取Excel文件锁")
+            except cancellation.JobCancelled:
+                raise
+            except Exception as le:
+                logger.error(f"获取Excel文件锁失败: {str(le)}")
+                return False
 
-                # 尝试加载工作簿；若失败则不修改原文件，直接返回失败
+            if file_identity(excel_path) != base_identity:
+                # 比对期间已有其他写入者保存了文件：在锁内重新加载并重新比对
+                logger.info("🔁 Excel文件在比对期间已被其他任务更新，重新比对")
                 try:
-                    wb = load_workbook(excel_path)
+                    wb, base_identity = self._load_for_diff(excel_path)
                 except Exception as e:
                     logger.error(f"无法打开Excel文件（可能不是有效的xlsx或被占用）：{str(e)}")
                     return False
-            except Exception as le:
-                logger.error(f"获取Excel文件锁失败: {str(le)}")
-                return False
+                planned, skipped = self._plan_workbook(wb, render_sources)
 
-            updated_sheets = []  # 记录已更新的工作表
-
-            # 更新各个sheet
-            excel_updates = []
-            for sheet_name, data in results.items():
-                if not data:
-                    stats.add_skipped(sheet_name, "数据为空")
-                    continue
-
-                if sheet_name not in wb.sheetnames:
-                    stats.add_skipped(sheet_name, "工作表不存在")
+            for sheet_name, reason in skipped:
+                stats.add_skipped(sheet_name, reason)
+                if reason == "工作表不存在":
                     logger.warning(f"⚠️ 工作表 {sheet_name} 不存在，跳过更新")
-                    continue
 
-                ws = wb[sheet_name]
-
-                # 查找最后一行数据
-                last_row = self.find_last_row(ws)
-
-
-                # 根据数据类型选择不同的处理方法
-                if sheet_name in config.MONTHLY_DATA_PAIRS:
-                    # 月度数据处理
-                    new_date = data.get("日期", "")
-                    if not new_date:
-                        stats.add_skipped(sheet_name, "数据中缺少日期字段")
-                        continue
+            updated_sheets = []  # 记录已更新的工作表
 
-                    # 获取最后一行的日期值
-                    last_date_value = ws.cell(row=last_row, column=1).value
-
-                    # 对Import and Export进行特殊处理
-                    if sheet_name == 'Import and Export':
-                        # 检查最后一行的数据是否完整（没有"-"）
-                        last_row_complete = True
-                        columns = config.COLUMN_DEFINITIONS[sheet_name]
-
-                        # 检查最后一行的每个单元格（除了日期列）
-                        for col_idx, col_name in enumerate(columns, 1):
-                            if col_name == '日期':
-                                continue
-
-                            current_value = ws.cell(row=last_row, column=col_idx).value
-                            if current_value == '-' or current_value == '':
-                                last_row_complete = False
-                                break
-
-                        if not last_row_complete:
-                            # 如果最后一行不完整，用新数据更新这一行
-                            self.write_monthly_data(ws, data, last_row)
-                            excel_updates.append(sheet_name)
-                            updated_sheets.append(sheet_name)
-                            logger.info(f"📝 更新不完整行 {sheet_name}: {new_date}")
-                        elif str(last_date_value) != str(new_date):
-                            # 如果最后一行完整且日期不同，写入新行
-                            self.write_monthly_data(ws, data, last_row + 1)
-                            excel_updates.append(sheet_name)
-                            updated_sheets.append(sheet_name)
-                            logger.info(f"📝 添加新行 {sheet_name}: {new_date}")
-                        else:
-                            logger.info(f"✓ {sheet_name} 数据已是最新且完整")
-                    else:
-                        # 其他月度数据的常规处理
-                        if str(last_date_value) != str(new_date):
-                            self.write_monthly_data(ws, data, last_row + 1)
-                            excel_updates.append(sheet_name)
-                            updated_sheets.append(sheet_name)
-                            logger.info(f"📝 更新 {sheet_name}: {new_date}")
-                        else:
-                            logger.info(f"✓ {sheet_name} 数据已是最新")
+            # 更新各个sheet：只写入变更集中的行
+            excel_updates = []
+            for sheet_name, change_set in planned:
+                self.change_sets[sheet_name] = change_set
+                if change_set:
+                    self.apply_change_set(wb[sheet_name], change_set)
+                    excel_updates.append(sheet_name)
+                    updated_sheets.append(sheet_name)
+                    logger.info(f"📝 更新 {sheet_name}: {change_set.describe()}")
                 else:
-                    # 日频数据处理（包括汇率数据）
-                    update_result = self.write_daily_data(ws, data, last_row, sheet_name)
-                    if update_result:
-                        excel_updates.append(sheet_name)
-                        updated_sheets.append(sheet_name)
-                        logger.info(f"📝 更新 {sheet_name}")
+                    logger.info(f"✓ {sheet_name} 数据已是最新")
+
+            # 归档：早于保留期限的日频行移动到按年份划分的归档工作簿，正式文件只保留最近窗口
+            self._archived_rows = {}
+            if excel_updates and config.ARCHIVE_HORIZON_DAYS:
+                try:
+                    self._archived_rows = archive.archive_expired_rows(wb, sheet_names=excel_updates)
+                except Exception as e:
+                    logger.warning(f"归档历史数据失败，本次跳过: {str(e)}")
 
             # 打印统计摘要并获取摘要文本
             logger.info("=" * 50)
-            summary_text = stats.print_summary()
-
-            # 添加一个特殊的日志消息，标记为摘要信息（前端据此收集并在收到 SHOW_SUMMARY 时显示）
-            try:
-                logger.info("SUMMARY_START")
-                for line in summary_text.splitlines():
-                    if line.strip():
-                        logger.info(line)
-                logger.info("SUMMARY_END")
-            except Exception:
-                # 回退：直接输出文本
-                logger.info(summary_text)
+            self._log_summary(stats)
 
             # 保存Excel文件
             if excel_updates:
+                # 取消时不保存，finally 中释放文件锁
+                self.cancel_token.check()
+                logger.info(f"📝 已更新以下工作表: {', '.join(updated_sheets)}")
                 logger.info(f"💾 保存Excel文件: {os.path.basename(excel_path)}")
                 try:
                     tmp_path = excel_path + ".tmp"
                     wb.save(tmp_path)
+                    # 不可变快照：替换正式文件前按内容哈希存入快照目录，替换后原子地切换指针
+                    snapshot = snapshots.store(tmp_path)
                     os.replace(tmp_path, excel_path)
+                    snapshots.flip(snapshot, excel_path)
                     logger.info(f"✅ Excel文件保存成功，已更新 {len(updated_sheets)} 个工作表")
+                    self._commit_tail_index(wb)
+                    workbook_cache.refresh(excel_path, wb)
+                    workbook_etag.record_etag(excel_path, snapshot.sha if snapshot else None)
+                    snapshots.collect_garbage()
                 except Exception as e:
                     logger.error(f"❌ 保存Excel文件时出错: {str(e)}")
                     return False
             else:
                 logger.info("ℹ️ 所有工作表数据均已是最新，Excel文件未做修改")
+                # 未修改的工作簿放回缓存
+                workbook_cache.refresh(excel_path, wb)
 
             return results
+        except cancellation.JobCancelled as e:
+            logger.warning(f"⛔ 任务已取消（{e.reason}），未写入Excel")
+            self.close_driver('default')
+            raise
         except Exception as e:
             logger.error(f"❌ 更新Excel过程中出错: {str(e)}", exc_info=True)
             return False
@@ -1244,7 +1431,10 @@ class MarketDataAnalyzer:
                 if lock_fd is not None:
                     fcntl.flock(lock_fd, fcntl.LOCK_UN)
                     lock_fd.close()
-                    logger.debug("已释放Excel文件锁")
+                    if lock_acquired_at is not None:
+                        logger.debug(f"已释放Excel文件锁（持有 {time.monotonic() - lock_acquired_at:.2f} 秒）")
+                    else:
+                        logger.debug("已释放Excel文件锁")
                     # 显式标记Excel已释放，供前端/后端完成判定
                     logger.info("EXCEL_UNLOCKED")
             except Exception:
@@ -1982,7 +2172,22 @@ if __name__ == "__main__":
 
         parser = argparse.ArgumentParser(description='市场数据爬取工具')
         parser.add_argument('--debug', action='store_true', help='启用调试日志')
+        parser.add_argument(
+            '--sources',
+            help='只更新指定的数据源，逗号分隔的数据源名或分组（currency/daily/monthly），如 "SOFR,ESTER" 或 "monthly"',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            metavar='JOB_ID',
+            help='只重新爬取该任务（检查点编号）中失败或未完成的数据源，并与其已成功的结果合并后写入',
+        )
         args = parser.parse_args()
+        try:
+            sources = resolve_sources(args.sources) if args.sources else None
+            if args.retry_failed:
+                checkpoints.get_journal().retry_plan(args.retry_failed)
+        except ValueError as e:
+            parser.error(str(e))
 
         # 设置日志级别
         setup_logging(debug=args.debug)
@@ -2000,7 +2205,7 @@ if __name__ == "__main__":
 
         try:
             logger.info("开始更新市场数据...")
-            analyzer.update_excel()
+            analyzer.update_excel(sources=sources, retry_failed=args.retry_failed)
         except KeyboardInterrupt:
             logger.info("检测到用户中断，正在关闭资源...")
         except Exception as e:
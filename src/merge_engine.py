@@ -0,0 +1,139 @@
+"""
+按日期键合并的差异引擎
+
+把工作表最后 W 行载入为 日期键 -> (行号, 行哈希) 的映射，再用一次遍历把爬取到的
+批量记录与之连接，得到显式的变更集：
+    - inserts   比窗口内最新日期更新的记录，按日期升序追加到末尾
+    - updates   日期已存在但内容不同的记录（数据源修订），原地覆盖
+    - unchanged 日期与内容都相同的记录
+只有变更集中的行会被写入。窗口既可以从内存中的工作表构建，也可以从尾部索引构建，
+因此加锁前的快速比对与实际写入使用同一套判定逻辑。
+"""
+import logging
+
+try:
+    import config
+    import tail_index
+except ImportError:
+    from src import config
+    from src import tail_index
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeSet:
+    """单个工作表的变更集"""
+
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        self.inserts = []    # [(row_num, record)]，按写入顺序（日期升序）
+        self.updates = []    # [(row_num, record)]
+        self.unchanged = 0
+        self.skipped = 0     # 早于窗口且不在窗口内的记录，无法定位，跳过
+
+    def __bool__(self):
+        return bool(self.inserts or self.updates)
+
+    @property
+    def last_row(self):
+        """变更集写入后工作表的最大行号（无插入时为 None）"""
+        return self.inserts[-1][0] if self.inserts else None
+
+    def describe(self):
+        parts = []
+        if self.inserts:
+            parts.append(f"新增 {len(self.inserts)} 行")
+        if self.updates:
+            parts.append(f"修订 {len(self.updates)} 行")
+        if self.unchanged:
+            parts.append(f"未变 {self.unchanged} 行")
+        if self.skipped:
+            parts.append(f"跳过 {self.skipped} 行")
+        return "，".join(parts) or "无数据"
+
+
+class MergeWindow:
+    """工作表末尾 W 行的日期键映射"""
+
+    def __init__(self, last_row, rows):
+        # rows: [(row_num, key, fingerprint)]，按行号升序
+        self.last_row = last_row
+        self.by_key = {}
+        self.last_date = None
+        for row_num, key, fingerprint in rows:
+            if key is None:
+                continue
+            self.by_key[key] = (row_num, fingerprint)
+            if tail_index.is_date_key(key) and (self.last_date is None or key > self.last_date):
+                self.last_date = key
+
+
+def sheet_window_rows(ws, last_row, window=None):
+    """返回工作表最后 W 行中的非空行 [(row_num, values)]，按行号升序"""
+    window = window or config.MERGE_WINDOW_ROWS
+    start = max(1, last_row - window + 1)
+    rows = ws.iter_rows(min_row=start, max_row=last_row, values_only=True)
+    return [
+        (row_num, values)
+        for row_num, values in enumerate(rows, start=start)
+        if any(v is not None and v != '' for v in values)
+    ]
+
+
+def window_from_sheet(ws, last_row, sheet_name, window=None):
+    """从内存中的工作表读取最后 W 行构建窗口"""
+    rows = [
+        (row_num, tail_index.date_key(values[0], sheet_name), tail_index.row_fingerprint(values))
+        for row_num, values in sheet_window_rows(ws, last_row, window)
+    ]
+    return MergeWindow(last_row, rows)
+
+
+def window_from_index(entry):
+    """从尾部索引条目构建窗口（不打开工作簿）"""
+    rows = [(row_num, key, fingerprint) for key, row_num, fingerprint in entry.get('window') or []]
+    return MergeWindow(entry['last_row'], rows)
+
+
+def plan_merge(sheet_name, window, records, columns):
+    """
+    将爬取记录与窗口做一次哈希连接，返回 ChangeSet
+
+    Args:
+        sheet_name: 工作表名称
+        window: MergeWindow
+        records: 爬取到的记录列表（顺序不限）
+        columns: 工作表列定义，用于计算记录的行哈希
+    """
+    change_set = ChangeSet(sheet_name)
+    seen = set()
+    pending_inserts = []
+
+    for record in records or []:
+        key = tail_index.date_key(record.get('日期', ''), sheet_name)
+        if key is None or key in seen:
+            continue
+        seen.add(key)
+
+        fingerprint = tail_index.row_fingerprint([record.get(col, '') for col in columns])
+        hit = window.by_key.get(key)
+        if hit is not None:
+            row_num, existing = hit
+            if existing == fingerprint:
+                change_set.unchanged += 1
+            else:
+                change_set.updates.append((row_num, record))
+            continue
+
+        is_date = tail_index.is_date_key(key)
+        if window.last_date is None or not is_date or key > window.last_date:
+            pending_inserts.append((key if is_date else '', record))
+        else:
+            change_set.skipped += 1
+            logger.debug(f"{sheet_name}: 记录 {key} 早于窗口且不在窗口内，跳过")
+
+    # 新增记录按日期升序追加（无法解析日期的记录保持原有相对顺序）
+    pending_inserts.sort(key=lambda item: item[0])
+    change_set.inserts = [(window.last_row + i, record) for i, (_, record) in enumerate(pending_inserts, 1)]
+    change_set.updates.sort(key=lambda item: item[0])
+    return change_set
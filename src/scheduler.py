@@ -0,0 +1,164 @@
+"""
+进程内的定时调度器（按数据源的发布节奏自动提交部分更新任务）
+
+SOURCE_SCHEDULES 中每条调度定义一组数据源及其触发时间（所在时区的当地时间，对齐数据源的发布时刻），
+可限定星期几或每月几号，并带随机抖动，使负载分散而不是集中在同一时刻。
+到期时只为到期的数据源提交一个部分更新任务（与手动请求一样经过合并与数据源缓存）。
+
+多进程部署时通过文件锁保证只有一个进程运行调度器。
+"""
+import fcntl
+import logging
+import random
+import threading
+from datetime import datetime, timedelta, time as dtime
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+try:
+    import config
+except ImportError:
+    from src import config
+
+logger = logging.getLogger(__name__)
+
+# 未获得调度锁时的重试间隔（秒）
+LOCK_RETRY_SECONDS = 60
+# 查找下一次触发时间时向后搜索的天数（覆盖按月调度）
+_SEARCH_DAYS = 62
+
+
+def _zone(name):
+    if not name:
+        return None
+    if ZoneInfo is None:
+        logger.warning(f"⚠️ 当前 Python 不支持 zoneinfo（需要 3.9+），时区 {name} 被忽略，按本机时区调度")
+        return None
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        logger.warning(f"未找到时区 {name}（Windows 需安装 tzdata），按本机时区调度")
+        return None
+
+
+class Schedule:
+    """单条调度：数据源、当地触发时刻、日期过滤与抖动"""
+
+    def __init__(self, spec):
+        self.name = spec.get('name') or ','.join(spec['sources'])
+        self.sources = list(spec['sources'])
+        self.times = [dtime.fromisoformat(value) for value in spec['times']]
+        self.tz = _zone(spec.get('tz'))
+        self.weekdays = set(spec['weekdays']) if spec.get('weekdays') is not None else None
+        self.monthdays = set(spec['monthdays']) if spec.get('monthdays') is not None else None
+        self.jitter = spec.get('jitter', 0)
+        self.next_run = None
+
+    def _matches(self, day):
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return False
+        if self.monthdays is not None and day.day not in self.monthdays:
+            return False
+        return True
+
+    def next_after(self, now):
+        """now（带时区）之后最近的触发时刻（不含抖动），找不到时返回 None"""
+        local_now = now.astimezone(self.tz) if self.tz else now.astimezone()
+        for offset in range(_SEARCH_DAYS):
+            day = local_now.date() + timedelta(days=offset)
+            if not self._matches(day):
+                continue
+            for at in sorted(self.times):
+                if self.tz:
+                    candidate = datetime.combine(day, at, tzinfo=self.tz)
+                else:
+                    candidate = datetime.combine(day, at).astimezone()
+                if candidate > local_now:
+                    return candidate
+        return None
+
+    def plan(self, now):
+        """计算下一次触发时间（含随机抖动）"""
+        base = self.next_after(now)
+        self.next_run = base + timedelta(seconds=random.uniform(0, self.jitter)) if base else None
+        return self.next_run
+
+
+class Scheduler:
+    """
+    调度线程
+
+    用法：
+        scheduler = Scheduler(config.SOURCE_SCHEDULES, submit)  # submit(sources) 提交部分更新任务
+        scheduler.start()
+    """
+
+    def __init__(self, specs, submit, lock_path=None):
+        self.schedules = [Schedule(spec) for spec in specs]
+        self.submit = submit
+        self.lock_path = lock_path or config.SCHEDULER_LOCK_PATH
+        self._stop = threading.Event()
+        self._lock_fd = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _acquire_lock(self):
+        """多进程部署时只允许一个进程运行调度器"""
+        fd = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fd.close()
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _run(self):
+        while not self._acquire_lock():
+            if self._stop.wait(LOCK_RETRY_SECONDS):
+                return
+
+        now = datetime.now().astimezone()
+        for schedule in self.schedules:
+            schedule.plan(now)
+        logger.info(f"⏰ 定时调度器已启动（{len(self.schedules)} 条调度）")
+        for schedule in self.schedules:
+            if schedule.next_run:
+                logger.debug(f"调度 {schedule.name} 下次运行: {schedule.next_run.isoformat(timespec='seconds')}")
+
+        while not self._stop.is_set():
+            pending = [schedule for schedule in self.schedules if schedule.next_run]
+            if not pending:
+                return
+            next_run = min(schedule.next_run for schedule in pending)
+            delay = (next_run - datetime.now().astimezone()).total_seconds()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            self.run_due(datetime.now().astimezone())
+
+    def run_due(self, now):
+        """提交所有到期调度的数据源（合并为一个部分更新任务），并安排各自的下一次运行"""
+        due = [schedule for schedule in self.schedules if schedule.next_run and schedule.next_run <= now]
+        if not due:
+            return None
+        sources = []
+        for schedule in due:
+            sources.extend(name for name in schedule.sources if name not in sources)
+            schedule.plan(now)
+        logger.info(f"⏰ 定时调度到期: {', '.join(schedule.name for schedule in due)}")
+        try:
+            return self.submit(sources)
+        except Exception as e:
+            logger.error(f"提交定时更新任务失败: {str(e)}")
+            return None
@@ -0,0 +1,192 @@
+"""
+内存中的时间序列数组（供图表查询接口使用）
+
+每个工作表从 SQLite 存储加载一次，转换为按日期排序的 NumPy 数组：
+日期为 int64 纪元天数，数值列为 float64（非数值为 NaN）。
+区间查询使用二分查找切片，点数过多时使用 Largest-Triangle-Three-Buckets (LTTB)
+降采样到请求的点数。每次任务完成后只重新加载发生变化的工作表。
+"""
+import logging
+import threading
+
+import numpy as np
+
+try:
+    import ingest
+    import series_store
+    import tail_index
+except ImportError:
+    from src import ingest
+    from src import series_store
+    from src import tail_index
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def to_epoch_day(value, sheet_name=''):
+    """将日期值（datetime/ISO 字符串/工作表日期文本）转换为纪元天数，无法解析时返回 None"""
+    key = tail_index.date_key(value, sheet_name)
+    if not tail_index.is_date_key(key):
+        return None
+    return int((np.datetime64(key, 'D') - _EPOCH).astype(np.int64))
+
+
+def from_epoch_days(days):
+    """纪元天数数组 -> ISO 日期字符串列表"""
+    return np.datetime_as_string(np.asarray(days, dtype=np.int64).astype('datetime64[D]')).tolist()
+
+
+class SeriesArray:
+    """单个工作表的列式数组"""
+
+    __slots__ = ('sheet_name', 'days', 'columns')
+
+    def __init__(self, sheet_name, days, columns):
+        self.sheet_name = sheet_name
+        self.days = days          # int64，升序
+        self.columns = columns    # {列名: float64 数组}
+
+    def __len__(self):
+        return len(self.days)
+
+    def slice(self, start_day=None, end_day=None):
+        """二分查找返回 [start_day, end_day] 闭区间对应的下标范围"""
+        lo = 0 if start_day is None else int(np.searchsorted(self.days, start_day, side='left'))
+        hi = len(self.days) if end_day is None else int(np.searchsorted(self.days, end_day, side='right'))
+        return lo, max(lo, hi)
+
+
+def build_series(sheet_name, records):
+    """由按日期升序的记录列表构建 SeriesArray"""
+    date_columns = {'日期'} | ingest.DATE_COLUMNS
+    keyed = []
+    for record in records:
+        day = to_epoch_day(record.get('日期'), sheet_name)
+        if day is not None:
+            keyed.append((day, record))
+    keyed.sort(key=lambda item: item[0])
+
+    days = np.fromiter((day for day, _ in keyed), dtype=np.int64, count=len(keyed))
+    columns = {}
+    # 记录的键顺序即存储中的列顺序（与工作表列定义一致）
+    for name in (records[0].keys() if records else ()):
+        if name in date_columns:
+            continue
+        values = np.fromiter(
+            (_as_float(record.get(name)) for _, record in keyed), dtype=np.float64, count=len(keyed)
+        )
+        if np.isfinite(values).any():
+            columns[name] = values
+    return SeriesArray(sheet_name, days, columns)
+
+
+def _as_float(value):
+    number = ingest.parse_number(value)
+    return float(number) if number is not None else np.nan
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回被选中点的下标（升序）
+
+    x 必须升序，y 中不得含 NaN；threshold < 3 或不小于点数时返回全部下标。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    # 第 i 个桶为 [edges[i], edges[i+1])，首尾两点固定保留
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def query(series, start_day=None, end_day=None, columns=None, points=None):
+    """
+    区间查询并按列降采样
+
+    Returns:
+        tuple: ({列名: {'dates': [...], 'values': [...]}}, 区间内原始点数)
+    """
+    lo, hi = series.slice(start_day, end_day)
+    days = series.days[lo:hi]
+    names = columns or list(series.columns)
+    result = {}
+    for name in names:
+        values = series.columns[name][lo:hi]
+        mask = np.isfinite(values)
+        col_days, col_values = days[mask], values[mask]
+        if points:
+            keep = lttb(col_days, col_values, points)
+            col_days, col_values = col_days[keep], col_values[keep]
+        result[name] = {'dates': from_epoch_days(col_days), 'values': col_values.tolist()}
+    return result, hi - lo
+
+
+class SeriesCache:
+    """按工作表惰性加载的数组缓存（线程安全）"""
+
+    def __init__(self, store_getter=series_store.get_store):
+        self._store_getter = store_getter
+        self._series = {}
+        self._lock = threading.RLock()
+
+    def get(self, sheet_name):
+        """返回工作表的数组；存储中不存在该工作表时返回 None"""
+        with self._lock:
+            series = self._series.get(sheet_name)
+        if series is not None:
+            return series
+        return self._load(sheet_name)
+
+    def _load(self, sheet_name):
+        store = self._store_getter()
+        if not store.has_table(sheet_name):
+            return None
+        series = build_series(sheet_name, store.rows(sheet_name))
+        with self._lock:
+            self._series[sheet_name] = series
+        logger.debug(f"已加载时间序列数组: {sheet_name}（{len(series)} 点）")
+        return series
+
+    def refresh(self, sheet_names):
+        """任务完成后调用：重新加载已缓存且发生变化的工作表"""
+        with self._lock:
+            loaded = [name for name in sheet_names if name in self._series]
+        for name in loaded:
+            try:
+                self._load(name)
+            except Exception as e:
+                logger.warning(f"刷新时间序列数组失败 {name}: {str(e)}")
+                with self._lock:
+                    self._series.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+# 进程级共享缓存
+shared_cache = SeriesCache()
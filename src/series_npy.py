@@ -0,0 +1,184 @@
+"""
+供分析脚本使用的内存映射 NumPy 时间序列文件
+
+每个工作表导出为一组 .npy 文件：日期为 int64 纪元天数（days.npy），每个数值列为一个
+float64 数组（c0.npy、c1.npy……，列名见 manifest.json）。读取方可以直接
+np.load(..., mmap_mode='r') 零拷贝访问，多个进程共享同一份页缓存，无需解析 Excel。
+
+目录结构：
+    series_npy/<工作表>/manifest.json       指向当前版本目录，记录列名与行数
+    series_npy/<工作表>/v<版本>/days.npy
+    series_npy/<工作表>/v<版本>/c<i>.npy
+
+每次任务后只重写发生变化的工作表：新版本写入独立目录后原子地替换 manifest.json，
+读取方要么看到旧版本、要么看到新版本，各列长度始终一致；已映射旧文件的进程不受影响。
+版本目录一旦发布就不再原地改写：同一版本再次导出时，若 manifest 已指向它则直接跳过，
+否则写入 v<版本>-<序号> 这样的新目录。
+"""
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+try:
+    import config
+    import series_arrays
+except ImportError:
+    from src import config
+    from src import series_arrays
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+DAYS_FILE = 'days.npy'
+# 保留的旧版本目录数量（刚读取 manifest 的进程仍可打开上一版本）
+KEEP_VERSIONS = 2
+
+
+def npy_dir():
+    return config.SERIES_NPY_DIR
+
+
+def sheet_dir(sheet_name, root=None):
+    """返回工作表的导出目录"""
+    return os.path.join(root or npy_dir(), sheet_name)
+
+
+def read_manifest(sheet_name, root=None):
+    """读取工作表的 manifest，不存在时返回 None"""
+    try:
+        with open(os.path.join(sheet_dir(sheet_name, root), MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+
+def _parse_version_name(name):
+    """解析版本目录名 v<版本> 或 v<版本>-<序号>，返回 (版本, 序号)；不是版本目录时返回 None"""
+    if not name.startswith('v'):
+        return None
+    number, _, suffix = name[1:].partition('-')
+    if not number.isdigit() or (suffix and not suffix.isdigit()):
+        return None
+    return int(number), int(suffix or 0)
+
+
+def _free_version_name(base, version):
+    """返回该版本尚未使用的目录名：优先 v<版本>，已存在时追加序号"""
+    version_name = f"v{version}"
+    suffix = 0
+    while os.path.exists(os.path.join(base, version_name)):
+        suffix += 1
+        version_name = f"v{version}-{suffix}"
+    return version_name
+
+
+def write_sheet(sheet_name, series, version):
+    """将 SeriesArray 写入新版本目录并原子地切换 manifest"""
+    base = sheet_dir(sheet_name)
+    current = read_manifest(sheet_name)
+    if current and current.get('version') == version and os.path.isdir(os.path.join(base, current['dir'])):
+        # 同一数据集版本的数据相同，manifest 指向的目录可能正被读取方映射，不能删除重写
+        logger.debug(f"⏭️ 工作表 {sheet_name} 已导出版本 {version}，跳过")
+        return current
+
+    version_name = _free_version_name(base, version)
+    target = os.path.join(base, version_name)
+    staging = target + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    _save_array(os.path.join(staging, DAYS_FILE), np.ascontiguousarray(series.days, dtype=np.int64))
+    columns = {}
+    for i, (name, values) in enumerate(series.columns.items()):
+        file_name = f"c{i}.npy"
+        _save_array(os.path.join(staging, file_name), np.ascontiguousarray(values, dtype=np.float64))
+        columns[name] = file_name
+
+    os.replace(staging, target)
+
+    manifest = {
+        'sheet': sheet_name,
+        'version': version,
+        'dir': version_name,
+        'rows': len(series),
+        'days': DAYS_FILE,
+        'columns': columns,
+    }
+    manifest_path = os.path.join(base, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    _collect_old_versions(base, version_name)
+    return manifest
+
+
+def _collect_old_versions(base, current_name):
+    """删除较旧的版本目录，保留 manifest 指向的当前版本与最近的 KEEP_VERSIONS - 1 个旧版本"""
+    versions = []
+    for name in os.listdir(base):
+        key = _parse_version_name(name)
+        if key is not None and name != current_name and os.path.isdir(os.path.join(base, name)):
+            versions.append((key, name))
+    versions.sort(reverse=True)
+    for _, name in versions[KEEP_VERSIONS - 1:]:
+        # 已被映射的文件在删除目录项后仍可继续读取
+        shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+
+def export_sheets(store, sheet_names, version=None):
+    """
+    从数据库导出指定工作表的 .npy 文件（在数据库写入之后调用）
+
+    Returns:
+        list: 实际导出的工作表名
+    """
+    if not npy_dir():
+        return []
+    version = version if version is not None else store.current_version()
+    exported = []
+    for sheet_name in sheet_names:
+        if not store.has_table(sheet_name):
+            continue
+        series = series_arrays.build_series(sheet_name, store.rows(sheet_name))
+        write_sheet(sheet_name, series, version)
+        exported.append(sheet_name)
+    if exported:
+        logger.info(f"🧮 已导出NumPy时间序列文件: {', '.join(exported)}")
+    return exported
+
+
+def stale_sheets(sheet_names):
+    """返回尚未导出 .npy 文件的工作表"""
+    if not npy_dir():
+        return []
+    return [name for name in sheet_names if read_manifest(name) is None]
+
+
+def load_sheet(sheet_name, root=None, mmap_mode='r'):
+    """
+    以内存映射方式加载工作表，返回 series_arrays.SeriesArray；未导出时返回 None
+
+    分析脚本示例：
+        from src import series_npy
+        series = series_npy.load_sheet('USD CNY', root='series_npy')
+        series.days, series.columns['收盘']
+    """
+    manifest = read_manifest(sheet_name, root)
+    if manifest is None:
+        return None
+    base = os.path.join(sheet_dir(sheet_name, root), manifest['dir'])
+    days = np.load(os.path.join(base, manifest['days']), mmap_mode=mmap_mode)
+    columns = {
+        name: np.load(os.path.join(base, file_name), mmap_mode=mmap_mode)
+        for name, file_name in manifest['columns'].items()
+    }
+    return series_arrays.SeriesArray(sheet_name, days, columns)
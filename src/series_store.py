@@ -0,0 +1,496 @@
+"""
+SQLite 时间序列存储（规范数据源）
+
+每个工作表对应一张表，以日期键为主键（日频为 ISO 日期，月度为期间标签解析后的日期）。
+爬虫结果在一个事务中直接 upsert 到数据库，写入只需毫秒级；
+Market Index.xlsx 由数据库按工作表增量渲染（仅渲染有变化的工作表）。
+数据库使用 WAL 模式，读取方不会与写入方互相阻塞。
+
+首次使用时，空表会从现有的 Excel 工作簿回填历史数据。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date
+
+from openpyxl import load_workbook
+
+try:
+    import config
+    import ingest
+    import sheet_writers
+    import tail_index
+except ImportError:
+    from src import config
+    from src import ingest
+    from src import sheet_writers
+    from src import tail_index
+
+logger = logging.getLogger(__name__)
+
+# 表名登记表：工作表名 -> 列定义与百分数列
+META_TABLE = '_series_meta'
+# 数据集版本表与各版本的变更记录（供增量同步接口使用）
+VERSIONS_TABLE = '_dataset_versions'
+CHANGES_TABLE = '_dataset_changes'
+
+
+def _quote(identifier):
+    """SQLite 标识符加引号（工作表名与列名包含空格和中文）"""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _encode(value):
+    """将带类型的值转换为 SQLite 可存储的值"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float):
+        # Percent 等 float 子类无法直接绑定参数
+        return float(value)
+    if value is None or isinstance(value, (str, int)):
+        return value
+    return str(value)
+
+
+class StoreDelta:
+    """一次 upsert 在某张表上产生的变化"""
+
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        self.inserted = []   # 新增的日期键
+        self.corrected = []  # 内容被修订的日期键
+        self.unchanged = 0
+        self.version = None  # 本次写入对应的数据集版本（无变化时为 None）
+
+    def __bool__(self):
+        return bool(self.inserted or self.corrected)
+
+    def describe(self):
+        parts = []
+        if self.inserted:
+            parts.append(f"新增 {len(self.inserted)}")
+        if self.corrected:
+            parts.append(f"修订 {len(self.corrected)}")
+        if self.unchanged:
+            parts.append(f"未变 {self.unchanged}")
+        return "，".join(parts) or "无数据"
+
+
+class SeriesStore:
+    """
+    按工作表分表的时间序列存储
+
+    用法：
+        store = SeriesStore(db_path)
+        store.backfill_from_workbook(excel_path, sheet_names)  # 空表从Excel回填
+        deltas = store.write_results(results)                   # 单事务 upsert
+        records = store.tail('USD CNY', 30)                     # 按日期升序的最后 N 条
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._meta_lock = threading.RLock()
+        self._meta = None
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {_quote(META_TABLE)} '
+                '(sheet TEXT PRIMARY KEY, columns TEXT NOT NULL, percent_columns TEXT NOT NULL)'
+            )
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {_quote(VERSIONS_TABLE)} '
+                '(version INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL)'
+            )
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {_quote(CHANGES_TABLE)} '
+                '(version INTEGER NOT NULL, sheet TEXT NOT NULL, date_key TEXT NOT NULL, kind TEXT NOT NULL, '
+                'PRIMARY KEY (version, sheet, date_key))'
+            )
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @contextmanager
+    def transaction(self):
+        """写事务（BEGIN IMMEDIATE，跨进程互斥，异常时回滚）"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            # 回滚后内存中的表登记信息可能已与数据库不一致，下次使用时重新读取
+            with self._meta_lock:
+                self._meta = None
+            raise
+
+    def _load_meta(self, reload=False):
+        with self._meta_lock:
+            if self._meta is None or reload:
+                rows = self._connect().execute(
+                    f'SELECT sheet, columns, percent_columns FROM {_quote(META_TABLE)}'
+                ).fetchall()
+                self._meta = {
+                    sheet: {'columns': json.loads(columns), 'percent': set(json.loads(percent))}
+                    for sheet, columns, percent in rows
+                }
+            return self._meta
+
+    def _entry(self, sheet_name):
+        """返回表的登记信息；本进程未见过时重新读取（可能由其他进程创建）"""
+        entry = self._load_meta().get(sheet_name)
+        if entry is None:
+            entry = self._load_meta(reload=True).get(sheet_name)
+        return entry
+
+    def has_table(self, sheet_name):
+        return self._entry(sheet_name) is not None
+
+    def ensure_table(self, conn, sheet_name):
+        """创建工作表对应的表；列定义新增列时自动 ALTER TABLE 补齐"""
+        columns = list(sheet_writers.compile_plan(sheet_name).columns)
+        entry = self._entry(sheet_name)
+        table = _quote(sheet_name)
+        changed = entry is None
+        if entry is None:
+            column_sql = ', '.join(_quote(col) for col in columns)
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} '
+                f'(date_key TEXT PRIMARY KEY, row_hash TEXT NOT NULL, {column_sql}, updated_at TEXT NOT NULL)'
+            )
+            entry = {'columns': columns, 'percent': set()}
+        else:
+            for col in columns:
+                if col not in entry['columns']:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {_quote(col)}')
+                    entry['columns'].append(col)
+                    changed = True
+        if changed:
+            self._save_meta(conn, sheet_name, entry)
+            with self._meta_lock:
+                self._load_meta()[sheet_name] = entry
+        return entry
+
+    def _save_meta(self, conn, sheet_name, entry):
+        conn.execute(
+            f'INSERT OR REPLACE INTO {_quote(META_TABLE)} (sheet, columns, percent_columns) VALUES (?, ?, ?)',
+            (sheet_name, json.dumps(entry['columns'], ensure_ascii=False),
+             json.dumps(sorted(entry['percent']), ensure_ascii=False)),
+        )
+
+    def count(self, sheet_name):
+        if not self.has_table(sheet_name):
+            return 0
+        return self._connect().execute(f'SELECT COUNT(*) FROM {_quote(sheet_name)}').fetchone()[0]
+
+    def upsert(self, conn, sheet_name, records):
+        """
+        在调用方的事务中 upsert 一批记录，按行哈希区分新增/修订/未变
+
+        Returns:
+            StoreDelta
+        """
+        entry = self.ensure_table(conn, sheet_name)
+        columns = entry['columns']
+        table = _quote(sheet_name)
+        delta = StoreDelta(sheet_name)
+
+        keyed = {}
+        for record in records or []:
+            key = tail_index.date_key(record.get('日期', ''), sheet_name)
+            if key is not None:
+                keyed.setdefault(key, record)
+        if not keyed:
+            return delta
+
+        existing = {}
+        keys = list(keyed)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            existing.update(conn.execute(
+                f'SELECT date_key, row_hash FROM {table} WHERE date_key IN ({placeholders})', chunk
+            ).fetchall())
+
+        percent_before = set(entry['percent'])
+        now = datetime.now().isoformat(timespec='seconds')
+        column_sql = ', '.join(_quote(col) for col in columns)
+        update_sql = ', '.join(f'{_quote(col)}=excluded.{_quote(col)}' for col in columns)
+        sql = (
+            f'INSERT INTO {table} (date_key, row_hash, {column_sql}, updated_at) '
+            f'VALUES (?, ?, {", ".join("?" * len(columns))}, ?) '
+            f'ON CONFLICT(date_key) DO UPDATE SET row_hash=excluded.row_hash, {update_sql}, '
+            f'updated_at=excluded.updated_at'
+        )
+        params = []
+        for key, record in keyed.items():
+            values = [record.get(col, '') for col in columns]
+            fingerprint = tail_index.row_fingerprint(values)
+            previous = existing.get(key)
+            if previous == fingerprint:
+                delta.unchanged += 1
+                continue
+            if previous is None:
+                delta.inserted.append(key)
+            else:
+                delta.corrected.append(key)
+            for col, value in zip(columns, values):
+                if isinstance(value, ingest.Percent):
+                    entry['percent'].add(col)
+            params.append([key, fingerprint] + [_encode(v) for v in values] + [now])
+
+        if params:
+            conn.executemany(sql, params)
+        if entry['percent'] != percent_before:
+            self._save_meta(conn, sheet_name, entry)
+        return delta
+
+    def write_results(self, results):
+        """
+        在一个事务中写入所有数据源的爬取结果，返回 {sheet_name: StoreDelta}
+
+        有任何新增或修订时，同一事务内递增数据集版本并记录各工作表的变更日期键。
+        """
+        deltas = {}
+        with self.transaction() as conn:
+            for sheet_name, data in results.items():
+                if not data:
+                    continue
+                records = data if isinstance(data, list) else [data]
+                deltas[sheet_name] = self.upsert(conn, sheet_name, records)
+
+            changed = [delta for delta in deltas.values() if delta]
+            if changed:
+                version = conn.execute(
+                    f'INSERT INTO {_quote(VERSIONS_TABLE)} (created_at) VALUES (?)',
+                    (datetime.now().isoformat(timespec='seconds'),),
+                ).lastrowid
+                conn.executemany(
+                    f'INSERT INTO {_quote(CHANGES_TABLE)} (version, sheet, date_key, kind) VALUES (?, ?, ?, ?)',
+                    [(version, delta.sheet_name, key, kind)
+                     for delta in changed
+                     for kind, keys in (('insert', delta.inserted), ('correct', delta.corrected))
+                     for key in keys],
+                )
+                for delta in changed:
+                    delta.version = version
+        return deltas
+
+    def current_version(self):
+        """当前数据集版本（尚无写入时为 0）"""
+        row = self._connect().execute(f'SELECT MAX(version) FROM {_quote(VERSIONS_TABLE)}').fetchone()
+        return row[0] or 0
+
+    def changes_since(self, since):
+        """
+        返回版本 since 之后新增或修订的行（取当前值，每个日期键只出现一次）
+
+        Returns:
+            (version, {sheet_name: {'columns': [...], 'inserted': [[...]], 'corrected': [[...]]}})
+        """
+        conn = self._connect()
+        # 在同一读事务中读取版本与数据，保证快照一致
+        conn.execute('BEGIN')
+        try:
+            version = conn.execute(f'SELECT MAX(version) FROM {_quote(VERSIONS_TABLE)}').fetchone()[0] or 0
+            kinds = {}
+            rows = conn.execute(
+                f'SELECT sheet, date_key, kind FROM {_quote(CHANGES_TABLE)} WHERE version > ? ORDER BY version',
+                (since,),
+            )
+            for sheet_name, key, kind in rows:
+                # 区间内先新增后修订的行仍视为新增
+                kinds.setdefault(sheet_name, {}).setdefault(key, kind)
+
+            changes = {}
+            for sheet_name, keyed in kinds.items():
+                entry = self._entry(sheet_name)
+                if entry is None:
+                    continue
+                column_sql = ', '.join(_quote(col) for col in entry['columns'])
+                result = {'columns': list(entry['columns']), 'inserted': [], 'corrected': []}
+                keys = sorted(keyed)
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    for row in conn.execute(
+                        f'SELECT date_key, {column_sql} FROM {_quote(sheet_name)} '
+                        f'WHERE date_key IN ({",".join("?" * len(chunk))}) ORDER BY date_key',
+                        chunk,
+                    ):
+                        bucket = 'inserted' if keyed[row[0]] == 'insert' else 'corrected'
+                        result[bucket].append(list(row[1:]))
+                changes[sheet_name] = result
+        finally:
+            conn.execute('COMMIT')
+        return version, changes
+
+    def _decode(self, sheet_name, entry, row):
+        """将数据库行还原为带类型的记录（日期列为 datetime，百分数列为 Percent）"""
+        is_monthly = sheet_name in config.MONTHLY_DATA_PAIRS
+        record = {}
+        for col, value in zip(entry['columns'], row):
+            if isinstance(value, str) and ((col == '日期' and not is_monthly) or col in ingest.DATE_COLUMNS):
+                try:
+                    value = ingest.to_datetime(value)
+                except ValueError:
+                    pass
+            elif isinstance(value, float) and col in entry['percent']:
+                value = ingest.Percent(value)
+            elif value is None:
+                value = ''
+            record[col] = value
+        return record
+
+    def _select(self, sheet_name, where='', params=(), order='ASC', limit=None):
+        entry = self._entry(sheet_name)
+        if entry is None:
+            return []
+        column_sql = ', '.join(_quote(col) for col in entry['columns'])
+        sql = f'SELECT {column_sql} FROM {_quote(sheet_name)} {where} ORDER BY date_key {order}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        rows = self._connect().execute(sql, params).fetchall()
+        return [self._decode(sheet_name, entry, row) for row in rows]
+
+    def tail(self, sheet_name, n):
+        """返回按日期升序排列的最后 n 条记录"""
+        return list(reversed(self._select(sheet_name, order='DESC', limit=n)))
+
+    def rows(self, sheet_name, keys=None):
+        """返回全部记录（或指定日期键的记录），按日期升序"""
+        if keys is None:
+            return self._select(sheet_name)
+        keys = list(keys)
+        if not keys:
+            return []
+        records = []
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            records.extend(self._select(sheet_name, f'WHERE date_key IN ({",".join("?" * len(chunk))})', chunk))
+        return records
+
+    def column_values(self, sheet_name, column, keys=None, after=None, before=None, limit=None):
+        """
+        返回单列的 [(日期键, 数据库中的值)]，按日期键升序
+
+        Args:
+            keys: 只取这些日期键
+            after: 只取大于该日期键的行
+            before: 只取小于该日期键的行
+            limit: 只取满足条件的最后 limit 行
+        """
+        entry = self._entry(sheet_name)
+        if entry is None or column not in entry['columns']:
+            return []
+        sql = f'SELECT date_key, {_quote(column)} FROM {_quote(sheet_name)}'
+        conn = self._connect()
+        if keys is not None:
+            keys = list(keys)
+            rows = []
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows.extend(conn.execute(f'{sql} WHERE date_key IN ({",".join("?" * len(chunk))})', chunk))
+            return sorted(rows)
+        clauses, params = [], []
+        if after is not None:
+            clauses.append('date_key > ?')
+            params.append(after)
+        if before is not None:
+            clauses.append('date_key < ?')
+            params.append(before)
+        where = f' WHERE {" AND ".join(clauses)}' if clauses else ''
+        if limit is not None:
+            rows = conn.execute(f'{sql}{where} ORDER BY date_key DESC LIMIT ?', params + [limit]).fetchall()
+            return rows[::-1]
+        return conn.execute(f'{sql}{where} ORDER BY date_key', params).fetchall()
+
+    def backfill_from_workbook(self, excel_paths, sheet_names):
+        """
+        为尚无数据的工作表从 Excel 回填历史数据（read_only 流式读取，单事务写入）
+
+        Args:
+            excel_paths: 工作簿路径或路径列表（按时间先后：归档工作簿在前，正式文件在后）
+            sheet_names: 需要检查的工作表
+
+        Returns:
+            dict: {sheet_name: 回填行数}
+        """
+        if isinstance(excel_paths, str):
+            excel_paths = [excel_paths]
+        excel_paths = [path for path in excel_paths if os.path.exists(path)]
+        pending = [name for name in sheet_names if self.count(name) == 0]
+        if not pending or not excel_paths:
+            return {}
+
+        filled = {}
+        with self.transaction() as conn:
+            for excel_path in excel_paths:
+                wb = load_workbook(excel_path, read_only=True)
+                try:
+                    for sheet_name in pending:
+                        if sheet_name not in wb.sheetnames:
+                            continue
+                        records = self._read_sheet_records(wb[sheet_name], sheet_name)
+                        delta = self.upsert(conn, sheet_name, records)
+                        filled[sheet_name] = filled.get(sheet_name, 0) + len(delta.inserted)
+                finally:
+                    wb.close()
+        if filled:
+            logger.info(f"🗄️ 已从Excel回填数据库: {', '.join(f'{k}({v})' for k, v in filled.items())}")
+        return filled
+
+    @staticmethod
+    def _read_sheet_records(ws, sheet_name):
+        """读取工作表中的数据行（跳过表头与无法解析日期的行），转换为带类型的记录"""
+        columns = sheet_writers.compile_plan(sheet_name).columns
+        records = []
+        for row in ws.iter_rows(min_row=2):
+            values = [cell.value for cell in row]
+            if not values or tail_index.parse_sheet_date(values[0], sheet_name) is None:
+                continue
+            record = {}
+            for col, cell in zip(columns, row):
+                value = cell.value
+                if isinstance(value, (int, float)) and '%' in (cell.number_format or ''):
+                    value = ingest.Percent(value)
+                record[col] = '' if value is None else value
+            record = ingest.coerce_record(sheet_name, record)
+            if sheet_name not in config.MONTHLY_DATA_PAIRS:
+                # 历史文本日期（如 SOFR 的 M/D/YYYY）按工作表规则解析
+                record['日期'] = tail_index.parse_sheet_date(values[0], sheet_name)
+            records.append(record)
+        return records
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path=None):
+    """返回进程内共享的存储实例（按数据库路径）"""
+    db_path = db_path or config.SERIES_DB_PATH
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = SeriesStore(db_path)
+            _stores[db_path] = store
+        return store
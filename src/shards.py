@@ -0,0 +1,274 @@
+"""
+按工作表分片的存储布局（可选，SHARDED_LAYOUT = True 时启用）
+
+每个工作表保存在独立的分片文件（shards/<工作表>.xlsx）中，并拥有自己的文件锁，
+互不相关的工作表可以由不同任务并行写入。合并的 Market Index.xlsx 在任务写入分片后组装
+（下载时再检查一次）：组装结果以各分片的内容 ETag 为键记录在清单中，只有分片内容自上次组装后
+发生变化时才重新生成，组装结果同样发布为不可变快照。
+"""
+import copy
+import fcntl
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from openpyxl import Workbook, load_workbook
+
+try:
+    import config
+    import merge_engine
+    import sheet_writers
+    import snapshots
+    import tail_index
+    import workbook_etag
+    from workbook_cache import shared_cache as workbook_cache
+except ImportError:
+    from src import config
+    from src import merge_engine
+    from src import sheet_writers
+    from src import snapshots
+    from src import tail_index
+    from src import workbook_etag
+    from src.workbook_cache import shared_cache as workbook_cache
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'ASSEMBLED.json'
+
+
+def shard_dir():
+    return config.SHARD_DIR
+
+
+def shard_path(sheet_name):
+    """返回工作表对应的分片文件路径"""
+    return os.path.join(shard_dir(), f"{sheet_name}.xlsx")
+
+
+def shard_sheet_names():
+    """参与分片的工作表：有列定义的全部工作表（汇率使用通用列定义）"""
+    names = list(config.CURRENCY_PAIRS)
+    names += [name for name in config.COLUMN_DEFINITIONS if name != 'CURRENCY' and name not in names]
+    return names
+
+
+@contextmanager
+def file_lock(path):
+    """跨进程独占文件锁"""
+    with open(path + '.lock', 'w') as lock_fd:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+
+
+def _copy_sheet(source, target):
+    """
+    复制工作表的单元格值与样式（字体、填充、边框、对齐、保护、数字格式）、行高列宽、
+    冻结窗格、合并单元格与条件格式
+
+    样式按对象复制而不是复制 cell._style：_style 只是源工作簿样式表中的下标，跨工作簿无效。
+    """
+    for row in source.iter_rows():
+        for cell in row:
+            if cell.value is None and not cell.has_style:
+                continue
+            new_cell = target.cell(row=cell.row, column=cell.column, value=cell.value)
+            if cell.has_style:
+                new_cell.font = copy.copy(cell.font)
+                new_cell.fill = copy.copy(cell.fill)
+                new_cell.border = copy.copy(cell.border)
+                new_cell.alignment = copy.copy(cell.alignment)
+                new_cell.protection = copy.copy(cell.protection)
+                new_cell.number_format = cell.number_format
+    for key, dimension in source.column_dimensions.items():
+        target_dimension = target.column_dimensions[key]
+        target_dimension.width = dimension.width
+        target_dimension.hidden = dimension.hidden
+    for key, dimension in source.row_dimensions.items():
+        target_dimension = target.row_dimensions[key]
+        target_dimension.height = dimension.height
+        target_dimension.hidden = dimension.hidden
+    target.freeze_panes = source.freeze_panes
+    for merged in source.merged_cells.ranges:
+        target.merge_cells(merged.coord)
+    for conditional in source.conditional_formatting:
+        for rule in conditional.rules:
+            target.conditional_formatting.add(str(conditional.sqref), copy.copy(rule))
+
+
+def _save_atomic(wb, path):
+    tmp_path = path + '.tmp'
+    wb.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def split_workbook(excel_path, sheet_names):
+    """为尚无分片的工作表从合并文件中拆分出分片（首次启用分片布局时）"""
+    missing = [name for name in sheet_names if not os.path.exists(shard_path(name))]
+    if not missing or not os.path.exists(excel_path):
+        return []
+    os.makedirs(shard_dir(), exist_ok=True)
+    source = load_workbook(excel_path)
+    created = []
+    for sheet_name in missing:
+        if sheet_name not in source.sheetnames:
+            continue
+        path = shard_path(sheet_name)
+        with file_lock(path):
+            if os.path.exists(path):
+                continue
+            wb = Workbook()
+            ws = wb.active
+            ws.title = sheet_name
+            _copy_sheet(source[sheet_name], ws)
+            _save_atomic(wb, path)
+            workbook_etag.record_etag(path)
+            created.append(sheet_name)
+    if created:
+        logger.info(f"🧩 已从Excel拆分分片: {', '.join(created)}")
+    return created
+
+
+def write_shard(sheet_name, records):
+    """
+    将记录合并写入单个分片：先用尾部索引无锁比对，确有变化时才加该分片的锁、加载并保存
+
+    Returns:
+        merge_engine.ChangeSet
+    """
+    path = shard_path(sheet_name)
+    columns = sheet_writers.compile_plan(sheet_name).columns
+    index = tail_index.TailIndex(path)
+
+    entry = index.refresh().get(sheet_name)
+    if entry is not None:
+        change_set = merge_engine.plan_merge(sheet_name, merge_engine.window_from_index(entry), records, columns)
+        if not change_set:
+            return change_set
+
+    with file_lock(path):
+        index.refresh()
+        wb = workbook_cache.checkout(path)
+        ws = wb[sheet_name]
+        last_row = tail_index.locate_last_row(ws, index)
+        window = merge_engine.window_from_sheet(ws, last_row, sheet_name)
+        change_set = merge_engine.plan_merge(sheet_name, window, records, columns)
+        if not change_set:
+            # 未修改的工作簿放回缓存
+            workbook_cache.refresh(path, wb)
+            return change_set
+
+        plan = sheet_writers.compile_plan(sheet_name)
+        for row_num, record in change_set.updates:
+            plan.write_row(ws, row_num, record)
+        if change_set.inserts:
+            plan.write_rows(ws, change_set.inserts[0][0], [record for _, record in change_set.inserts])
+        _save_atomic(wb, path)
+        workbook_cache.refresh(path, wb)
+        # 保存时记录分片的内容 ETag，组装时据此判断是否需要重新生成
+        workbook_etag.record_etag(path)
+
+        new_last = change_set.last_row or last_row
+        index.set(sheet_name, new_last, [cell.value for cell in ws[new_last]],
+                  merge_engine.sheet_window_rows(ws, new_last))
+        index.commit()
+    return change_set
+
+
+def write_sheets(render_sources):
+    """
+    并行写入各工作表的分片（每个分片独立加锁）
+
+    Returns:
+        dict: {sheet_name: ChangeSet 或 Exception}，不存在分片的工作表不出现在结果中
+    """
+    targets = {
+        name: records for name, records in render_sources.items()
+        if records and os.path.exists(shard_path(name))
+    }
+    if not targets:
+        return {}
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=config.SHARD_WRITE_WORKERS) as executor:
+        futures = {name: executor.submit(write_shard, name, records) for name, records in targets.items()}
+        for name, future in futures.items():
+            try:
+                outcomes[name] = future.result()
+            except Exception as e:
+                outcomes[name] = e
+    return outcomes
+
+
+def _manifest_path():
+    return os.path.join(shard_dir(), MANIFEST_NAME)
+
+
+def _shard_state():
+    """各分片的内容 ETag（读取 sidecar，分片被外部替换时才重新计算）"""
+    return {
+        name: workbook_etag.get_etag(shard_path(name))
+        for name in shard_sheet_names()
+        if os.path.exists(shard_path(name))
+    }
+
+
+def _read_manifest():
+    try:
+        with open(_manifest_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_assembled(excel_path, state):
+    """合并文件是否就是以当前分片 ETag 组装的结果（按内容比较，不受 mtime 或 inode 变化影响）"""
+    manifest = _read_manifest()
+    return (
+        manifest.get('shards') == state
+        and manifest.get('combined') == workbook_etag.get_etag(excel_path)
+    )
+
+
+def assemble(excel_path=None):
+    """
+    组装合并文件：分片内容自上次组装后有变化时，在全局锁内用分片内容替换对应工作表并保存，
+    同时发布快照与 ETag。合并文件已是最新时直接返回 False。
+
+    任务写入分片后即调用，下载接口再调用时通常直接命中清单，不在请求线程中重新组装。
+    """
+    excel_path = excel_path or config.EXCEL_OUTPUT_PATH
+    if not os.path.exists(excel_path) or _is_assembled(excel_path, _shard_state()):
+        return False
+
+    with file_lock(excel_path):
+        state = _shard_state()
+        if _is_assembled(excel_path, state):
+            return False
+
+        wb = load_workbook(excel_path)
+        for sheet_name in state:
+            source = load_workbook(shard_path(sheet_name))[sheet_name]
+            position = wb.sheetnames.index(sheet_name) if sheet_name in wb.sheetnames else len(wb.sheetnames)
+            if sheet_name in wb.sheetnames:
+                wb.remove(wb[sheet_name])
+            _copy_sheet(source, wb.create_sheet(sheet_name, position))
+
+        tmp_path = excel_path + '.tmp'
+        wb.save(tmp_path)
+        snapshot = snapshots.store(tmp_path)
+        os.replace(tmp_path, excel_path)
+        snapshots.flip(snapshot, excel_path)
+        combined = workbook_etag.record_etag(excel_path, snapshot.sha if snapshot else None)
+        workbook_cache.invalidate(excel_path)
+
+        manifest = {'shards': state, 'combined': combined}
+        tmp_manifest = _manifest_path() + '.tmp'
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_manifest, _manifest_path())
+    logger.info(f"🧩 已由 {len(state)} 个分片组装合并Excel文件")
+    return True
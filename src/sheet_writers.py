@@ -0,0 +1,127 @@
+"""
+按工作表编译的行写入计划
+
+每个工作表的写入方式（列顺序、日期列转换、对齐样式、数字格式）只在首次使用时编译一次，
+之后所有行都通过同一个计划批量写入：不再逐单元格查找 COLUMN_DEFINITIONS、
+遍历 if sheet_name == ... 判断链，也不再为每个单元格新建 Alignment 对象。
+"""
+import logging
+from datetime import datetime
+
+from openpyxl.styles import Alignment
+
+try:
+    import config
+    import ingest
+except ImportError:
+    from src import config
+    from src import ingest
+
+logger = logging.getLogger(__name__)
+
+# 共享（驻留）的对齐样式，所有单元格复用同一对象
+ALIGN_LEFT = Alignment(horizontal='left')
+ALIGN_RIGHT = Alignment(horizontal='right')
+
+# 日期列的显示格式，与历史上写入的文本格式保持一致
+DATE_FORMAT_DEFAULT = 'yyyy/m/dd'
+DATE_FORMAT_SHIBOR = 'yyyy-mm-dd'
+DATE_FORMAT_SOFR = 'm/d/yyyy'
+PERCENT_FORMAT = '0.00%'
+
+
+def _as_date(value):
+    """日期列转换：解析为 datetime，无法解析时原样保留"""
+    try:
+        return ingest.to_datetime(value)
+    except ValueError:
+        return value
+
+
+def resolve_columns(sheet_name):
+    """返回工作表对应的列定义（汇率数据使用通用列定义），未知工作表返回 None"""
+    if sheet_name in config.COLUMN_DEFINITIONS:
+        return config.COLUMN_DEFINITIONS[sheet_name]
+    if sheet_name in config.CURRENCY_PAIRS:
+        if sheet_name == 'USD 10Y':
+            return config.COLUMN_DEFINITIONS['USD 10Y']
+        return config.COLUMN_DEFINITIONS['CURRENCY']
+    return None
+
+
+class RowWriterPlan:
+    """单个工作表的编译后写入计划"""
+
+    __slots__ = ('sheet_name', 'columns', 'transforms', 'alignments', 'date_formats')
+
+    def __init__(self, sheet_name, columns, transforms, alignments, date_formats):
+        self.sheet_name = sheet_name
+        self.columns = tuple(columns)
+        self.transforms = tuple(transforms)
+        self.alignments = tuple(alignments)
+        self.date_formats = tuple(date_formats)
+
+    def row_values(self, record):
+        """按列顺序取出记录的值并应用列转换"""
+        values = []
+        for col_name, transform in zip(self.columns, self.transforms):
+            value = record.get(col_name, '')
+            if transform is not None and value not in ('', None):
+                value = transform(value)
+            values.append(value)
+        return values
+
+    def write_row(self, worksheet, row_num, record):
+        """写入单行（日期与百分数同时设置数字格式）"""
+        columns = zip(self.row_values(record), self.alignments, self.date_formats)
+        for col_idx, (value, alignment, date_format) in enumerate(columns, 1):
+            cell = worksheet.cell(row=row_num, column=col_idx, value=value)
+            cell.alignment = alignment
+            if isinstance(value, datetime):
+                cell.number_format = date_format
+            elif isinstance(value, ingest.Percent):
+                cell.number_format = PERCENT_FORMAT
+
+    def write_rows(self, worksheet, start_row, records):
+        """从 start_row 开始连续写入多行，返回最后写入的行号"""
+        row_num = start_row - 1
+        for row_num, record in enumerate(records, start_row):
+            self.write_row(worksheet, row_num, record)
+        return row_num
+
+
+_plans = {}
+
+
+def compile_plan(sheet_name):
+    """返回（必要时编译）工作表的写入计划"""
+    plan = _plans.get(sheet_name)
+    if plan is not None:
+        return plan
+
+    columns = resolve_columns(sheet_name)
+    if columns is None:
+        logger.warning(f"未找到 {sheet_name} 的列定义，使用默认列")
+        columns = ['日期']
+
+    transforms = [_as_date if col in ingest.DATE_COLUMNS else None for col in columns]
+    alignments = [ALIGN_RIGHT] * len(columns)
+    date_formats = [DATE_FORMAT_DEFAULT] * len(columns)
+
+    if sheet_name in config.MONTHLY_DATA_PAIRS:
+        # 月度数据：日期列为期间标签，左对齐，其余右对齐
+        alignments[0] = ALIGN_LEFT
+    else:
+        transforms[0] = _as_date
+        if sheet_name == 'Shibor':
+            date_formats[0] = DATE_FORMAT_SHIBOR
+            alignments = [ALIGN_LEFT] * len(columns)
+        elif sheet_name == 'SOFR':
+            date_formats[0] = DATE_FORMAT_SOFR
+            alignments[0] = ALIGN_LEFT
+            if len(alignments) > 1:
+                alignments[1] = ALIGN_LEFT
+
+    plan = RowWriterPlan(sheet_name, columns, transforms, alignments, date_formats)
+    _plans[sheet_name] = plan
+    return plan
@@ -0,0 +1,151 @@
+"""
+不可变、按内容寻址的工作簿快照
+
+每次保存 Excel 时，先把写好的临时文件以其 SHA-256 命名复制到快照目录，
+再用 os.replace 替换正式文件，最后原子地改写指针文件指向最新快照。
+快照是独立的副本（不与正式文件共用 inode），即使正式文件之后被就地修改，快照内容也不会改变。
+下载与其他只读接口通过指针读取一个完整、一致的快照，无需获取文件锁；
+旧快照按保留策略回收。
+"""
+import json
+import logging
+import os
+import shutil
+import time
+
+try:
+    import config
+    import workbook_etag
+except ImportError:
+    from src import config
+    from src import workbook_etag
+
+logger = logging.getLogger(__name__)
+
+POINTER_NAME = 'LATEST.json'
+SNAPSHOT_EXT = '.xlsx'
+
+
+class Snapshot:
+    """单个快照：内容哈希与文件路径"""
+
+    __slots__ = ('sha', 'path')
+
+    def __init__(self, sha, path):
+        self.sha = sha
+        self.path = path
+
+    def __repr__(self):
+        return f"Snapshot({self.sha[:12]})"
+
+
+def snapshot_dir():
+    return config.SNAPSHOT_DIR
+
+
+def _pointer_path():
+    return os.path.join(snapshot_dir(), POINTER_NAME)
+
+
+def _identity(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def store(tmp_path):
+    """
+    将刚保存的临时文件存入快照目录（在 os.replace 之前调用）
+
+    Returns:
+        Snapshot，失败时返回 None（不影响正常保存）
+    """
+    try:
+        os.makedirs(snapshot_dir(), exist_ok=True)
+        sha = workbook_etag.compute_etag(tmp_path)
+        path = os.path.join(snapshot_dir(), sha + SNAPSHOT_EXT)
+        if not os.path.exists(path):
+            # 复制而不是硬链接：硬链接与替换后的正式文件共用 inode，就地写入正式文件会改写快照
+            staging = path + '.tmp'
+            shutil.copy2(tmp_path, staging)
+            os.replace(staging, path)
+        return Snapshot(sha, path)
+    except Exception as e:
+        logger.warning(f"创建工作簿快照失败: {str(e)}")
+        return None
+
+
+def flip(snapshot, excel_path):
+    """os.replace 之后调用：原子地把指针指向新快照，并记录正式文件的标识"""
+    if snapshot is None:
+        return
+    payload = json.dumps({
+        'sha': snapshot.sha,
+        'file': os.path.basename(snapshot.path),
+        'live': _identity(excel_path),
+        'created_at': time.time(),
+    })
+    pointer = _pointer_path()
+    tmp_path = pointer + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, pointer)
+        logger.debug(f"快照指针已更新: {snapshot.sha[:12]}")
+    except Exception as e:
+        logger.warning(f"更新快照指针失败: {str(e)}")
+
+
+def current(excel_path=None):
+    """
+    返回指针指向的最新快照
+
+    正式文件在快照之后被外部替换（标识不一致）或快照缺失时返回 None，调用方回退为读取正式文件。
+    """
+    excel_path = excel_path or config.EXCEL_OUTPUT_PATH
+    try:
+        with open(_pointer_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    path = os.path.join(snapshot_dir(), data.get('file', ''))
+    if not data.get('sha') or not os.path.isfile(path):
+        return None
+    if data.get('live') != _identity(excel_path):
+        return None
+    return Snapshot(data['sha'], path)
+
+
+def collect_garbage(retention=None):
+    """按保留策略删除旧快照：保留最近 retention 个以及指针指向的快照"""
+    retention = retention or config.SNAPSHOT_RETENTION
+    try:
+        with open(_pointer_path(), 'r', encoding='utf-8') as f:
+            keep = {json.load(f).get('file')}
+    except (OSError, ValueError):
+        keep = set()
+
+    try:
+        entries = [
+            entry for entry in os.scandir(snapshot_dir())
+            if entry.is_file() and entry.name.endswith(SNAPSHOT_EXT)
+        ]
+    except OSError:
+        return 0
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+
+    removed = 0
+    for entry in entries[retention:]:
+        if entry.name in keep:
+            continue
+        try:
+            # 正在下载中的快照已被打开，删除目录项不影响其读取
+            os.remove(entry.path)
+            removed += 1
+        except OSError as e:
+            logger.debug(f"删除旧快照失败 {entry.name}: {str(e)}")
+    if removed:
+        logger.debug(f"已回收 {removed} 个旧快照")
+    return removed
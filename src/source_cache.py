@@ -0,0 +1,195 @@
+"""
+按数据源缓存的爬取结果（TTL 与数据源的发布节奏挂钩）
+
+每个数据源爬取成功后，结果与过期时间写入一个小型 SQLite 文件（source_cache.db），重启后依然有效。
+新任务中，缓存仍然新鲜的数据源直接使用缓存结果，不发起网络请求、不启动浏览器，
+任务耗时只取决于真正过期的数据源。
+
+过期时间：
+  - 汇率（CURRENCY_PAIRS）：SOURCE_CACHE_TTL['currency']（分钟级）
+  - 日频数据：SOURCE_CACHE_TTL 中按数据源配置的时长，否则为 SOURCE_CACHE_TTL['daily']
+  - 月度数据：到下一个发布日（SOURCE_RELEASE_DAYS）为止；若本次爬取的最新期数与上次相同
+    （发布延迟），改用 SOURCE_CACHE_TTL['monthly_retry'] 以便尽快重试
+"""
+import calendar
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, date, timedelta
+
+try:
+    import config
+    import tail_index
+except ImportError:
+    from src import config
+    from src import tail_index
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'source_cache'
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    return str(value)
+
+
+def _decode_hook(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+def dumps(data):
+    """序列化爬取结果（datetime/date 可由 loads 还原）"""
+    return json.dumps(data, ensure_ascii=False, default=_encode_default)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode_hook)
+
+
+def cadence(source):
+    """数据源的发布节奏：currency / daily / monthly"""
+    if source in config.CURRENCY_PAIRS:
+        return 'currency'
+    if source in config.MONTHLY_DATA_PAIRS:
+        return 'monthly'
+    return 'daily'
+
+
+def latest_period(source, data):
+    """爬取结果中最新的日期键（用于判断月度数据是否已发布新一期）"""
+    records = data if isinstance(data, list) else [data]
+    keys = [
+        tail_index.date_key(record.get('日期'), source)
+        for record in records if isinstance(record, dict)
+    ]
+    keys = [key for key in keys if tail_index.is_date_key(key)]
+    return max(keys) if keys else None
+
+
+def next_release(release_day, now=None):
+    """now 之后的下一个发布日（当月天数不足时取月末）零点"""
+    now = now or datetime.now()
+    year, month = now.year, now.month
+    for _ in range(2):
+        day = min(release_day, calendar.monthrange(year, month)[1])
+        candidate = datetime(year, month, day)
+        if candidate > now:
+            return candidate
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return candidate
+
+
+def ttl_seconds(source, data, previous_period=None, now=None):
+    """根据数据源的节奏计算缓存有效时长（秒）"""
+    ttl = config.SOURCE_CACHE_TTL
+    kind = cadence(source)
+    if source in ttl:
+        return ttl[source]
+    if kind != 'monthly':
+        return ttl[kind]
+
+    release_day = config.SOURCE_RELEASE_DAYS.get(source)
+    if release_day is None:
+        return ttl['daily']
+    period = latest_period(source, data)
+    if previous_period is not None and period is not None and period <= previous_period:
+        # 最新一期仍未发布：短时间后重试
+        return ttl['monthly_retry']
+    now = now or datetime.now()
+    return (next_release(release_day, now) - now).total_seconds()
+
+
+class SourceCache:
+    """数据源结果缓存（SQLite，多线程/多进程安全）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} '
+                '(source TEXT PRIMARY KEY, fetched_at REAL NOT NULL, expires_at REAL NOT NULL, '
+                'period TEXT, payload TEXT NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, source, now=None):
+        """返回仍然新鲜的缓存结果，过期或不存在时返回 None"""
+        now = now or time.time()
+        row = self._connect().execute(
+            f'SELECT expires_at, payload FROM {TABLE} WHERE source = ?', (source,)
+        ).fetchone()
+        if row is None or row[0] <= now:
+            return None
+        try:
+            return loads(row[1])
+        except ValueError:
+            return None
+
+    def put(self, source, data):
+        """写入爬取成功的结果，返回缓存有效时长（秒）"""
+        conn = self._connect()
+        row = conn.execute(f'SELECT period FROM {TABLE} WHERE source = ?', (source,)).fetchone()
+        ttl = ttl_seconds(source, data, previous_period=row[0] if row else None)
+        now = time.time()
+        conn.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (source, fetched_at, expires_at, period, payload) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (source, now, now + ttl, latest_period(source, data),
+             dumps(data)),
+        )
+        return ttl
+
+    def invalidate(self, source=None):
+        """使某个数据源（或全部）的缓存失效"""
+        if source is None:
+            self._connect().execute(f'DELETE FROM {TABLE}')
+        else:
+            self._connect().execute(f'DELETE FROM {TABLE} WHERE source = ?', (source,))
+
+    def status(self, now=None):
+        """返回 {source: 剩余有效秒数}（已过期的为 0）"""
+        now = now or time.time()
+        rows = self._connect().execute(f'SELECT source, expires_at FROM {TABLE}').fetchall()
+        return {source: max(0, int(expires_at - now)) for source, expires_at in rows}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_path=None):
+    """返回进程内共享的缓存实例（按文件路径）"""
+    db_path = db_path or config.SOURCE_CACHE_PATH
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            cache = SourceCache(db_path)
+            _caches[db_path] = cache
+        return cache
+
+
+def describe_ttl(seconds):
+    """将秒数格式化为简短的中文时长"""
+    delta = timedelta(seconds=int(seconds))
+    if delta.days:
+        return f"{delta.days}天{delta.seconds // 3600}小时"
+    if delta.seconds >= 3600:
+        return f"{delta.seconds // 3600}小时{delta.seconds % 3600 // 60}分钟"
+    return f"{delta.seconds // 60}分钟"
@@ -0,0 +1,279 @@
+"""
+工作表尾部索引（sidecar）
+
+在 Market Index.xlsx 旁边维护一个小的 JSON 索引文件，记录每个工作表的
+最后数据行号、最后日期、最后一行内容的哈希值，以及最后 W 行的 (日期键, 行号, 哈希)
+窗口（供合并引擎在不打开工作簿的情况下判定变更）。索引通过 xlsx 文件的
+mtime/size 校验有效性；失效时使用 openpyxl 的 read_only 流式模式惰性重建，
+从而避免每次运行都逆向扫描被格式撑大的 max_row。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime, date
+
+from openpyxl import load_workbook
+
+try:
+    import config
+    import ingest
+except ImportError:
+    from src import config
+    from src import ingest
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 2
+
+# 月度数据的期间标签，如 2025年08月份
+_PERIOD_RE = re.compile(r'^(\d{4})\s*年\s*(\d{1,2})\s*月份?$')
+
+
+def index_path_for(excel_path):
+    """返回 xlsx 文件对应的 sidecar 索引路径"""
+    return excel_path + config.TAIL_INDEX_SUFFIX
+
+
+def file_signature(path):
+    """返回文件的 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def parse_sheet_date(value, sheet_name):
+    """
+    将工作表第一列的日期值解析为 datetime
+
+    兼容 datetime 单元格以及各工作表历史写入的字符串格式：
+    SOFR 为 M/D/YYYY，Shibor 为 YYYY-MM-DD，其余为 YYYY/M/D；
+    月度数据的期间标签（2025年08月份）解析为当月 1 日。无法解析时返回 None。
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if not value:
+        return None
+    text = str(value).strip()
+    period = _PERIOD_RE.match(text)
+    if period:
+        return datetime(int(period.group(1)), int(period.group(2)), 1)
+    try:
+        for sep in ('/', '-'):
+            parts = text.split(' ')[0].split(sep)
+            if len(parts) != 3:
+                continue
+            if len(parts[0]) == 4:
+                year, month, day = map(int, parts)
+            elif len(parts[2]) == 4 or sheet_name == 'SOFR':
+                month, day, year = map(int, parts)
+            else:
+                return None
+            return datetime(year, month, day)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def date_key(value, sheet_name):
+    """返回用于比较的日期键：可解析的日期为 ISO 字符串，否则为原始文本（如月度数据的期间）"""
+    dt = parse_sheet_date(value, sheet_name)
+    if dt is not None:
+        return dt.strftime('%Y-%m-%d')
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def is_date_key(key):
+    """日期键是否为 ISO 日期（可以按字典序比较先后）"""
+    return key is not None and len(key) == 10 and key[4] == '-' and key[7] == '-'
+
+
+def _normalize_cell(value):
+    """单元格值规范化，使字符串 "7.1234"/"-0.12%" 与数值 7.1234/-0.0012 的哈希一致"""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    number = ingest.parse_number(value)
+    return repr(number) if number is not None else str(value).strip()
+
+
+def row_fingerprint(values):
+    """计算一行（不含日期列）内容的哈希，忽略末尾的空单元格"""
+    normalized = [_normalize_cell(v) for v in list(values)[1:]]
+    while normalized and normalized[-1] == '':
+        normalized.pop()
+    payload = '\x1f'.join(normalized)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def make_tail_entry(sheet_name, last_row, values, window=None):
+    """
+    根据最后一行的值构建索引条目
+
+    Args:
+        window: 最后 W 个非空行 [(row_num, values)]，按行号升序
+    """
+    values = list(values or [])
+    return {
+        'last_row': last_row,
+        'last_date': date_key(values[0], sheet_name) if values else None,
+        'row_hash': row_fingerprint(values) if values else None,
+        'values': [_jsonable(v) for v in values],
+        'window': [
+            [date_key(row_values[0], sheet_name), row_num, row_fingerprint(row_values)]
+            for row_num, row_values in (window or [])
+            if row_values
+        ],
+    }
+
+
+def locate_last_row(ws, index=None):
+    """
+    查找工作表最后一个非空行：优先使用尾部索引（O(1)），并用行哈希校验索引与内存中的工作表一致；
+    索引缺失或不一致时回退为逆向查找第一个非空行
+    """
+    entry = index.get(ws.title) if index is not None else None
+    if entry and entry.get('row_hash'):
+        row = entry['last_row']
+        values = [cell.value for cell in ws[row]]
+        if any(values) and row_fingerprint(values) == entry['row_hash']:
+            return row
+        logger.debug(f"{ws.title}: 尾部索引与工作表不一致，回退为逐行查找")
+
+    for row in reversed(range(1, ws.max_row + 1)):
+        if any(cell.value for cell in ws[row]):
+            return row
+    return 1  # 如果全为空，从第一行开始
+
+
+class TailIndex:
+    """
+    工作表尾部索引
+
+    用法：
+        index = TailIndex(excel_path)
+        entry = index.get('SOFR')        # 索引有效时 O(1) 返回，否则返回 None
+        entries = index.refresh()        # 索引失效时以 read_only 模式重建
+        index.set('SOFR', row, values)   # 写入路径更新尾部
+        index.commit()                   # 保存 xlsx 后重新盖章并落盘
+    """
+
+    def __init__(self, excel_path):
+        self.excel_path = excel_path
+        self.path = index_path_for(excel_path)
+        self._lock = threading.RLock()
+        self._data = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_FORMAT_VERSION and isinstance(data.get('sheets'), dict):
+                return data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"读取尾部索引失败，将重建: {str(e)}")
+        return {'version': INDEX_FORMAT_VERSION, 'mtime_ns': None, 'size': None, 'sheets': {}}
+
+    def is_fresh(self):
+        """索引是否与当前 xlsx 文件匹配"""
+        sig = file_signature(self.excel_path)
+        with self._lock:
+            return sig is not None and [self._data.get('mtime_ns'), self._data.get('size')] == list(sig)
+
+    def get(self, sheet_name):
+        """索引有效时返回工作表尾部条目，否则返回 None"""
+        if not self.is_fresh():
+            return None
+        with self._lock:
+            return self._data['sheets'].get(sheet_name)
+
+    def peek(self, sheet_name):
+        """不校验有效性，直接返回内存中的尾部条目（仅用于保存前后衔接）"""
+        with self._lock:
+            return self._data['sheets'].get(sheet_name)
+
+    def refresh(self):
+        """确保索引有效；失效时以 read_only 流式模式重建。返回 {sheet_name: entry}"""
+        if self.is_fresh():
+            with self._lock:
+                return dict(self._data['sheets'])
+        self.rebuild()
+        with self._lock:
+            return dict(self._data['sheets'])
+
+    def rebuild(self):
+        """以 read_only 流式模式扫描整个工作簿，重建所有工作表的尾部条目"""
+        sig = file_signature(self.excel_path)
+        if sig is None:
+            return
+        logger.debug(f"重建尾部索引: {os.path.basename(self.excel_path)}")
+        sheets = {}
+        wb = load_workbook(self.excel_path, read_only=True)
+        try:
+            for ws in wb.worksheets:
+                last_row, last_values = 1, None
+                window = deque(maxlen=config.MERGE_WINDOW_ROWS)
+                for row_idx, values in enumerate(ws.iter_rows(values_only=True), start=1):
+                    if any(v is not None and v != '' for v in values):
+                        last_row, last_values = row_idx, values
+                        window.append((row_idx, values))
+                sheets[ws.title] = make_tail_entry(ws.title, last_row, last_values, list(window))
+        finally:
+            wb.close()
+        with self._lock:
+            self._data = {
+                'version': INDEX_FORMAT_VERSION,
+                'mtime_ns': sig[0],
+                'size': sig[1],
+                'sheets': sheets,
+            }
+        self._write()
+
+    def set(self, sheet_name, last_row, values, window=None):
+        """更新某个工作表的尾部条目（仅内存，commit 后落盘）"""
+        with self._lock:
+            self._data['sheets'][sheet_name] = make_tail_entry(sheet_name, last_row, values, window)
+
+    def commit(self):
+        """xlsx 保存后调用：以新文件的 mtime/size 重新盖章并写入 sidecar"""
+        sig = file_signature(self.excel_path)
+        if sig is None:
+            return
+        with self._lock:
+            self._data['mtime_ns'], self._data['size'] = sig
+        self._write()
+
+    def _write(self):
+        with self._lock:
+            payload = json.dumps(self._data, ensure_ascii=False)
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"写入尾部索引失败: {str(e)}")
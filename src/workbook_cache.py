@@ -0,0 +1,137 @@
+"""
+进程级工作簿缓存
+
+在服务进程内缓存解析后的 openpyxl 工作簿，键为文件的 (path, mtime, size, inode)。
+文件被外部修改后缓存自动失效；本进程保存后通过 refresh() 原地更新键，
+连续的任务因此可以跳过整本工作簿的解析。
+
+缓存的工作簿是可变对象，因此以独占方式借出：checkout() 把条目从缓存中取出，
+任务保存成功后再通过 refresh() 放回。同时运行的另一个任务不会拿到同一个对象（未命中时从磁盘加载自己的副本），
+失败或被取消的任务不放回，其未保存的修改也就不会被下一个保存者写入文件。
+
+内存占用受显式预算约束：按工作表估算单元格占用，超出预算时按 LRU 淘汰。
+由于 openpyxl 无法在缺少部分工作表的情况下保存工作簿，淘汰单位为整本工作簿；
+单本工作簿超出预算时不进入缓存。
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from openpyxl import load_workbook
+
+try:
+    import config
+except ImportError:
+    from src import config
+
+logger = logging.getLogger(__name__)
+
+# 单个单元格在内存中的大致占用（Cell 对象 + 值 + 样式数组）
+CELL_COST_BYTES = 400
+
+
+def file_identity(path):
+    """返回文件的 (mtime_ns, size, inode)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def estimate_sheet_bytes(ws):
+    """估算单个工作表的内存占用"""
+    cells = getattr(ws, '_cells', None)
+    count = len(cells) if cells is not None else ws.max_row * ws.max_column
+    return count * CELL_COST_BYTES
+
+
+class _Entry:
+    __slots__ = ('identity', 'workbook', 'sheet_bytes')
+
+    def __init__(self, identity, workbook):
+        self.identity = identity
+        self.workbook = workbook
+        self.sheet_bytes = {ws.title: estimate_sheet_bytes(ws) for ws in workbook.worksheets}
+
+    @property
+    def size(self):
+        return sum(self.sheet_bytes.values())
+
+
+class WorkbookCache:
+    """带内存预算的工作簿 LRU 缓存（线程安全）"""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()  # {path: _Entry}
+        self._lock = threading.RLock()
+
+    def get(self, path):
+        """返回与磁盘文件一致的缓存工作簿；不存在或已失效时返回 None"""
+        path = os.path.abspath(path)
+        identity = file_identity(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if identity is None or entry.identity != identity:
+                logger.debug(f"工作簿缓存失效（文件已被外部修改）: {os.path.basename(path)}")
+                del self._entries[path]
+                return None
+            self._entries.move_to_end(path)
+            return entry.workbook
+
+    def checkout(self, path):
+        """
+        独占借出工作簿：命中时从缓存中取出（其他任务不会再拿到该对象），未命中时从磁盘加载；
+        保存成功后调用 refresh() 放回，失败时直接丢弃
+        """
+        with self._lock:
+            wb = self.get(path)
+            if wb is not None:
+                self._entries.pop(os.path.abspath(path), None)
+        if wb is not None:
+            logger.info(f"♻️ 命中工作簿缓存，跳过解析: {os.path.basename(path)}")
+            return wb
+        return load_workbook(path)
+
+    def refresh(self, path, workbook):
+        """本进程保存后调用：以新的文件标识原地更新缓存（重新估算各工作表占用）"""
+        self._put(path, workbook, file_identity(path))
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(os.path.abspath(path), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def used_bytes(self):
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def _put(self, path, workbook, identity):
+        path = os.path.abspath(path)
+        if identity is None:
+            return
+        entry = _Entry(identity, workbook)
+        with self._lock:
+            self._entries.pop(path, None)
+            if entry.size > self.budget_bytes:
+                logger.debug(
+                    f"工作簿 {os.path.basename(path)} 估算占用 {entry.size // (1024 * 1024)}MB，超出缓存预算，不缓存"
+                )
+                return
+            self._entries[path] = entry
+            # 超出预算时淘汰最久未使用的条目
+            while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+                evicted_path, _ = self._entries.popitem(last=False)
+                logger.debug(f"工作簿缓存超出预算，淘汰: {os.path.basename(evicted_path)}")
+
+
+# 进程级共享缓存
+shared_cache = WorkbookCache(config.WORKBOOK_CACHE_BUDGET_MB * 1024 * 1024)
@@ -0,0 +1,75 @@
+"""
+工作簿下载的强 ETag
+
+保存 Excel 后计算文件内容的 SHA-256 作为强 ETag，连同文件的 (mtime_ns, size)
+写入 sidecar 文件。下载接口直接读取 sidecar，无需在每次请求时重新哈希整个文件；
+sidecar 与文件不匹配（例如文件被外部替换）时惰性重新计算。
+"""
+import hashlib
+import json
+import logging
+import os
+
+try:
+    import config
+except ImportError:
+    from src import config
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def etag_path_for(excel_path):
+    """返回 xlsx 文件对应的 ETag sidecar 路径"""
+    return excel_path + config.ETAG_SUFFIX
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def compute_etag(path):
+    """计算文件内容的 SHA-256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_etag(excel_path, etag=None):
+    """保存 xlsx 后调用：计算 ETag（已知内容哈希时直接使用）并写入 sidecar，返回 ETag"""
+    signature = _signature(excel_path)
+    if signature is None:
+        return None
+    etag = etag or compute_etag(excel_path)
+    payload = json.dumps({'etag': etag, 'mtime_ns': signature[0], 'size': signature[1]})
+    sidecar = etag_path_for(excel_path)
+    tmp_path = sidecar + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, sidecar)
+    except Exception as e:
+        logger.warning(f"写入ETag文件失败: {str(e)}")
+    return etag
+
+
+def get_etag(excel_path):
+    """返回 xlsx 当前内容的 ETag；sidecar 缺失或过期时重新计算"""
+    signature = _signature(excel_path)
+    if signature is None:
+        return None
+    try:
+        with open(etag_path_for(excel_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if [data.get('mtime_ns'), data.get('size')] == signature and data.get('etag'):
+            return data['etag']
+    except (OSError, ValueError):
+        pass
+    return record_etag(excel_path)
@@ -353,6 +353,27 @@ function checkStatus() {
         statusMessage.innerHTML = `<span class="text-danger">✗</span> 任务失败：${data.error || '未知错误'}`;
         downloadBtn.style.display = "inline-block";
         downloadBtn.disabled = false;
+      } else if (data.status === "cancelled") {
+        // 任务已取消：停止轮询与日志流，恢复按钮（Excel 未被本任务修改）
+        clearInterval(statusCheckInterval);
+        statusCheckInterval = null;
+        if (eventSource) {
+          eventSource.close();
+          eventSource = null;
+        }
+        if (queueInterval) clearInterval(queueInterval);
+        queueInterval = setInterval(pollQueue, 5000);
+
+        updateBtn.disabled = false;
+        updateBtn.innerHTML = '<span class="button-text">更新数据</span>';
+        statusMessage.innerHTML = '<span class="text-warning">⛔</span> 任务已取消，Excel文件未被修改。';
+        downloadBtn.style.display = "inline-block";
+        downloadBtn.disabled = false;
+      } else if (data.status === "cancelling") {
+        // 正在取消：任务会在下一个安全点退出，继续轮询直到变为 cancelled
+        statusMessage.innerHTML = `
+          <span class="spinner-border spinner-border-sm text-warning" role="status" aria-hidden="true"></span>
+          正在取消任务，将在当前数据源完成后停止...`;
       } else if (data.status === "queued" && data.position) {
         // 若仍在排队，刷新提示位置
         statusMessage.innerHTML = `
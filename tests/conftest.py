@@ -0,0 +1,97 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import tempfile
+
+import pytest
+from openpyxl import Workbook
+
+# 导入 config 时不要求存在真实的 Market Index.xlsx；各测试通过 workdir 夹具改用临时目录
+os.environ.setdefault('MARKET_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'Market Index.xlsx'))
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import config  # noqa: E402
+
+
+def make_workbook(path, sheets):
+    """按 {工作表名: [行]} 创建工作簿，第一行为 COLUMN_DEFINITIONS 中的表头"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append(config.COLUMN_DEFINITIONS.get(name, ['日期', 'value']))
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+    return path
+
+
+def daily_rows(count, start=datetime(2024, 1, 1), value=1.0):
+    """ESTER 风格的日频行：[日期, 数值]"""
+    return [[start + timedelta(days=i), value + i] for i in range(count)]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """把 Excel 及其旁边的运行时文件全部指向临时目录"""
+    excel_path = str(tmp_path / 'Market Index.xlsx')
+    monkeypatch.setattr(config, 'EXCEL_OUTPUT_PATH', excel_path)
+    monkeypatch.setattr(config, 'SERIES_DB_PATH', str(tmp_path / 'market_data.db'))
+    monkeypatch.setattr(config, 'SERIES_NPY_DIR', str(tmp_path / 'series_npy'))
+    monkeypatch.setattr(config, 'SOURCE_CACHE_PATH', str(tmp_path / 'source_cache.db'))
+    monkeypatch.setattr(config, 'CHECKPOINT_PATH', str(tmp_path / 'checkpoints.db'))
+    monkeypatch.setattr(config, 'SCHEDULER_LOCK_PATH', str(tmp_path / 'scheduler.lock'))
+    monkeypatch.setattr(config, 'LOG_SPILL_DIR', str(tmp_path / 'job_logs'))
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(config, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(config, 'SHARD_DIR', str(tmp_path / 'shards'))
+    return tmp_path
+
+
+@pytest.fixture
+def workbook_path(workdir):
+    """包含 ESTER（日频，10 行）与 PPI（月度，2 行）的临时工作簿"""
+    return make_workbook(config.EXCEL_OUTPUT_PATH, {
+        'ESTER': daily_rows(10),
+        'PPI': [['2025年07月份', 1, 2, 3], ['2025年08月份', 4, 5, 6]],
+    })
+
+
+@pytest.fixture
+def client(workdir):
+    """Flask 测试客户端（导入 app 会启动空闲的队列 worker 线程）"""
+    import app
+    app.app.config['TESTING'] = True
+    return app.app.test_client()
+
+
+@pytest.fixture
+def run_update(workbook_path):
+    """
+    不爬取、直接执行写入阶段：把结果写入检查点，再以 retry_failed 运行 update_excel
+
+    Returns:
+        函数 run(results, **attrs) -> (analyzer, update_excel 的返回值)
+    """
+    import uuid
+
+    import checkpoints
+    import market_data_crawler
+
+    def run(results, **attrs):
+        journal = checkpoints.get_journal()
+        job_id = uuid.uuid4().hex
+        journal.begin(job_id, list(results))
+        for source, data in results.items():
+            journal.record_success(job_id, source, data)
+        analyzer = market_data_crawler.MarketDataAnalyzer()
+        analyzer.job_id = job_id
+        for name, value in attrs.items():
+            setattr(analyzer, name, value)
+        return analyzer, analyzer.update_excel(retry_failed=job_id)
+
+    return run
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+import archive
+import config
+from conftest import daily_rows, make_workbook
+
+TODAY = datetime(2024, 1, 10)
+
+
+def dates(ws):
+    return [ws.cell(row=row, column=1).value for row in range(2, ws.max_row + 1)]
+
+
+def build(path):
+    # 2023-12-25 ~ 2024-01-10，共 17 行
+    return make_workbook(path, {
+        'ESTER': daily_rows(17, start=datetime(2023, 12, 25)),
+        'PPI': [['2023年11月份', 1, 2, 3]],
+    })
+
+
+def test_expired_rows_move_to_yearly_archives(workdir):
+    wb = load_workbook(build(config.EXCEL_OUTPUT_PATH))
+    assert archive.archive_expired_rows(wb, horizon_days=5, today=TODAY) == {'ESTER': 11}
+
+    assert dates(wb['ESTER'])[0] == datetime(2024, 1, 5) and len(dates(wb['ESTER'])) == 6
+    assert wb['PPI'].max_row == 2
+    assert [os.path.basename(path) for path in archive.archive_paths()] == [
+        'Market Index 2023.xlsx', 'Market Index 2024.xlsx',
+    ]
+    archived_2023 = load_workbook(archive.archive_path(2023))['ESTER']
+    assert archived_2023['A1'].value == '日期'
+    assert dates(archived_2023) == [datetime(2023, 12, day) for day in range(25, 32)]
+
+
+def test_rerun_after_partial_failure_does_not_duplicate(workdir):
+    path = build(config.EXCEL_OUTPUT_PATH)
+    archive.archive_expired_rows(load_workbook(path), horizon_days=5, today=TODAY)
+    # 归档已保存但正式文件未保存（例如保存前崩溃）：重跑不会重复归档
+    wb = load_workbook(path)
+    archive.archive_expired_rows(wb, horizon_days=5, today=TODAY)
+    assert len(dates(load_workbook(archive.archive_path(2024))['ESTER'])) == 4
+    assert len(dates(load_workbook(archive.archive_path(2023))['ESTER'])) == 7
+
+
+def test_partial_update_only_touches_named_sheets(workdir):
+    wb = load_workbook(build(config.EXCEL_OUTPUT_PATH))
+    assert archive.archive_expired_rows(wb, horizon_days=5, today=TODAY, sheet_names=['SOFR']) == {}
+    assert archive.archive_paths() == []
+
+
+def test_merged_export_restores_full_history_and_is_cached(workdir):
+    path = build(config.EXCEL_OUTPUT_PATH)
+    assert archive.merged_export(path) is None
+
+    wb = load_workbook(path)
+    archive.archive_expired_rows(wb, horizon_days=5, today=TODAY)
+    wb.save(path)
+
+    export_path, key = archive.merged_export(path)
+    assert len(dates(load_workbook(export_path)['ESTER'])) == 17
+    assert dates(load_workbook(export_path)['ESTER'])[0] == datetime(2023, 12, 25)
+    mtime = os.stat(export_path).st_mtime_ns
+    assert archive.merged_export(path) == (export_path, key)
+    assert os.stat(export_path).st_mtime_ns == mtime
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+import pytest
+
+import checkpoints
+
+SOURCES = ['USD CNY', 'ESTER', 'SOFR', 'PPI']
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return checkpoints.Journal(str(tmp_path / 'checkpoints.db'))
+
+
+def test_retry_plan_keeps_successes_and_lists_the_rest_in_order(journal):
+    journal.begin('job1', SOURCES)
+    journal.record_success('job1', 'ESTER', [{'日期': datetime(2025, 9, 4), 'value': 1.92}])
+    journal.record_failure('job1', 'USD CNY', '超时')
+    journal.record_success('job1', 'PPI', [{'日期': '2025年08月份', '当月': -2.9}])
+
+    results, pending, requested = journal.retry_plan('job1')
+    assert requested == SOURCES
+    assert pending == ['USD CNY', 'SOFR']
+    assert results['ESTER'] == [{'日期': datetime(2025, 9, 4), 'value': 1.92}]
+    assert set(results) == {'ESTER', 'PPI'}
+
+
+def test_retry_of_a_retry_only_handles_the_remainder(journal):
+    journal.begin('job1', SOURCES)
+    journal.record_success('job1', 'ESTER', [])
+    journal.record_failure('job1', 'SOFR', '超时')
+
+    _, pending, requested = journal.retry_plan('job1')
+    journal.begin('job2', requested, retry_of='job1')
+    journal.record_success('job2', 'SOFR', [])
+    journal.record_failure('job2', 'PPI', '页面结构变化')
+
+    _, pending, _ = journal.retry_plan('job2')
+    assert pending == ['USD CNY', 'PPI']
+    # 原任务的检查点不受重试影响
+    assert journal.retry_plan('job1')[1] == ['USD CNY', 'SOFR', 'PPI']
+
+
+def test_a_later_success_replaces_a_failure(journal):
+    journal.begin('job1', ['ESTER'])
+    journal.record_failure('job1', 'ESTER', '超时')
+    journal.record_success('job1', 'ESTER', [])
+    assert journal.retry_plan('job1')[1] == []
+
+
+def test_unknown_job_raises(journal):
+    assert journal.sources('missing') is None
+    with pytest.raises(ValueError):
+        journal.retry_plan('missing')
+
+
+def test_collect_keeps_the_newest_jobs(journal, monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(checkpoints.time, 'time', lambda: next(clock))
+    for job_id in ('a', 'b', 'c'):
+        journal.begin(job_id, ['ESTER'])
+        journal.record_success(job_id, 'ESTER', [])
+    journal.collect(keep=2)
+    assert journal.sources('a') is None
+    assert journal.sources('b') == ['ESTER'] and journal.sources('c') == ['ESTER']
+
+
+def test_write_phase_failure_is_retried_without_crawling(run_update, workbook_path):
+    from openpyxl import load_workbook
+
+    # run_update 从全部成功的检查点重试：没有需要重新爬取的数据源，直接重新写入
+    analyzer, results = run_update({'ESTER': [{'日期': '2024-01-11', 'value': 11.0}]})
+    assert results
+    assert load_workbook(workbook_path)['ESTER'].max_row == 12
+
+
+def test_retry_endpoint(client, monkeypatch):
+    import app
+    import lane_queue
+
+    monkeypatch.setattr(app, 'jobs', {})
+    monkeypatch.setattr(app, 'job_tokens', {})
+    monkeypatch.setattr(app, 'job_queue', lane_queue.LaneQueue(app.config.JOB_LANES, app.config.JOB_AGING_SECONDS))
+    journal = checkpoints.get_journal()
+    journal.begin('job1', ['ESTER', 'SOFR', 'PPI'])
+    journal.record_success('job1', 'ESTER', [])
+    journal.record_failure('job1', 'PPI', '超时')
+
+    assert client.get('/api/update?retry_failed=missing').status_code == 400
+
+    app.jobs['job1'] = {'id': 'job1', 'status': 'running', 'lane': 'interactive'}
+    assert client.get('/api/update?retry_failed=job1').status_code == 409
+
+    app.jobs['job1']['status'] = 'failed'
+    body = client.get('/api/update?retry_failed=job1').get_json()
+    assert body['status'] == 'queued' and body['sources'] == ['SOFR', 'PPI']
+    assert app.jobs[body['job_id']]['retry_of'] == 'job1'
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import derived_metrics
+import series_store
+
+MA5 = {'name': 'ESTER MA5', 'kind': 'rolling_mean', 'sheet': 'ESTER', 'column': 'value', 'window': 5}
+YOY = {'name': 'ESTER 同比', 'kind': 'yoy', 'sheet': 'ESTER', 'column': 'value'}
+START = datetime(2023, 1, 1)
+
+
+def records(values, start=START):
+    return [{'日期': start + timedelta(days=i), 'value': value} for i, value in enumerate(values)]
+
+
+def write(store, recs, metrics):
+    deltas = store.write_results({'ESTER': recs})
+    return derived_metrics.update_metrics(store, deltas, metrics)
+
+
+def expected_ma(values, window):
+    return [sum(values[i - window + 1:i + 1]) / window for i in range(window - 1, len(values))]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = series_store.SeriesStore(str(tmp_path / 'market_data.db'))
+    yield store
+    store.close()
+
+
+def test_initial_run_matches_full_computation(store):
+    values = [float(i % 7 + i) for i in range(100)]
+    assert write(store, records(values), [MA5]) == {'ESTER MA5': 96}
+    assert [v for _, v in derived_metrics.read_metric(store, 'ESTER MA5')] == pytest.approx(expected_ma(values, 5))
+
+
+def test_append_only_computes_new_rows(store):
+    values = [float(i) for i in range(100)]
+    write(store, records(values), [MA5])
+    values.append(100.0)
+    assert write(store, records(values)[-1:], [MA5]) == {'ESTER MA5': 1}
+
+
+def test_correcting_latest_row_recomputes_only_the_tail(store):
+    values = [float(i % 7 + i) for i in range(100)]
+    write(store, records(values), [MA5])
+
+    values[-1] = 500.0
+    assert write(store, records(values)[-1:], [MA5]) == {'ESTER MA5': 1}
+    values[-3] = -20.0
+    assert write(store, records(values)[-3:-2], [MA5]) == {'ESTER MA5': 3}
+    assert [v for _, v in derived_metrics.read_metric(store, 'ESTER MA5')] == pytest.approx(expected_ma(values, 5))
+
+
+def test_correction_older_than_window_rebuilds(store):
+    values = [float(i) for i in range(100)]
+    write(store, records(values), [MA5])
+    values[10] = 1000.0
+    assert write(store, records(values)[10:11], [MA5]) == {'ESTER MA5': 96}
+    assert [v for _, v in derived_metrics.read_metric(store, 'ESTER MA5')] == pytest.approx(expected_ma(values, 5))
+
+
+def test_out_of_order_insert_rebuilds(store):
+    values = [float(i) for i in range(20)]
+    recs = records(values)
+    write(store, recs[:10] + recs[11:], [MA5])
+    assert write(store, [recs[10]], [MA5]) == {'ESTER MA5': 16}
+    assert [v for _, v in derived_metrics.read_metric(store, 'ESTER MA5')] == pytest.approx(expected_ma(values, 5))
+
+
+def test_yoy_tail_recompute_matches_full_computation(store):
+    values = [100.0 + i for i in range(800)]
+    write(store, records(values), [YOY])
+    values[-2] = 2000.0
+    assert write(store, records(values)[-2:-1], [YOY]) == {'ESTER 同比': 2}
+
+    result = dict(derived_metrics.read_metric(store, 'ESTER 同比'))
+    by_key = {(START + timedelta(days=i)).strftime('%Y-%m-%d'): v for i, v in enumerate(values)}
+    for key in list(result)[-5:]:
+        base = derived_metrics._year_before(key)
+        assert result[key] == pytest.approx(by_key[key] / by_key[base] - 1)
@@ -0,0 +1,58 @@
+from datetime import date, datetime
+
+import pytest
+
+import ingest
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('7.1234', 7.1234),
+    ('1,234.5', 1234.5),
+    ('-0.12', -0.12),
+    ('−3', -3.0),
+    ('1.2K', 1200.0),
+    ('3.5万', 35000.0),
+    ('2亿', 2e8),
+    ('.5', 0.5),
+])
+def test_parse_number(text, expected):
+    assert ingest.parse_number(text) == pytest.approx(expected)
+
+
+def test_percent_becomes_fraction():
+    value = ingest.parse_number('-0.12%')
+    assert isinstance(value, ingest.Percent)
+    assert value == pytest.approx(-0.0012)
+
+
+@pytest.mark.parametrize('text', ['-', 'SOFR', '', '  ', '1.2.3', True, None])
+def test_non_numbers_return_none(text):
+    assert ingest.parse_number(text) is None
+
+
+@pytest.mark.parametrize('text', ['2025/9/15', '2025-09-15', '2025年09月15日', '09/15/2025', 'Sep 15, 2025'])
+def test_dates_in_known_formats(text):
+    assert ingest.to_datetime(text) == datetime(2025, 9, 15)
+
+
+def test_to_datetime_accepts_date_objects_and_rejects_garbage():
+    assert ingest.to_datetime(date(2025, 1, 2)) == datetime(2025, 1, 2)
+    with pytest.raises(ValueError):
+        ingest.to_datetime('不是日期')
+
+
+def test_date_parser_is_memoized():
+    ingest.parse_any_date.cache_clear()
+    ingest.to_datetime('2025/9/15')
+    ingest.to_datetime('2025/9/15')
+    assert ingest.parse_any_date.cache_info().hits == 1
+
+
+def test_coerce_record_keeps_monthly_period_labels():
+    daily = ingest.coerce_record('ESTER', {'日期': '2025/9/15', 'value': '1.92%'})
+    assert daily['日期'] == datetime(2025, 9, 15)
+    assert isinstance(daily['value'], ingest.Percent)
+
+    monthly = ingest.coerce_results('PPI', [{'日期': '2025年08月份', '当月': '-2.9', '发布日期': '2025-09-10'}])
+    assert monthly == [{'日期': '2025年08月份', '当月': -2.9, '发布日期': datetime(2025, 9, 10)}]
+    assert ingest.coerce_record('SOFR', {'Rate Type': 'SOFR'}) == {'Rate Type': 'SOFR'}
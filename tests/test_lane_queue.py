@@ -0,0 +1,44 @@
+import lane_queue
+
+LANES = {
+    'interactive': {'priority': 0, 'max_running': 1},
+    'scheduled': {'priority': 10, 'max_running': 1},
+    'backfill': {'priority': 20, 'max_running': 1},
+}
+
+
+def test_higher_priority_lane_is_taken_first():
+    q = lane_queue.LaneQueue(LANES, aging_seconds=60)
+    q.put('b', 'backfill', enqueued_at=1000)
+    q.put('i', 'interactive', enqueued_at=1001)
+    assert q.get(timeout=0) == 'i'
+
+
+def test_aging_lets_a_waiting_backfill_job_overtake():
+    q = lane_queue.LaneQueue(LANES, aging_seconds=60)
+    now = 100000
+    # 等待 25 分钟的补数任务：20 - 25 = -5，优先于刚入队的交互任务（0）
+    q.put('b', 'backfill', enqueued_at=now - 25 * 60)
+    q.put('i', 'interactive', enqueued_at=now)
+    assert [job_id for job_id, _, _ in q.order()] == ['b', 'i']
+
+
+def test_lane_concurrency_limit():
+    q = lane_queue.LaneQueue(LANES, aging_seconds=60)
+    q.put('b1', 'backfill', enqueued_at=1)
+    q.put('b2', 'backfill', enqueued_at=2)
+    assert q.get(timeout=0) == 'b1'
+    # 补数通道已达并发上限
+    assert q.get(timeout=0) is None
+    q.task_done('b1')
+    assert q.get(timeout=0) == 'b2'
+    assert q.running() == {'b2': 'backfill'}
+
+
+def test_unknown_lane_falls_back_to_interactive_and_remove():
+    q = lane_queue.LaneQueue(LANES, aging_seconds=60)
+    q.put('x', 'nope', enqueued_at=1)
+    assert q.order()[0][1] == 'interactive'
+    assert q.remove('x') is True
+    assert q.remove('x') is False
+    assert q.qsize() == 0
@@ -0,0 +1,165 @@
+import threading
+
+import log_bus
+
+
+def entries(count, start=0):
+    return [{'message': f'line {i}'} for i in range(start, start + count)]
+
+
+def read_all(bus, stream, cursor=0):
+    collected = []
+    while True:
+        new_entries, cursor, done = bus.wait(stream, cursor, timeout=0)
+        collected += new_entries
+        if done or not new_entries:
+            return collected, cursor
+
+
+def test_job_stream_spills_and_replays_in_order(tmp_path):
+    bus = log_bus.LogBus(10, 100, str(tmp_path / 'job_logs'))
+    bus.start_job('job1')
+    for entry in entries(25):
+        bus.publish(entry, 'job1')
+    stream = bus.stream('job1')
+    assert len(stream.entries) <= 10 and stream.base > 0
+    assert [e['message'] for e in bus.snapshot('job1')] == [f'line {i}' for i in range(25)]
+    collected, cursor = read_all(bus, stream)
+    assert [e['message'] for e in collected] == [f'line {i}' for i in range(25)]
+    assert cursor == 25
+
+
+def test_spill_writes_outside_the_bus_lock(tmp_path, monkeypatch):
+    bus = log_bus.LogBus(4, 100, str(tmp_path / 'job_logs'))
+    real_open = log_bus.gzip.open
+    lock_free = []
+
+    def probe():
+        acquired = bus._cond.acquire(timeout=1)
+        if acquired:
+            bus._cond.release()
+        lock_free.append(acquired)
+
+    def checking_open(*args, **kwargs):
+        # 写入期间其他线程必须能获得总线锁（例如订阅者或其他任务的日志）
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(log_bus.gzip, 'open', checking_open)
+    for entry in entries(5):
+        bus.publish(entry, 'job1')
+    assert lock_free == [True]
+
+
+def test_spill_failure_does_not_log_through_the_bus(tmp_path, capsys):
+    blocker = tmp_path / 'not_a_dir'
+    blocker.write_text('')
+    bus = log_bus.LogBus(4, 100, str(blocker / 'job_logs'))
+    for entry in entries(12):
+        bus.publish(entry, 'job1')
+    assert bus.spill_failures > 0
+    assert len(bus.stream('job1').entries) <= 4
+    assert [e['message'] for e in bus.stream(None).entries] == [f'line {i}' for i in range(12)]
+    assert '写入任务日志溢出文件失败' in capsys.readouterr().err
+
+
+def test_evicted_job_replays_from_spill_file(tmp_path):
+    bus = log_bus.LogBus(10, 100, str(tmp_path / 'job_logs'))
+    bus.start_job('job1')
+    for entry in entries(15):
+        bus.publish(entry, 'job1')
+    bus.close('job1')
+    bus.evict('job1', record={'id': 'job1', 'status': 'completed'})
+
+    stream = bus.stream('job1', create=False)
+    assert stream.closed and stream.total == 15
+    collected, _ = read_all(bus, stream)
+    assert [e['message'] for e in collected] == [f'line {i}' for i in range(15)]
+    assert bus.load_record('job1')['status'] == 'completed'
+
+
+def test_wait_wakes_on_publish(tmp_path):
+    import time
+
+    bus = log_bus.LogBus(10, 100, str(tmp_path / 'job_logs'))
+    bus.start_job('job1')
+    stream = bus.stream('job1')
+    threading.Timer(0.05, bus.publish, args=({'message': 'hello'}, 'job1')).start()
+    started = time.time()
+    new_entries, cursor, done = bus.wait(stream, 0, timeout=5)
+    assert new_entries == [{'message': 'hello'}] and cursor == 1 and not done
+    assert time.time() - started < 2
+
+    # 没有新日志时超时返回空列表（SSE 心跳）
+    assert bus.wait(stream, cursor, timeout=0.01) == ([], 1, False)
+    bus.close('job1')
+    assert bus.wait(stream, cursor, timeout=5) == ([], 1, True)
+
+
+def test_global_stream_follows_the_current_job(tmp_path):
+    bus = log_bus.LogBus(10, 3, str(tmp_path / 'job_logs'))
+    bus.start_job('job1')
+    first = bus.stream()
+    for entry in entries(5):
+        bus.publish(entry)
+    # 全局流是环形缓冲区：只保留最新的 3 条
+    assert [e['message'] for e in read_all(bus, first)[0]] == ['line 2', 'line 3', 'line 4']
+
+    bus.start_job('job2')
+    assert bus.stream() is first
+    bus.close('job1')
+    assert not first.closed
+    bus.close('job2')
+    assert first.closed
+
+    bus.start_job('job3')
+    assert bus.stream() is not first and bus.stream().total == 0
+
+
+def test_sse_endpoint_streams_job_logs(client):
+    bus = log_bus.shared_bus
+    bus.start_job('sse-job')
+    bus.publish({'message': 'crawling'}, 'sse-job')
+    bus.close('sse-job')
+    response = client.get('/api/logs?job_id=sse-job')
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert body.startswith('data: ') and '"crawling"' in body
+    assert client.get('/api/logs?job_id=unknown').get_data(as_text=True) == ''
+
+
+def test_spill_retention_removes_oldest_files(tmp_path):
+    import os
+
+    bus = log_bus.LogBus(10, 100, str(tmp_path / 'job_logs'), spill_retention=2)
+    for i, job_id in enumerate(['a', 'b', 'c']):
+        bus.publish({'message': job_id}, job_id)
+        bus.close(job_id)
+        bus.evict(job_id, record={'id': job_id})
+        os.utime(bus.spill_path(job_id), ns=(i, i))
+    bus.publish({'message': 'd'}, 'd')
+    bus.close('d')
+    bus.evict('d', record={'id': 'd'})
+    assert sorted(os.listdir(tmp_path / 'job_logs')) == [
+        'c.job.json', 'c.log.gz', 'd.job.json', 'd.log.gz',
+    ]
+
+
+def test_finished_jobs_beyond_history_limit_are_evicted(client, monkeypatch, tmp_path):
+    import app
+
+    monkeypatch.setattr(app, 'jobs', {})
+    monkeypatch.setattr(app.config, 'JOB_HISTORY_LIMIT', 1)
+    monkeypatch.setattr(log_bus.shared_bus, 'spill_dir', str(tmp_path / 'job_logs'))
+    for i, job_id in enumerate(['old', 'new']):
+        app.jobs[job_id] = {'id': job_id, 'status': 'completed', 'finished_at': i, 'updated': False}
+        log_bus.shared_bus.publish({'message': f'{job_id} done'}, job_id)
+        log_bus.shared_bus.close(job_id)
+
+    app.evict_finished_jobs()
+    assert list(app.jobs) == ['new']
+    # 已淘汰的任务仍可查询状态与日志
+    assert client.get('/api/status?job_id=old').get_json()['status'] == 'completed'
+    assert '"old done"' in client.get('/api/logs?job_id=old').get_data(as_text=True)
@@ -0,0 +1,80 @@
+import os
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+import market_data_crawler
+
+
+def ester(day, value):
+    return {'ESTER': [{'日期': f'2024-01-{day:02d}', 'value': value}]}
+
+
+def test_unchanged_results_skip_opening_the_workbook(run_update, workbook_path, monkeypatch):
+    run_update(ester(10, 10.0))
+    mtime = os.stat(workbook_path).st_mtime_ns
+
+    def fail(*args, **kwargs):
+        raise AssertionError('快速路径不应打开工作簿')
+
+    monkeypatch.setattr(market_data_crawler.MarketDataAnalyzer, '_load_for_diff', fail)
+    monkeypatch.setattr(market_data_crawler.MarketDataAnalyzer, '_acquire_file_lock', fail)
+    analyzer, results = run_update(ester(10, 10.0))
+    assert results and analyzer.change_sets == {}
+    assert os.stat(workbook_path).st_mtime_ns == mtime
+
+
+def test_revised_latest_row_takes_the_write_path(run_update, workbook_path):
+    run_update(ester(10, 10.0))
+    analyzer, results = run_update(ester(10, 12.5))
+    assert results
+    change_set = analyzer.change_sets['ESTER']
+    assert change_set.updates and not change_set.inserts
+    ws = load_workbook(workbook_path)['ESTER']
+    assert ws.max_row == 11 and ws.cell(row=11, column=2).value == 12.5
+
+
+def test_concurrent_save_between_diff_and_lock_is_rediffed(run_update, workbook_path, monkeypatch):
+    acquire = market_data_crawler.MarketDataAnalyzer._acquire_file_lock
+
+    def other_writer_saves_first(self, lock_fd, *args, **kwargs):
+        # 本任务比对完成后、获得文件锁之前，另一个写入者保存了文件
+        wb = load_workbook(workbook_path)
+        wb['ESTER']['D1'] = 'external'
+        wb['ESTER'].append([datetime(2024, 1, 11), 11.0])
+        wb.save(workbook_path + '.other')
+        os.replace(workbook_path + '.other', workbook_path)
+        return acquire(self, lock_fd, *args, **kwargs)
+
+    monkeypatch.setattr(market_data_crawler.MarketDataAnalyzer, '_acquire_file_lock', other_writer_saves_first)
+    analyzer, results = run_update({'ESTER': [
+        {'日期': '2024-01-11', 'value': 11.0},
+        {'日期': '2024-01-12', 'value': 12.0},
+    ]})
+    assert results
+    change_set = analyzer.change_sets['ESTER']
+    assert [row for row, _ in change_set.inserts] == [13]
+
+    ws = load_workbook(workbook_path)['ESTER']
+    assert ws['D1'].value == 'external'
+    assert [ws.cell(row=row, column=2).value for row in (12, 13)] == [11.0, 12.0]
+    assert ws.max_row == 13
+
+
+def test_resolve_sources_expands_groups_in_crawl_order():
+    import config
+
+    everything = market_data_crawler.all_sources()
+    assert market_data_crawler.resolve_sources(None) == everything
+    assert market_data_crawler.resolve_sources(' , ') == everything
+    assert market_data_crawler.resolve_sources('monthly') == list(config.MONTHLY_DATA_PAIRS)
+
+    picked = market_data_crawler.resolve_sources(['ppi', 'ESTER', 'daily'])
+    assert picked == [name for name in everything if name in set(config.DAILY_DATA_PAIRS) | {'PPI'}]
+
+
+def test_resolve_sources_rejects_unknown_names():
+    import pytest
+
+    with pytest.raises(ValueError, match='nope'):
+        market_data_crawler.resolve_sources('ESTER,nope')
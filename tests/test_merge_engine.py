@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+import merge_engine
+import tail_index
+
+COLUMNS = ['日期', 'value']
+START = datetime(2024, 1, 1)
+
+
+def sheet(count):
+    ws = Workbook().active
+    ws.append(COLUMNS)
+    for i in range(count):
+        ws.append([START + timedelta(days=i), 1.0 + i])
+    return ws
+
+
+def record(day, value):
+    return {'日期': START + timedelta(days=day), 'value': value}
+
+
+def plan(ws, records, window=None):
+    merge_window = merge_engine.window_from_sheet(ws, ws.max_row, 'ESTER', window)
+    return merge_engine.plan_merge('ESTER', merge_window, records, COLUMNS)
+
+
+def test_classifies_inserts_updates_and_unchanged():
+    ws = sheet(10)
+    change_set = plan(ws, [record(12, 13.0), record(9, 10.0), record(8, 99.0), record(10, 11.0)])
+    assert change_set
+    assert change_set.unchanged == 1
+    assert [(row, r['value']) for row, r in change_set.updates] == [(10, 99.0)]
+    # 新增按日期升序追加在最后一行之后
+    assert [(row, r['value']) for row, r in change_set.inserts] == [(12, 11.0), (13, 13.0)]
+    assert change_set.last_row == 13
+    assert change_set.describe() == '新增 2 行，修订 1 行，未变 1 行'
+
+
+def test_unchanged_batch_is_falsy():
+    change_set = plan(sheet(5), [record(i, 1.0 + i) for i in range(5)])
+    assert not change_set and change_set.unchanged == 5 and change_set.last_row is None
+
+
+def test_records_older_than_window_are_skipped():
+    change_set = plan(sheet(10), [record(1, 50.0), record(0, 1.0)], window=3)
+    assert change_set.skipped == 2 and not change_set
+
+
+def test_duplicate_dates_keep_the_first_record():
+    change_set = plan(sheet(3), [record(3, 4.0), record(3, 5.0)])
+    assert [r['value'] for _, r in change_set.inserts] == [4.0]
+
+
+def test_index_window_matches_sheet_window():
+    ws = sheet(10)
+    rows = merge_engine.sheet_window_rows(ws, ws.max_row)
+    entry = {
+        'last_row': ws.max_row,
+        'window': [
+            [tail_index.date_key(values[0], 'ESTER'), row_num, tail_index.row_fingerprint(values)]
+            for row_num, values in rows
+        ],
+    }
+    records = [record(9, 10.0), record(8, 0.5), record(11, 12.0)]
+    from_sheet = plan(ws, records)
+    from_index = merge_engine.plan_merge('ESTER', merge_engine.window_from_index(entry), records, COLUMNS)
+    assert from_index.updates == from_sheet.updates
+    assert from_index.inserts == from_sheet.inserts
+    assert from_index.unchanged == from_sheet.unchanged == 1
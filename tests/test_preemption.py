@@ -0,0 +1,155 @@
+import threading
+import time
+
+import pytest
+
+import app
+import cancellation
+import checkpoints
+import lane_queue
+
+
+class FakeAnalyzer:
+    """
+    模拟爬虫：每个数据源的结果写入检查点。
+    爬完 ESTER 后等待被抢占；爬完 PMI 后等待 release，使两个 worker 同时被占用
+    """
+
+    calls = []
+    first_source_done = threading.Event()
+    holding = threading.Event()
+    release = threading.Event()
+
+    def __init__(self):
+        self.cancel_token = None
+        self.job_id = None
+        self.store_deltas = {}
+
+    def close_driver(self, *args):
+        pass
+
+    def update_excel(self, sources=None, retry_failed=None):
+        journal = checkpoints.get_journal()
+        if retry_failed:
+            results, pending, requested = journal.retry_plan(retry_failed)
+        else:
+            results, pending, requested = {}, list(sources), list(sources)
+        journal.begin(self.job_id, requested, retry_of=retry_failed)
+        FakeAnalyzer.calls.append((self.job_id, retry_failed, list(pending)))
+        for source in pending:
+            self.cancel_token.check()
+            results[source] = [{'日期': '2024-01-01', 'value': 1.0}]
+            journal.record_success(self.job_id, source, results[source])
+            if source == 'ESTER' and not FakeAnalyzer.first_source_done.is_set():
+                FakeAnalyzer.first_source_done.set()
+                # 等待高优先级任务抢占
+                self.cancel_token.wait(5)
+            if source == 'PMI':
+                FakeAnalyzer.holding.set()
+                FakeAnalyzer.release.wait(5)
+        return results
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def fake_crawler(workdir, monkeypatch):
+    FakeAnalyzer.calls = []
+    FakeAnalyzer.first_source_done = threading.Event()
+    FakeAnalyzer.holding = threading.Event()
+    FakeAnalyzer.release = threading.Event()
+    monkeypatch.setattr(app.market_data_crawler, 'MarketDataAnalyzer', FakeAnalyzer)
+    monkeypatch.setattr(app.market_data_crawler, 'all_sources', lambda: ['ESTER', 'SOFR', 'PPI', 'CPI', 'PMI'])
+    monkeypatch.setattr(app.config, 'UPDATE_COALESCE', False)
+    yield FakeAnalyzer
+    FakeAnalyzer.release.set()
+
+
+def test_preempted_job_resumes_from_its_checkpoint(fake_crawler):
+    assert app.config.JOB_WORKERS == 2
+    background, _ = app.submit_update(['ESTER', 'SOFR', 'PPI'], lane=lane_queue.LANE_BACKFILL)
+    assert fake_crawler.first_source_done.wait(5)
+    scheduled, _ = app.submit_update(['PMI'], lane=lane_queue.LANE_SCHEDULED)
+    assert fake_crawler.holding.wait(5)
+
+    # 两个 worker 都被占用：交互任务抢占优先级最低的 backfill 任务
+    interactive, _ = app.submit_update(['CPI'])
+    assert wait_for(lambda: background['status'] == 'completed' and interactive['status'] == 'completed')
+    fake_crawler.release.set()
+    assert wait_for(lambda: scheduled['status'] == 'completed')
+
+    assert background['preemptions'] == 1
+    assert fake_crawler.calls == [
+        (background['id'], None, ['ESTER', 'SOFR', 'PPI']),
+        (scheduled['id'], None, ['PMI']),
+        (interactive['id'], None, ['CPI']),
+        # 从抢占点继续：只爬取尚未完成的数据源
+        (background['id'], background['id'], ['SOFR', 'PPI']),
+    ]
+    results, pending, _ = checkpoints.get_journal().retry_plan(background['id'])
+    assert pending == [] and set(results) == {'ESTER', 'SOFR', 'PPI'}
+
+
+def test_cancel_token_runs_callbacks_and_interrupts_waits():
+    token = cancellation.CancelToken()
+    closed = []
+    token.add_callback(lambda: closed.append(True))
+    threading.Timer(0.05, token.cancel, args=(cancellation.REASON_PREEMPTED,)).start()
+    started = time.time()
+    assert token.wait(5)
+    assert time.time() - started < 2
+    assert closed == [True]
+    assert not token.cancel()
+    with pytest.raises(cancellation.JobCancelled) as excinfo:
+        token.check()
+    assert excinfo.value.reason == cancellation.REASON_PREEMPTED
+
+    token.add_callback(lambda: closed.append(True))
+    assert closed == [True, True]
+
+
+@pytest.fixture
+def running_job(client, monkeypatch):
+    """在测试自己的队列中放入一个运行中的任务（不会被 worker 执行）"""
+    monkeypatch.setattr(app, 'jobs', {})
+    monkeypatch.setattr(app, 'job_tokens', {})
+    monkeypatch.setattr(app, 'job_queue', lane_queue.LaneQueue(app.config.JOB_LANES, app.config.JOB_AGING_SECONDS))
+    # 只有一个 worker：它被运行中的任务占用时，新任务才需要抢占
+    monkeypatch.setattr(app.config, 'JOB_WORKERS', 1)
+
+    def start(job_id, lane, **fields):
+        app.jobs[job_id] = dict({'id': job_id, 'status': 'running', 'lane': lane, 'started_at': time.time()}, **fields)
+        app.job_tokens[job_id] = cancellation.CancelToken()
+        app.job_queue.put(job_id, lane)
+        assert app.job_queue.get(timeout=0) == job_id
+        return app.job_tokens[job_id]
+
+    return start
+
+
+def test_interactive_job_preempts_a_scheduled_job(running_job):
+    token = running_job('scheduled-job', lane_queue.LANE_SCHEDULED)
+    assert app.preempt_for({'id': 'new', 'lane': lane_queue.LANE_INTERACTIVE}) == 'scheduled-job'
+    assert token.cancelled and token.reason == cancellation.REASON_PREEMPTED
+    # 已被抢占（令牌已取消）的任务不会被重复抢占
+    assert app.preempt_for({'id': 'other', 'lane': lane_queue.LANE_INTERACTIVE}) is None
+
+
+def test_preemption_rules(running_job, monkeypatch):
+    token = running_job('interactive-job', lane_queue.LANE_INTERACTIVE)
+    # 交互通道不可被抢占；同优先级或更低优先级的任务也不能抢占
+    assert app.preempt_for({'id': 'new', 'lane': lane_queue.LANE_INTERACTIVE}) is None
+    assert not token.cancelled
+
+    monkeypatch.setattr(app, 'job_queue', lane_queue.LaneQueue(app.config.JOB_LANES, app.config.JOB_AGING_SECONDS))
+    token = running_job('backfill-job', lane_queue.LANE_BACKFILL, preemptions=app.config.JOB_MAX_PREEMPTIONS)
+    # 达到最大抢占次数的任务不再被抢占
+    assert app.preempt_for({'id': 'new', 'lane': lane_queue.LANE_SCHEDULED}) is None
+    assert not token.cancelled
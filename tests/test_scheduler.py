@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import scheduler
+
+BERLIN = ZoneInfo('Europe/Berlin')
+
+
+def schedule(**spec):
+    spec.setdefault('sources', ['ESTER'])
+    spec.setdefault('tz', 'Europe/Berlin')
+    return scheduler.Schedule(spec)
+
+
+def test_next_run_in_the_schedule_time_zone():
+    ester = schedule(times=['08:20', '17:00'])
+    now = datetime(2025, 3, 3, 7, 0, tzinfo=timezone.utc)  # 柏林 08:00
+    assert ester.next_after(now) == datetime(2025, 3, 3, 8, 20, tzinfo=BERLIN)
+    later = datetime(2025, 3, 3, 16, 30, tzinfo=timezone.utc)  # 柏林 17:30
+    assert ester.next_after(later) == datetime(2025, 3, 4, 8, 20, tzinfo=BERLIN)
+
+
+def test_weekday_and_monthday_filters():
+    weekdays = schedule(times=['08:20'], weekdays=[0, 1, 2, 3, 4])
+    saturday = datetime(2025, 3, 8, 12, 0, tzinfo=BERLIN)
+    assert weekdays.next_after(saturday) == datetime(2025, 3, 10, 8, 20, tzinfo=BERLIN)
+
+    monthly = schedule(sources=['PPI'], times=['09:45'], monthdays=[9], tz='Asia/Shanghai')
+    after_release = datetime(2025, 9, 9, 10, 0, tzinfo=ZoneInfo('Asia/Shanghai'))
+    assert monthly.next_after(after_release) == datetime(2025, 10, 9, 9, 45, tzinfo=ZoneInfo('Asia/Shanghai'))
+
+
+def test_jitter_only_delays():
+    jittered = schedule(times=['08:20'], jitter=600)
+    now = datetime(2025, 3, 3, 6, 0, tzinfo=timezone.utc)
+    base = jittered.next_after(now)
+    for _ in range(20):
+        assert 0 <= (jittered.plan(now) - base).total_seconds() <= 600
+
+
+def test_run_due_submits_one_merged_partial_update(tmp_path):
+    submitted = []
+    runner = scheduler.Scheduler([
+        {'name': 'ESTER', 'sources': ['ESTER'], 'times': ['08:20'], 'tz': 'Europe/Berlin'},
+        {'name': 'rates', 'sources': ['ESTER', 'SOFR'], 'times': ['08:20'], 'tz': 'Europe/Berlin'},
+        {'name': 'PPI', 'sources': ['PPI'], 'times': ['12:00'], 'tz': 'Europe/Berlin'},
+    ], submitted.append, lock_path=str(tmp_path / 'scheduler.lock'))
+    start = datetime(2025, 3, 3, 8, 0, tzinfo=BERLIN)
+    for item in runner.schedules:
+        item.plan(start)
+
+    assert runner.run_due(datetime(2025, 3, 3, 7, 0, tzinfo=BERLIN)) is None
+    runner.run_due(datetime(2025, 3, 3, 8, 21, tzinfo=BERLIN))
+    assert submitted == [['ESTER', 'SOFR']]
+    assert runner.schedules[0].next_run == datetime(2025, 3, 4, 8, 20, tzinfo=BERLIN)
+    assert runner.schedules[2].next_run == datetime(2025, 3, 3, 12, 0, tzinfo=BERLIN)
+
+
+def test_only_one_process_holds_the_scheduler_lock(tmp_path):
+    lock_path = str(tmp_path / 'scheduler.lock')
+    first = scheduler.Scheduler([], print, lock_path=lock_path)
+    second = scheduler.Scheduler([], print, lock_path=lock_path)
+    assert first._acquire_lock()
+    assert not second._acquire_lock()
+    first._lock_fd.close()
+    assert second._acquire_lock()
+    second._lock_fd.close()
+
+
+def test_missing_zoneinfo_warns_and_falls_back_to_local_time(monkeypatch, caplog):
+    monkeypatch.setattr(scheduler, 'ZoneInfo', None)
+    with caplog.at_level('WARNING', logger=scheduler.__name__):
+        assert schedule(times=['08:20']).tz is None
+    assert 'Europe/Berlin' in caplog.text
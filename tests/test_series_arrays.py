@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import series_arrays
+import series_store
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[333], y[777] = 50.0, -50.0
+    keep = series_arrays.lttb(x, y, 20)
+    assert len(keep) == 20
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 333 in keep and 777 in keep
+
+
+def test_lttb_returns_everything_below_threshold():
+    assert series_arrays.lttb(np.arange(5), np.ones(5), 10).tolist() == [0, 1, 2, 3, 4]
+    assert series_arrays.lttb(np.arange(5), np.ones(5), 2).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_query_slices_range_and_drops_nan():
+    start = datetime(2024, 1, 1)
+    records = [{'日期': start + timedelta(days=i), 'value': i if i != 3 else None} for i in range(10)]
+    series = series_arrays.build_series('ESTER', records)
+    first = series_arrays.to_epoch_day('2024-01-03')
+    last = series_arrays.to_epoch_day('2024-01-06')
+    result, count = series_arrays.query(series, first, last)
+    assert count == 4
+    assert result['value']['dates'] == ['2024-01-03', '2024-01-05', '2024-01-06']
+    assert result['value']['values'] == [2.0, 4.0, 5.0]
+
+
+def test_cache_refresh_reloads_changed_sheets(tmp_path):
+    store = series_store.SeriesStore(str(tmp_path / 'market_data.db'))
+    start = datetime(2024, 1, 1)
+    store.write_results({'ESTER': [{'日期': start + timedelta(days=i), 'value': float(i)} for i in range(5)]})
+    cache = series_arrays.SeriesCache(lambda: store)
+    assert len(cache.get('ESTER')) == 5
+    assert cache.get('PPI') is None
+
+    store.write_results({'ESTER': [{'日期': start + timedelta(days=5), 'value': 5.0}]})
+    assert len(cache.get('ESTER')) == 5
+    cache.refresh(['ESTER'])
+    assert len(cache.get('ESTER')) == 6
+    store.close()
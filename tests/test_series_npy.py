@@ -0,0 +1,84 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import config
+import series_npy
+import series_store
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def store(workdir):
+    store = series_store.SeriesStore(str(workdir / 'market_data.db'))
+    yield store
+    store.close()
+
+
+def write(store, count):
+    return store.write_results({'ESTER': [
+        {'日期': START + timedelta(days=i), 'value': float(i)} for i in range(count)
+    ]})
+
+
+def test_export_and_memory_mapped_load(store):
+    write(store, 5)
+    assert series_npy.stale_sheets(['ESTER', 'PPI']) == ['ESTER', 'PPI']
+    assert series_npy.export_sheets(store, ['ESTER', 'PPI']) == ['ESTER']
+    assert series_npy.stale_sheets(['ESTER']) == []
+
+    series = series_npy.load_sheet('ESTER')
+    assert isinstance(series.days, np.memmap)
+    assert series.days.dtype == np.int64 and series.days[0] == (START - datetime(1970, 1, 1)).days
+    assert series.columns['value'].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert series_npy.read_manifest('ESTER')['rows'] == 5
+
+
+def test_new_version_leaves_mapped_arrays_intact(store):
+    write(store, 3)
+    series_npy.export_sheets(store, ['ESTER'])
+    old = series_npy.load_sheet('ESTER')
+
+    for count in (4, 5, 6):
+        write(store, count)
+        series_npy.export_sheets(store, ['ESTER'])
+
+    assert old.columns['value'].tolist() == [0.0, 1.0, 2.0]
+    assert len(series_npy.load_sheet('ESTER')) == 6
+    versions = sorted(name for name in os.listdir(series_npy.sheet_dir('ESTER')) if name.startswith('v'))
+    assert versions == ['v3', 'v4']
+
+
+def test_export_disabled_without_directory(store, monkeypatch):
+    monkeypatch.setattr(config, 'SERIES_NPY_DIR', '')
+    write(store, 2)
+    assert series_npy.export_sheets(store, ['ESTER']) == []
+    assert series_npy.stale_sheets(['ESTER']) == []
+
+
+def test_same_version_reexport_keeps_live_directory(store):
+    write(store, 3)
+    series_npy.export_sheets(store, ['ESTER'])
+    mapped = series_npy.load_sheet('ESTER')
+    manifest = series_npy.read_manifest('ESTER')
+
+    # 同一版本再次导出：manifest 已指向该目录，不删除重写
+    series_npy.export_sheets(store, ['ESTER'])
+    assert series_npy.read_manifest('ESTER') == manifest
+    assert mapped.columns['value'].tolist() == [0.0, 1.0, 2.0]
+
+    # 目录已存在但 manifest 不指向它：写入新的唯一目录后再切换
+    base = series_npy.sheet_dir('ESTER')
+    os.remove(os.path.join(base, series_npy.MANIFEST_NAME))
+    series_npy.export_sheets(store, ['ESTER'])
+    assert series_npy.read_manifest('ESTER')['dir'] == 'v1-1'
+    assert mapped.columns['value'].tolist() == [0.0, 1.0, 2.0]
+    assert len(series_npy.load_sheet('ESTER')) == 3
+
+    write(store, 4)
+    series_npy.export_sheets(store, ['ESTER'])
+    versions = sorted(name for name in os.listdir(base) if name.startswith('v'))
+    assert versions == ['v1-1', 'v2']
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import series_store
+
+START = datetime(2024, 1, 1)
+
+
+def ester(days, value=1.0):
+    return [{'日期': START + timedelta(days=day), 'value': value + day} for day in days]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = series_store.SeriesStore(str(tmp_path / 'market_data.db'))
+    yield store
+    store.close()
+
+
+def test_versions_only_advance_on_changes(store):
+    assert store.current_version() == 0
+    deltas = store.write_results({'ESTER': ester(range(3))})
+    assert deltas['ESTER'].version == 1
+    deltas = store.write_results({'ESTER': ester(range(3))})
+    assert not deltas['ESTER'] and deltas['ESTER'].version is None
+    assert store.current_version() == 1
+
+
+def test_changes_since_reports_current_values_once(store):
+    store.write_results({'ESTER': ester(range(3))})
+    store.write_results({'ESTER': ester([3])})
+    store.write_results({'ESTER': [{'日期': START, 'value': 99.0}]})
+
+    version, changes = store.changes_since(1)
+    assert version == 3
+    assert changes['ESTER']['columns'] == ['日期', 'value']
+    assert changes['ESTER']['inserted'] == [['2024-01-04', 4.0]]
+    assert changes['ESTER']['corrected'] == [['2024-01-01', 99.0]]
+
+    # 区间内先新增后修订的行仍视为新增，且只出现一次
+    _, changes = store.changes_since(0)
+    assert [row[0] for row in changes['ESTER']['inserted']] == ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04']
+    assert changes['ESTER']['corrected'] == []
+    assert store.changes_since(3) == (3, {})
+
+
+@pytest.mark.parametrize('since', ['-1', 'abc', '1.5', '', '٣'])
+def test_changes_endpoint_rejects_invalid_since(client, since):
+    response = client.get(f'/api/changes?since={since}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_changes_endpoint_returns_changes(client):
+    series_store.get_store().write_results({'ESTER': ester(range(2))})
+    response = client.get('/api/changes?since=0')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['since'] == 0 and body['version'] == 1
+    assert len(body['changes']['ESTER']['inserted']) == 2
+    assert client.get('/api/changes').get_json()['version'] == 1
+
+
+def test_upsert_classifies_rows_by_hash(store):
+    delta = store.write_results({'ESTER': ester(range(3))})['ESTER']
+    assert delta.inserted == ['2024-01-01', '2024-01-02', '2024-01-03'] and not delta.corrected
+
+    delta = store.write_results({'ESTER': ester(range(2)) + [{'日期': START + timedelta(days=2), 'value': 7.0}]})['ESTER']
+    assert delta.inserted == [] and delta.corrected == ['2024-01-03'] and delta.unchanged == 2
+    assert delta.describe() == '修订 1，未变 2'
+    assert store.count('ESTER') == 3
+
+
+def test_rows_round_trip_types(store):
+    import ingest
+
+    store.write_results({'SOFR': [{'日期': START, 'Rate Type': 'SOFR', 'RATE(%)': ingest.Percent(0.0531)}]})
+    record = store.rows('SOFR')[0]
+    assert record['日期'] == START
+    assert isinstance(record['RATE(%)'], ingest.Percent) and record['RATE(%)'] == pytest.approx(0.0531)
+    assert record['VOLUME ($Billions)'] == ''
+
+
+def test_tail_and_column_values(store):
+    store.write_results({'ESTER': ester(range(10))})
+    assert [r['value'] for r in store.tail('ESTER', 3)] == [8.0, 9.0, 10.0]
+    assert store.column_values('ESTER', 'value', after='2024-01-08') == [('2024-01-09', 9.0), ('2024-01-10', 10.0)]
+    assert store.column_values('ESTER', 'value', before='2024-01-05', limit=2) == [('2024-01-03', 3.0), ('2024-01-04', 4.0)]
+    assert store.column_values('ESTER', 'value', keys=['2024-01-02']) == [('2024-01-02', 2.0)]
+    assert store.column_values('ESTER', 'missing') == []
+
+
+def test_backfill_reads_existing_workbook_once(store, workbook_path):
+    assert store.backfill_from_workbook(workbook_path, ['ESTER', 'PPI', 'SOFR']) == {'ESTER': 10, 'PPI': 2}
+    assert store.backfill_from_workbook(workbook_path, ['ESTER']) == {}
+    assert store.rows('PPI')[1]['日期'] == '2025年08月份'
+
+
+def test_workbook_is_rendered_from_the_store(run_update, workbook_path):
+    from openpyxl import load_workbook
+
+    run_update({'ESTER': [{'日期': '2024-01-12', 'value': 12.0}]})
+    store = series_store.get_store()
+    # 首次写入前从工作簿回填历史，数据库与工作簿一致
+    assert store.count('ESTER') == 11
+    ws = load_workbook(workbook_path)['ESTER']
+    assert ws.cell(row=12, column=1).value == START + timedelta(days=11)
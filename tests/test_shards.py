@@ -0,0 +1,80 @@
+import os
+from datetime import datetime, timedelta
+
+from openpyxl import load_workbook
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+import config
+import shards
+from conftest import daily_rows, make_workbook
+
+
+def style_sheet(path):
+    wb = load_workbook(path)
+    ws = wb['ESTER']
+    ws['A1'].font = Font(bold=True, color='FF0000')
+    ws['A1'].fill = PatternFill('solid', fgColor='FFFF00')
+    ws['B2'].border = Border(bottom=Side(style='thin'))
+    ws['B2'].alignment = Alignment(horizontal='center')
+    ws['B2'].number_format = '0.00%'
+    ws.row_dimensions[1].height = 30
+    ws.column_dimensions['A'].width = 18
+    ws.freeze_panes = 'A2'
+    ws.merge_cells('D1:E1')
+    ws.conditional_formatting.add('B2:B20', CellIsRule(operator='greaterThan', formula=['5'], font=Font(italic=True)))
+    wb.save(path)
+
+
+def assert_styles(ws):
+    assert ws['A1'].font.bold and ws['A1'].font.color.rgb == '00FF0000'
+    assert ws['A1'].fill.fgColor.rgb == '00FFFF00'
+    assert ws['B2'].border.bottom.style == 'thin'
+    assert ws['B2'].alignment.horizontal == 'center'
+    assert ws['B2'].number_format == '0.00%'
+    assert ws.row_dimensions[1].height == 30
+    assert ws.column_dimensions['A'].width == 18
+    assert ws.freeze_panes == 'A2'
+    assert [str(merged) for merged in ws.merged_cells.ranges] == ['D1:E1']
+    rules = [(str(cf.sqref), rule.operator) for cf in ws.conditional_formatting for rule in cf.rules]
+    assert rules == [('B2:B20', 'greaterThan')]
+
+
+def test_split_and_assemble_round_trip_preserves_styles(workbook_path, monkeypatch):
+    monkeypatch.setattr(shards, 'shard_sheet_names', lambda: ['ESTER'])
+    style_sheet(workbook_path)
+
+    assert shards.split_workbook(workbook_path, ['ESTER']) == ['ESTER']
+    assert_styles(load_workbook(shards.shard_path('ESTER'))['ESTER'])
+
+    shards.write_shard('ESTER', [{'日期': datetime(2024, 1, 11), 'value': 11.0}])
+    assert shards.assemble(workbook_path)
+    wb = load_workbook(workbook_path)
+    assert wb.sheetnames == ['ESTER', 'PPI']
+    assert wb['ESTER'].cell(row=12, column=2).value == 11.0
+    assert_styles(wb['ESTER'])
+
+
+def test_assemble_is_cached_on_shard_etags(workbook_path, monkeypatch):
+    monkeypatch.setattr(shards, 'shard_sheet_names', lambda: ['ESTER'])
+    shards.split_workbook(workbook_path, ['ESTER'])
+    assert shards.assemble(workbook_path)
+    assert not shards.assemble(workbook_path)
+
+    # 只改变文件标识（不改变内容）不会触发重新组装
+    os.utime(shards.shard_path('ESTER'), ns=(1, 1))
+    assert not shards.assemble(workbook_path)
+
+    shards.write_shard('ESTER', [{'日期': datetime(2024, 1, 1) + timedelta(days=10), 'value': 11.0}])
+    assert shards.assemble(workbook_path)
+    assert not shards.assemble(workbook_path)
+
+
+def test_write_shard_without_changes_leaves_file_untouched(workdir):
+    path = shards.shard_path('ESTER')
+    os.makedirs(config.SHARD_DIR)
+    make_workbook(path, {'ESTER': daily_rows(5)})
+    before = os.stat(path).st_mtime_ns
+    change_set = shards.write_shard('ESTER', [{'日期': datetime(2024, 1, 5), 'value': 5.0}])
+    assert not change_set
+    assert os.stat(path).st_mtime_ns == before
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from openpyxl import Workbook
+
+import config
+import ingest
+import sheet_writers
+
+
+def test_plan_is_compiled_once_per_sheet():
+    assert sheet_writers.compile_plan('ESTER') is sheet_writers.compile_plan('ESTER')
+
+
+def test_currency_pairs_use_the_shared_column_definition():
+    pair = next(name for name in config.CURRENCY_PAIRS if name != 'USD 10Y')
+    assert sheet_writers.compile_plan(pair).columns == tuple(config.COLUMN_DEFINITIONS['CURRENCY'])
+    assert sheet_writers.compile_plan('USD 10Y').columns == tuple(config.COLUMN_DEFINITIONS['USD 10Y'])
+    assert sheet_writers.resolve_columns('不存在的工作表') is None
+
+
+def test_write_row_sets_values_formats_and_interned_alignment():
+    ws = Workbook().active
+    plan = sheet_writers.compile_plan('SOFR')
+    record = {'日期': '2024-03-01', 'Rate Type': 'SOFR', 'RATE(%)': ingest.Percent(0.0531)}
+    plan.write_row(ws, 2, record)
+
+    assert ws['A2'].value == datetime(2024, 3, 1)
+    assert ws['A2'].number_format == sheet_writers.DATE_FORMAT_SOFR
+    assert ws['C2'].number_format == sheet_writers.PERCENT_FORMAT
+    assert ws['A2'].alignment.horizontal == 'left' and ws['B2'].alignment.horizontal == 'left'
+    assert ws['C2'].alignment.horizontal == 'right'
+    # 缺失的列写入空字符串，保持整行宽度
+    assert ws['D2'].value == ''
+
+
+def test_monthly_period_label_stays_text():
+    ws = Workbook().active
+    plan = sheet_writers.compile_plan('PPI')
+    last = plan.write_rows(ws, 5, [
+        {'日期': '2025年07月份', '当月': 1.0},
+        {'日期': '2025年08月份', '当月': 2.0},
+    ])
+    assert last == 6
+    assert ws['A6'].value == '2025年08月份' and ws['A6'].alignment.horizontal == 'left'
+    assert ws['B6'].value == 2.0 and ws['B6'].alignment.horizontal == 'right'
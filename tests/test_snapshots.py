@@ -0,0 +1,42 @@
+import os
+
+import config
+import snapshots
+import workbook_etag
+from conftest import daily_rows, make_workbook
+
+
+def save_with_snapshot(excel_path, rows):
+    tmp_path = excel_path + '.tmp.xlsx'
+    make_workbook(tmp_path, {'ESTER': rows})
+    snapshot = snapshots.store(tmp_path)
+    os.replace(tmp_path, excel_path)
+    snapshots.flip(snapshot, excel_path)
+    return snapshot
+
+
+def test_snapshot_is_an_independent_copy(workdir):
+    excel_path = config.EXCEL_OUTPUT_PATH
+    snapshot = save_with_snapshot(excel_path, daily_rows(3))
+    assert snapshot.sha == workbook_etag.compute_etag(excel_path)
+    assert os.stat(snapshot.path).st_ino != os.stat(excel_path).st_ino
+    assert snapshots.current(excel_path).sha == snapshot.sha
+
+    # 就地改写正式文件不影响快照；指针检测到正式文件变化后不再返回该快照
+    with open(excel_path, 'ab') as f:
+        f.write(b'\0')
+    assert workbook_etag.compute_etag(snapshot.path) == snapshot.sha
+    assert snapshots.current(excel_path) is None
+
+
+def test_collect_garbage_keeps_pointer_target(workdir):
+    excel_path = config.EXCEL_OUTPUT_PATH
+    made = [save_with_snapshot(excel_path, daily_rows(count)) for count in range(1, 5)]
+    for i, snapshot in enumerate(made):
+        os.utime(snapshot.path, ns=(i, i))
+    latest = made[-1]
+    os.utime(latest.path, ns=(0, 0))
+
+    assert snapshots.collect_garbage(retention=1) == 2
+    remaining = {name for name in os.listdir(config.SNAPSHOT_DIR) if name.endswith('.xlsx')}
+    assert remaining == {os.path.basename(made[-2].path), os.path.basename(latest.path)}
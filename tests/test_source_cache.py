@@ -0,0 +1,69 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import config
+import source_cache
+
+NOW = datetime(2025, 9, 5, 12, 0)
+
+
+@pytest.mark.parametrize('release_day, now, expected', [
+    (9, datetime(2025, 9, 5, 12), datetime(2025, 9, 9)),
+    (9, datetime(2025, 9, 9, 0, 0), datetime(2025, 10, 9)),
+    (9, datetime(2025, 12, 20), datetime(2026, 1, 9)),
+    (31, datetime(2025, 2, 10), datetime(2025, 2, 28)),
+    (1, datetime(2025, 9, 1, 8), datetime(2025, 10, 1)),
+])
+def test_next_release(release_day, now, expected):
+    assert source_cache.next_release(release_day, now) == expected
+
+
+def test_ttl_follows_source_cadence():
+    pair = next(iter(config.CURRENCY_PAIRS))
+    ttl = config.SOURCE_CACHE_TTL
+    assert source_cache.cadence(pair) == 'currency'
+    assert source_cache.ttl_seconds(pair, []) == ttl['currency']
+    assert source_cache.ttl_seconds('ESTER', []) == ttl['ESTER']
+    assert source_cache.ttl_seconds('Shibor', []) == ttl['Shibor']
+
+
+def test_monthly_ttl_runs_until_next_release_day():
+    data = [{'日期': '2025年08月份', '当月': -2.9}]
+    assert source_cache.cadence('PPI') == 'monthly'
+    assert source_cache.ttl_seconds('PPI', data, now=NOW) == (datetime(2025, 9, 9) - NOW).total_seconds()
+    # 最新一期与上次相同（发布延迟）：短时间后重试
+    period = source_cache.latest_period('PPI', data)
+    assert source_cache.ttl_seconds('PPI', data, previous_period=period, now=NOW) == config.SOURCE_CACHE_TTL['monthly_retry']
+
+
+def test_monthly_without_release_day_uses_daily_ttl(monkeypatch):
+    monkeypatch.setattr(config, 'SOURCE_RELEASE_DAYS', {})
+    assert source_cache.ttl_seconds('PPI', []) == config.SOURCE_CACHE_TTL['daily']
+
+
+def test_cache_round_trip_and_expiry(workdir):
+    cache = source_cache.SourceCache(config.SOURCE_CACHE_PATH)
+    data = [{'日期': datetime(2025, 9, 4), 'value': 1.92}]
+    ttl = cache.put('ESTER', data)
+    assert ttl == config.SOURCE_CACHE_TTL['ESTER']
+    assert cache.get('ESTER') == data
+    assert cache.get('ESTER', now=time.time() + ttl + 1) is None
+    assert 0 < cache.status()['ESTER'] <= ttl
+
+    cache.invalidate('ESTER')
+    assert cache.get('ESTER') is None
+
+
+def test_monthly_put_retries_soon_when_period_is_unchanged(workdir):
+    cache = source_cache.SourceCache(config.SOURCE_CACHE_PATH)
+    data = [{'日期': '2025年08月份', '当月': -2.9}]
+    cache.put('PPI', data)
+    assert cache.put('PPI', data) == config.SOURCE_CACHE_TTL['monthly_retry']
+
+
+def test_describe_ttl():
+    assert source_cache.describe_ttl(90061) == '1天1小时'
+    assert source_cache.describe_ttl(3 * 3600 + 120) == '3小时2分钟'
+    assert source_cache.describe_ttl(600) == '10分钟'
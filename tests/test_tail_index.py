@@ -0,0 +1,50 @@
+import os
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+import tail_index
+
+
+def test_parse_sheet_date_formats():
+    assert tail_index.parse_sheet_date('2025/3/7', 'ESTER') == datetime(2025, 3, 7)
+    assert tail_index.parse_sheet_date('2025-03-07', 'Shibor') == datetime(2025, 3, 7)
+    assert tail_index.parse_sheet_date('3/7/2025', 'SOFR') == datetime(2025, 3, 7)
+    assert tail_index.parse_sheet_date('2025年08月份', 'PPI') == datetime(2025, 8, 1)
+    assert tail_index.parse_sheet_date('n/a', 'ESTER') is None
+
+
+def test_row_fingerprint_ignores_representation():
+    assert tail_index.row_fingerprint(['d', '7.1234', '-0.12%']) == tail_index.row_fingerprint(['d', 7.1234, -0.0012])
+    assert tail_index.row_fingerprint(['d', 1, None, None]) == tail_index.row_fingerprint(['d', 1])
+
+
+def test_rebuild_records_last_row_and_window(workbook_path):
+    entry = tail_index.TailIndex(workbook_path).refresh()['ESTER']
+    assert entry['last_row'] == 11
+    assert entry['last_date'] == '2024-01-10'
+    assert [key for key, _, _ in entry['window']][-1] == '2024-01-10'
+
+
+def test_index_is_stale_after_file_changes(workbook_path):
+    index = tail_index.TailIndex(workbook_path)
+    index.refresh()
+    assert index.get('ESTER') is not None
+
+    wb = load_workbook(workbook_path)
+    wb['ESTER'].append([datetime(2024, 1, 11), 99.0])
+    wb.save(workbook_path)
+    os.utime(workbook_path, ns=(0, 0))
+    assert index.get('ESTER') is None
+    assert tail_index.TailIndex(workbook_path).refresh()['ESTER']['last_row'] == 12
+
+
+def test_locate_last_row_falls_back_when_index_disagrees(workbook_path):
+    wb = load_workbook(workbook_path)
+    ws = wb['ESTER']
+    index = tail_index.TailIndex(workbook_path)
+    index.refresh()
+    assert tail_index.locate_last_row(ws, index) == 11
+    ws.cell(row=11, column=2, value=99.0)
+    ws.append([datetime(2024, 1, 11), 100.0])
+    assert tail_index.locate_last_row(ws, index) == 12
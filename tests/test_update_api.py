@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+import app
+import checkpoints
+import lane_queue
+
+
+@pytest.fixture
+def api(client, monkeypatch):
+    """不执行任务的 /api/update：任务只进入测试自己的队列，不会被 worker 取出"""
+    monkeypatch.setattr(app, 'jobs', {})
+    monkeypatch.setattr(app, 'job_tokens', {})
+    monkeypatch.setattr(app, 'job_queue', lane_queue.LaneQueue(app.config.JOB_LANES, app.config.JOB_AGING_SECONDS))
+    monkeypatch.setattr(app.config, 'UPDATE_COALESCE', True)
+    return client
+
+
+def update(client, query=''):
+    response = client.get(f'/api/update{query}')
+    return response.status_code, response.get_json()
+
+
+def test_duplicate_requests_join_the_queued_job(api):
+    _, first = update(api, '?sources=ESTER,SOFR')
+    _, second = update(api, '?sources=SOFR')
+    assert first['status'] == 'queued' and not first.get('coalesced')
+    assert second['coalesced'] and second['job_id'] == first['job_id']
+    assert app.jobs[first['job_id']]['coalesced'] == 1
+
+    # 范围更大的请求不能合并到只覆盖部分数据源的任务
+    _, wider = update(api, '?sources=ESTER,SOFR,PPI')
+    assert wider['job_id'] != first['job_id']
+    assert len(app.job_queue.order()) == 2
+
+
+def test_force_and_disabled_coalescing_create_new_jobs(api, monkeypatch):
+    _, first = update(api, '?sources=ESTER')
+    _, forced = update(api, '?sources=ESTER&force=1')
+    assert forced['job_id'] != first['job_id'] and app.jobs[forced['job_id']]['force']
+
+    monkeypatch.setattr(app.config, 'UPDATE_COALESCE', False)
+    _, separate = update(api, '?sources=ESTER')
+    assert separate['job_id'] not in (first['job_id'], forced['job_id'])
+
+
+def test_recently_completed_job_is_returned(api, monkeypatch):
+    _, first = update(api, '?sources=ESTER')
+    job = app.jobs[first['job_id']]
+    app.job_queue.remove(job['id'])
+    journal = checkpoints.get_journal()
+    journal.begin(job['id'], ['ESTER'])
+    journal.record_success(job['id'], 'ESTER', [{'日期': '2024-01-01', 'value': 1.0}])
+    job.update(status='completed', finished_at=time.time(), updated=True)
+
+    _, again = update(api, '?sources=ESTER')
+    assert again['status'] == 'completed' and again['coalesced'] and again['updated']
+    assert again['job_id'] == first['job_id']
+
+    # 超出新鲜度窗口后重新爬取
+    job['finished_at'] = time.time() - app.config.UPDATE_FRESHNESS_SECONDS - 1
+    _, fresh = update(api, '?sources=ESTER')
+    assert fresh['status'] == 'queued' and fresh['job_id'] != first['job_id']
+
+
+def test_completed_job_with_failed_sources_is_not_reused(api):
+    _, first = update(api, '?sources=ESTER,SOFR')
+    job = app.jobs[first['job_id']]
+    app.job_queue.remove(job['id'])
+    journal = checkpoints.get_journal()
+    journal.begin(job['id'], ['ESTER', 'SOFR'])
+    journal.record_success(job['id'], 'ESTER', [{'日期': '2024-01-01', 'value': 1.0}])
+    journal.record_failure(job['id'], 'SOFR', '页面超时')
+    job.update(status='completed', finished_at=time.time(), updated=True)
+
+    # 只请求已成功的数据源时可以复用；包含失败的数据源时重新爬取
+    _, ester = update(api, '?sources=ESTER')
+    assert ester['coalesced'] and ester['job_id'] == first['job_id']
+    _, sofr = update(api, '?sources=SOFR')
+    assert sofr['status'] == 'queued' and sofr['job_id'] != first['job_id']
+
+    # 检查点已被清理的任务同样不复用
+    _, other = update(api, '?sources=PPI')
+    app.job_queue.remove(other['job_id'])
+    app.jobs[other['job_id']].update(status='completed', finished_at=time.time())
+    _, again = update(api, '?sources=PPI')
+    assert again['job_id'] != other['job_id']
+
+
+def test_partial_update_records_selected_sources(api):
+    status, body = update(api, '?sources=monthly,ester&lane=backfill')
+    assert status == 200
+    assert body['sources'][0] == 'ESTER' and 'PPI' in body['sources'] and 'SOFR' not in body['sources']
+    assert app.jobs[body['job_id']]['lane'] == 'backfill'
+
+
+@pytest.mark.parametrize('query', ['?sources=nope', '?lane=nope'])
+def test_invalid_sources_or_lane_return_400(api, query):
+    status, body = update(api, query)
+    assert status == 400 and body['status'] == 'error'
+    assert app.jobs == {}
@@ -0,0 +1,70 @@
+from openpyxl import load_workbook
+
+import market_data_crawler
+from conftest import daily_rows, make_workbook
+from workbook_cache import WorkbookCache, _Entry, file_identity
+
+
+def test_checkout_is_exclusive(workbook_path):
+    cache = WorkbookCache(256 * 1024 * 1024)
+    first = cache.checkout(workbook_path)
+    cache.refresh(workbook_path, first)
+
+    a = cache.checkout(workbook_path)
+    b = cache.checkout(workbook_path)
+    assert a is first
+    # 已借出的工作簿不会再交给第二个任务
+    assert b is not a
+
+
+def test_unreturned_workbook_is_not_reused(workbook_path):
+    cache = WorkbookCache(256 * 1024 * 1024)
+    wb = cache.checkout(workbook_path)
+    cache.refresh(workbook_path, wb)
+    wb = cache.checkout(workbook_path)
+    wb['ESTER']['B2'] = 'unsaved'
+    # 任务失败：不放回，下一个任务从磁盘加载
+    assert cache.checkout(workbook_path)['ESTER']['B2'].value != 'unsaved'
+
+
+def test_external_change_invalidates(workbook_path):
+    cache = WorkbookCache(256 * 1024 * 1024)
+    wb = cache.checkout(workbook_path)
+    cache.refresh(workbook_path, wb)
+    wb.save(workbook_path)
+    assert cache.get(workbook_path) is None
+
+
+def test_budget_evicts_least_recently_used(tmp_path):
+    paths = [make_workbook(str(tmp_path / f'{name}.xlsx'), {'ESTER': daily_rows(20)}) for name in 'abc']
+    one = _Entry(file_identity(paths[0]), load_workbook(paths[0])).size
+    cache = WorkbookCache(one * 2)
+    for path in paths[:2]:
+        cache.refresh(path, load_workbook(path))
+    # 访问 a 后 b 成为最久未使用的条目
+    assert cache.get(paths[0]) is not None
+    cache.refresh(paths[2], load_workbook(paths[2]))
+    assert cache.get(paths[1]) is None
+    assert cache.get(paths[0]) is not None and cache.get(paths[2]) is not None
+    assert cache.used_bytes <= cache.budget_bytes
+
+
+def test_workbook_over_budget_is_not_cached(workbook_path):
+    cache = WorkbookCache(1)
+    cache.refresh(workbook_path, load_workbook(workbook_path))
+    assert cache.get(workbook_path) is None and cache.used_bytes == 0
+
+
+def test_consecutive_jobs_reuse_the_saved_workbook(run_update, workbook_path, monkeypatch):
+    import workbook_cache
+
+    monkeypatch.setattr(workbook_cache, 'shared_cache', WorkbookCache(256 * 1024 * 1024))
+    monkeypatch.setattr(market_data_crawler, 'workbook_cache', workbook_cache.shared_cache)
+    run_update({'ESTER': [{'日期': '2024-01-11', 'value': 11.0}]})
+    assert workbook_cache.shared_cache.get(workbook_path) is not None
+
+    loads = []
+    monkeypatch.setattr(workbook_cache, 'load_workbook', lambda *args, **kwargs: loads.append(args))
+    run_update({'ESTER': [{'日期': '2024-01-12', 'value': 12.0}]})
+    assert loads == []
+    assert load_workbook(workbook_path)['ESTER'].max_row == 13
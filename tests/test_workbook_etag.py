@@ -0,0 +1,60 @@
+import os
+
+import config
+import workbook_etag
+
+
+def test_etag_is_cached_in_sidecar(workbook_path, monkeypatch):
+    etag = workbook_etag.record_etag(workbook_path)
+    assert etag == workbook_etag.compute_etag(workbook_path)
+    assert os.path.exists(workbook_etag.etag_path_for(workbook_path))
+
+    monkeypatch.setattr(workbook_etag, 'compute_etag', lambda path: 'recomputed')
+    assert workbook_etag.get_etag(workbook_path) == etag
+    # 文件被外部修改（签名不一致）时重新计算
+    with open(workbook_path, 'ab') as f:
+        f.write(b'\0')
+    assert workbook_etag.get_etag(workbook_path) == 'recomputed'
+
+
+def test_download_sends_strong_etag(client, workbook_path):
+    response = client.get('/api/download')
+    assert response.status_code == 200
+    assert response.get_etag() == (workbook_etag.compute_etag(workbook_path), False)
+    assert response.headers['Cache-Control'] == 'no-cache'
+    with open(workbook_path, 'rb') as f:
+        assert response.data == f.read()
+
+
+def test_download_if_none_match_returns_304(client, workbook_path):
+    etag = workbook_etag.get_etag(workbook_path)
+    response = client.get('/api/download', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304 and response.data == b''
+
+
+def test_download_range_returns_partial_content(client, workbook_path):
+    size = os.path.getsize(workbook_path)
+    response = client.get('/api/download', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 10-19/{size}'
+    with open(workbook_path, 'rb') as f:
+        assert response.data == f.read()[10:20]
+
+    etag = workbook_etag.get_etag(workbook_path)
+    stale = client.get('/api/download', headers={'Range': 'bytes=10-19', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and len(stale.data) == size
+    fresh = client.get('/api/download', headers={'Range': 'bytes=10-19', 'If-Range': f'"{etag}"'})
+    assert fresh.status_code == 206
+
+
+def test_download_accel_redirect(client, workbook_path, monkeypatch):
+    monkeypatch.setattr(config, 'DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected/')
+    response = client.get('/api/download')
+    assert response.status_code == 200 and response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/protected/Market%20Index.xlsx'
+    etag = response.get_etag()[0]
+    assert client.get('/api/download', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+
+def test_download_missing_file(client, workdir):
+    assert client.get('/api/download').status_code == 404